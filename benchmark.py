@@ -0,0 +1,770 @@
+"""Benchmark dan uji beban offline untuk bot.py.
+
+Semua backend (Google Sheets, SerpApi, Gemini, Telegram) diganti dengan tiruan lokal
+yang latensinya bisa diatur, sehingga benchmark berjalan tanpa jaringan.
+
+Contoh:
+    python benchmark.py --rows 300 --concurrency 20 --iterations 200 --output hasil.json
+    python benchmark.py --scenarios view_desas,view_details --serp-latency 0.4
+    python benchmark.py --output baru.json --compare hasil.json
+    python benchmark.py --webhook --rate 30 --iterations 300   # mode webhook, Bot API tiruan
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import platform
+import random
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import types
+import urllib.parse
+from collections import Counter, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SCENARIOS = [
+    "start",
+    "view_areas",
+    "view_desas",
+    "view_villas",
+    "view_details",
+    "confirm_save",
+    "save_additional_data",
+    "handle_ai_query",
+    "scan_it_reviews",
+    "scan_it_reviews_indexed",
+]
+
+HEADERS = ["Nama", "Jenis", "Lokasi", "Kecamatan", "Desa", "Tahun Terbangun", "Jumlah Kamar", "Contact Person", "Ulasan Review IT"]
+DESAS = ["Sidemen", "Tabola", "Telaga Tawang", "Sangkan Gunung", "Bunutan", "Purwakerti", "Culik", "Tista", "Datah", "Abang"]
+IT_SNIPPETS = [
+    "WiFi sangat kencang dan stabil, cocok untuk video call.",
+    "Internet agak lambat di kamar atas, sinyal 4G lumayan.",
+    "Fast fibre connection, great for remote work.",
+    "Koneksi sering putus saat hujan.",
+    "Kamar bersih dan pemandangan indah.",
+]
+
+# Penghitung panggilan ke backend tiruan, dibaca per skenario
+backend_calls = Counter()
+_calls_lock = threading.Lock()
+
+def _count(name: str) -> None:
+    with _calls_lock:
+        backend_calls[name] += 1
+
+def _sleep(mean: float) -> None:
+    if mean > 0:
+        time.sleep(random.uniform(0.5, 1.5) * mean)
+
+async def _async_sleep(mean: float) -> None:
+    if mean > 0:
+        await asyncio.sleep(random.uniform(0.5, 1.5) * mean)
+
+# ----------------------------------------------------------------------
+# Tiruan Google Sheets
+# ----------------------------------------------------------------------
+class FakeWorksheet:
+    def __init__(self, title: str, rows: int, latency: float):
+        self.title = title
+        self.latency = latency
+        self._lock = threading.Lock()
+        area = title.split(' ').pop()
+        self.values = [list(HEADERS)]
+        for i in range(rows):
+            desa = DESAS[i % len(DESAS)]
+            filled = i % 3 == 0
+            self.values.append([
+                f"Villa {area} {i}",
+                "Villa" if filled else "",
+                f"Jl. Raya {desa} No. {i}" if filled else "",
+                area if filled else "",
+                desa,
+                "2015" if filled else "",
+                "8" if filled else "",
+                "",
+                "",
+            ])
+
+    def get_all_values(self):
+        _count("sheets.get_all_values")
+        _sleep(self.latency)
+        with self._lock:
+            return [list(row) for row in self.values]
+
+    def get_all_records(self):
+        _count("sheets.get_all_records")
+        _sleep(self.latency)
+        with self._lock:
+            return [dict(zip(self.values[0], row)) for row in self.values[1:]]
+
+    def row_values(self, row: int):
+        _count("sheets.row_values")
+        _sleep(self.latency / 3)
+        with self._lock:
+            return list(self.values[row - 1]) if row <= len(self.values) else []
+
+    def _set(self, row: int, col: int, value) -> None:
+        while len(self.values) < row:
+            self.values.append([""] * len(self.values[0]))
+        cells = self.values[row - 1]
+        while len(cells) < col:
+            cells.append("")
+        cells[col - 1] = value
+
+    def update_cell(self, row: int, col: int, value):
+        _count("sheets.update_cell")
+        _sleep(self.latency)
+        with self._lock:
+            self._set(row, col, value)
+
+    def batch_update(self, data, **kwargs):
+        from gspread.utils import a1_to_rowcol
+        _count("sheets.batch_update")
+        _sleep(self.latency)
+        with self._lock:
+            for item in data:
+                row, col = a1_to_rowcol(item["range"].split(":")[0])
+                for i, values in enumerate(item["values"]):
+                    for j, value in enumerate(values):
+                        self._set(row + i, col + j, value)
+
+
+class FakeSpreadsheet:
+    def __init__(self, sheet_names: list, rows: int, latency: float):
+        self.latency = latency
+        self.sheets = {name: FakeWorksheet(name, rows, latency) for name in sheet_names}
+
+    def worksheet(self, name: str):
+        _count("sheets.worksheet")
+        _sleep(self.latency / 2)
+        return self.sheets[name]
+
+# ----------------------------------------------------------------------
+# Tiruan SerpApi
+# ----------------------------------------------------------------------
+def make_fake_google_search(latency: float):
+    class FakeGoogleSearch:
+        def __init__(self, params: dict):
+            self.params = params
+
+        def get_dict(self):
+            engine = self.params.get("engine", "google")
+            query = self.params.get("q", "")
+            _count(f"serpapi.{engine}")
+            _sleep(latency)
+            seed = int(hashlib.md5(query.encode("utf-8")).hexdigest(), 16)
+            if engine == "google_maps":
+                return {"local_results": [{
+                    "title": query.split(" Bali")[0],
+                    "address": f"Jl. Raya No. {seed % 90}, Kecamatan Sidemen, Karangasem, Bali",
+                    "phone": f"+62 812-{seed % 10000:04d}-{seed % 7919:04d}",
+                    "rating": 4.5,
+                    "reviews": seed % 300,
+                }]}
+            snippets = [IT_SNIPPETS[(seed + i) % len(IT_SNIPPETS)] for i in range(3)]
+            snippets.append(f"Properti dibangun tahun {2000 + seed % 24} dengan {5 + seed % 20} kamar.")
+            return {"organic_results": [{"snippet": snippet} for snippet in snippets]}
+
+    return FakeGoogleSearch
+
+# ----------------------------------------------------------------------
+# Tiruan Gemini
+# ----------------------------------------------------------------------
+class FakeResponse:
+    def __init__(self, parts: list):
+        self.parts = parts
+        self.text = "".join(part.text for part in parts if not part.function_call)
+
+
+class FakeStreamResponse(FakeResponse):
+    """Respons stream=True: teks dikirim per kata, sisa latensi dibagi rata antar chunk."""
+
+    def __init__(self, parts: list, latency: float):
+        super().__init__(parts)
+        self.latency = latency
+
+    async def __aiter__(self):
+        if not self.text:
+            yield FakeResponse(self.parts)
+            return
+        words = self.text.split(" ")
+        for i, word in enumerate(words):
+            await _async_sleep(self.latency / len(words))
+            yield FakeResponse([types.SimpleNamespace(text=word + (" " if i < len(words) - 1 else ""), function_call=None)])
+
+
+def make_fake_generative_model(latency: float, tool_rounds: int):
+    import google.generativeai as genai
+
+    class FakeChat:
+        def __init__(self, with_tools: bool):
+            self.rounds = tool_rounds if with_tools else 0
+
+        async def send_message_async(self, content, stream=False, **kwargs):
+            _count("gemini.send_message_async")
+            # Dengan streaming, chunk pertama tiba setelah seperempat latensi
+            await _async_sleep(latency / 4 if stream else latency)
+            if self.rounds > 0 and not kwargs.get("tool_config"):
+                self.rounds -= 1
+                parts = [
+                    genai.protos.Part(function_call=genai.protos.FunctionCall(name=name, args={"query": "Villa Sidemen 1"}))
+                    for name in ("search_agoda", "search_bookingcom")
+                ]
+            else:
+                parts = [genai.protos.Part(text="Villa Sidemen 1 memiliki WiFi stabil dan kontak +62 812-0000-0000.")]
+            return FakeStreamResponse(parts, latency * 3 / 4) if stream else FakeResponse(parts)
+
+        def rewind(self):
+            pass
+
+    class FakeGenerativeModel:
+        def __init__(self, model_name=None, tools=None, **kwargs):
+            self.tools = tools
+
+        def start_chat(self, **kwargs):
+            return FakeChat(bool(self.tools))
+
+        def generate_content(self, prompt, **kwargs):
+            _count("gemini.generate_content")
+            _sleep(latency)
+            return types.SimpleNamespace(text="Ringkasan: " + prompt[-120:])
+
+    return FakeGenerativeModel
+
+# ----------------------------------------------------------------------
+# Tiruan Telegram
+# ----------------------------------------------------------------------
+class FakeMessage:
+    _next_id = 1
+
+    def __init__(self, latency: float, chat_id: int, text: str = ""):
+        self.latency = latency
+        self.chat_id = chat_id
+        self.text = text
+        self.message_id = FakeMessage._next_id
+        FakeMessage._next_id += 1
+        self.reply_markup = None
+
+    async def reply_text(self, text, reply_markup=None, **kwargs):
+        _count("telegram.send_message")
+        await _async_sleep(self.latency)
+        message = FakeMessage(self.latency, self.chat_id, text)
+        message.reply_markup = reply_markup
+        return message
+
+    async def edit_text(self, text, reply_markup=None, **kwargs):
+        _count("telegram.edit_message_text")
+        await _async_sleep(self.latency)
+        self.text, self.reply_markup = text, reply_markup
+        return self
+
+
+class FakeCallbackQuery:
+    def __init__(self, data: str, message: FakeMessage):
+        self.data = data
+        self.message = message
+
+    async def answer(self, *args, **kwargs):
+        _count("telegram.answer_callback_query")
+        await _async_sleep(self.message.latency)
+
+    async def edit_message_text(self, text, reply_markup=None, **kwargs):
+        return await self.message.edit_text(text, reply_markup=reply_markup, **kwargs)
+
+
+class FakeBot:
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    async def send_chat_action(self, chat_id, action, **kwargs):
+        _count("telegram.send_chat_action")
+        await _async_sleep(self.latency)
+
+    async def send_message(self, chat_id, text, **kwargs):
+        _count("telegram.send_message")
+        await _async_sleep(self.latency)
+        return FakeMessage(self.latency, chat_id, text)
+
+
+class FakeApplication:
+    """Pengganti Application.create_task yang melacak tugas background."""
+
+    def __init__(self):
+        self.tasks = []
+
+    def create_task(self, coroutine, update=None, name=None):
+        task = asyncio.get_running_loop().create_task(coroutine)
+        self.tasks.append(task)
+        return task
+
+
+class FakeUser:
+    """Satu pengguna simulasi dengan chat, user_data dan context sendiri."""
+
+    def __init__(self, user_id: int, telegram_latency: float):
+        self.user_id = user_id
+        self.latency = telegram_latency
+        self.application = FakeApplication()
+        self.context = types.SimpleNamespace(
+            bot=FakeBot(telegram_latency), user_data={}, chat_data={}, application=self.application,
+        )
+
+    def _update(self, message=None, callback_query=None):
+        return types.SimpleNamespace(
+            update_id=random.getrandbits(31),
+            message=message,
+            callback_query=callback_query,
+            effective_chat=types.SimpleNamespace(id=self.user_id),
+            effective_user=types.SimpleNamespace(id=self.user_id),
+            effective_message=message or (callback_query.message if callback_query else None),
+        )
+
+    def text_update(self, text: str):
+        return self._update(message=FakeMessage(self.latency, self.user_id, text))
+
+    def callback_update(self, data: str):
+        return self._update(callback_query=FakeCallbackQuery(data, FakeMessage(self.latency, self.user_id)))
+
+    async def drain_background(self) -> None:
+        while self.application.tasks:
+            await self.application.tasks.pop()
+
+class FakeTelegramServer:
+    """Bot API tiruan lewat HTTP untuk menguji mode webhook end-to-end secara lokal."""
+
+    def __init__(self, latency: float, on_reply=None):
+        self.latency = latency
+        self.on_reply = on_reply
+        self._message_id = 1_000_000  # jauh dari message_id update masuk (= update_id)
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length).decode("utf-8")
+                body = server._handle(self.path.rsplit("/", 1)[-1], server._parse(raw, self.headers.get("Content-Type", "")))
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.port = self.httpd.server_address[1]
+
+    @staticmethod
+    def _parse(raw: str, content_type: str) -> dict:
+        if "json" in content_type:
+            return json.loads(raw or "{}")
+        params = {}
+        for key, values in urllib.parse.parse_qs(raw).items():
+            try:
+                params[key] = json.loads(values[0])
+            except ValueError:
+                params[key] = values[0]
+        return params
+
+    def _message(self, chat_id, text) -> dict:
+        with self._lock:
+            self._message_id += 1
+            message_id = self._message_id
+        return {"message_id": message_id, "date": int(time.time()), "chat": {"id": int(chat_id), "type": "private"}, "text": text}
+
+    def _handle(self, method: str, params: dict) -> dict:
+        _count(f"telegram.{method}")
+        _sleep(self.latency)
+        if method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "Benchmark", "username": "benchmark_bot"}
+        elif method in ("sendMessage", "editMessageText"):
+            result = self._message(params.get("chat_id", 0), params.get("text", ""))
+            if self.on_reply:
+                message_id = params.get("message_id") if method == "editMessageText" else result["message_id"]
+                self.on_reply(int(params.get("chat_id", 0)), int(message_id or 0))
+        elif method == "getUpdates":
+            time.sleep(1)
+            result = []
+        else:
+            result = True
+        return {"ok": True, "result": result}
+
+    def start(self) -> None:
+        threading.Thread(target=self.httpd.serve_forever, name="fake-telegram", daemon=True).start()
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+
+# ----------------------------------------------------------------------
+# Skenario
+# ----------------------------------------------------------------------
+def desa_id(desa: str) -> int:
+    # ID desa di callback: pohon navigasi pertama memberi ID 1..n sesuai urutan abjad
+    return sorted(DESAS).index(desa) + 1
+
+
+def _find_button(markup, prefix: str):
+    if markup is None:
+        return None
+    for row in markup.inline_keyboard:
+        for button in row:
+            if (button.callback_data or "").startswith(prefix):
+                return button.callback_data
+    return None
+
+
+class Scenarios:
+    """Setiap skenario: setup (tidak diukur) lalu satu operasi yang diukur."""
+
+    def __init__(self, bot, args):
+        self.bot = bot
+        self.args = args
+        self.questions = [
+            "Apa nomor kontak Villa Sidemen 1?",
+            "Berapa jumlah kamar Villa Amed 12?",
+            "Bandingkan review Agoda dan Booking.com untuk Villa Abang 3",
+            "Villa mana di Tabola yang punya wifi bagus?",
+        ]
+
+    def _sheet_index(self, user: FakeUser) -> int:
+        return user.user_id % len(self.bot.SHEET_NAMES)
+
+    def _desa_callback(self, user: FakeUser) -> str:
+        sheet_index = self._sheet_index(user)
+        return f"view_villas;{sheet_index};{desa_id(DESAS[user.user_id % len(DESAS)])}"
+
+    def _details_callback(self, user: FakeUser) -> str:
+        sheet_index = self._sheet_index(user)
+        # ID baris stabil: sinkronisasi pertama memberi ID 1..n sesuai urutan baris
+        return f"view_details;{sheet_index};{random.randrange(self.args.rows) + 1}"
+
+    async def start(self, user: FakeUser):
+        update = user.text_update("/start")
+        return lambda: self.bot.start(update, user.context)
+
+    async def view_areas(self, user: FakeUser):
+        update = user.callback_update("view_areas")
+        return lambda: self.bot.button_handler(update, user.context)
+
+    async def view_desas(self, user: FakeUser):
+        update = user.callback_update(f"view_desas;{self._sheet_index(user)}")
+        return lambda: self.bot.button_handler(update, user.context)
+
+    async def view_villas(self, user: FakeUser):
+        update = user.callback_update(self._desa_callback(user))
+        return lambda: self.bot.button_handler(update, user.context)
+
+    async def view_details(self, user: FakeUser):
+        update = user.callback_update(self._details_callback(user))
+        return lambda: self.bot.button_handler(update, user.context)
+
+    async def confirm_save(self, user: FakeUser):
+        # Setup: buka detail sampai ada usulan, lalu ukur hanya penekanan tombol Simpan
+        for _ in range(20):
+            details = user.callback_update(self._details_callback(user))
+            await self.bot.button_handler(details, user.context)
+            callback = _find_button(details.callback_query.message.reply_markup, "confirm_save;")
+            if callback:
+                update = user.callback_update(callback)
+                return lambda: self.bot.button_handler(update, user.context)
+        raise RuntimeError("Tidak ada properti dengan usulan untuk disimpan")
+
+    async def save_additional_data(self, user: FakeUser):
+        sheet_name = self.bot.SHEET_NAMES[self._sheet_index(user)]
+        i = random.randrange(self.args.rows)
+        nama, desa = f"Villa {sheet_name.split(' ').pop()} {i}", DESAS[i % len(DESAS)]
+        updates = {"Contact Person": f"+62 812-{i:04d}", "Jumlah Kamar": str(5 + i % 20)}
+        return lambda: self.bot.run_blocking("sheets", self.bot.save_additional_data, sheet_name, nama, desa, updates)
+
+    async def handle_ai_query(self, user: FakeUser):
+        update = user.text_update(random.choice(self.questions))
+        return lambda: self.bot.handle_ai_query(update, user.context)
+
+    async def _scan(self, user: FakeUser):
+        update = user.text_update("review IT wifi cepat")
+
+        async def run():
+            await self.bot.handle_ai_query(update, user.context)
+            await user.drain_background()
+        return run
+
+    async def scan_it_reviews(self, user: FakeUser):
+        self.bot.it_review_index.last_full_run = 0.0
+        return await self._scan(user)
+
+    async def scan_it_reviews_indexed(self, user: FakeUser):
+        if not self.bot.it_review_index.ready():
+            await self.bot.refresh_it_review_index()
+        return await self._scan(user)
+
+# ----------------------------------------------------------------------
+# Runner
+# ----------------------------------------------------------------------
+def percentile(values: list, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100
+    lower = int(k)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (k - lower)
+
+
+def summarize(latencies: list, errors: int, wall: float, calls: Counter) -> dict:
+    ms = [value * 1000 for value in latencies]
+    return {
+        "count": len(ms),
+        "errors": errors,
+        "wall_s": round(wall, 4),
+        "throughput_per_s": round(len(ms) / wall, 3) if wall else 0.0,
+        "mean_ms": round(statistics.fmean(ms), 3) if ms else 0.0,
+        "p50_ms": round(percentile(ms, 50), 3),
+        "p90_ms": round(percentile(ms, 90), 3),
+        "p95_ms": round(percentile(ms, 95), 3),
+        "p99_ms": round(percentile(ms, 99), 3),
+        "max_ms": round(max(ms), 3) if ms else 0.0,
+        "backend_calls": dict(sorted(calls.items())),
+    }
+
+
+async def run_scenario(bot, scenarios: Scenarios, name: str, args) -> dict:
+    users = [FakeUser(1000 + i, args.telegram_latency) for i in range(args.concurrency)]
+    iterations = args.scan_iterations if name.startswith("scan_it_reviews") else args.iterations
+    queue = asyncio.Queue()
+    for i in range(iterations):
+        queue.put_nowait(i)
+    latencies, errors = [], 0
+    before = Counter(backend_calls)
+
+    async def worker(user: FakeUser):
+        nonlocal errors
+        while not queue.empty():
+            queue.get_nowait()
+            if args.cold_cache:
+                bot.invalidate_sheet_snapshot()
+            try:
+                operation = await getattr(scenarios, name)(user)
+                started = time.perf_counter()
+                await operation()
+                latencies.append(time.perf_counter() - started)
+            except Exception as e:
+                errors += 1
+                logging.getLogger("benchmark").warning(f"{name}: {e!r}")
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(user) for user in users))
+    wall = time.perf_counter() - started
+    return summarize(latencies, errors, wall, Counter(backend_calls) - before)
+
+
+def install_fakes(bot, args) -> None:
+    bot.backends["sheets"].provide(FakeSpreadsheet(bot.SHEET_NAMES, args.rows, args.sheets_latency))
+    bot.backends["serpapi"].provide(make_fake_google_search(args.serp_latency))
+    bot.backends["gemini"].provide(types.SimpleNamespace(GenerativeModel=make_fake_generative_model(args.gemini_latency, args.tool_rounds)))
+    bot.get_gemini_model.cache_clear()
+
+
+def load_bot(args, workdir: str):
+    # Cache persisten diarahkan ke direktori sementara agar setiap run mulai bersih
+    os.environ["SERP_CACHE_PATH"] = "" if args.no_serp_cache else os.path.join(workdir, "serpapi_cache.sqlite3")
+    os.environ["IT_REVIEW_INDEX_PATH"] = os.path.join(workdir, "it_review_index.sqlite3")
+    os.environ["IT_REVIEW_INDEX_INTERVAL"] = "0"
+    os.environ["SHEET_MIRROR_PATH"] = os.path.join(workdir, "sheet_mirror.sqlite3")
+    os.environ["PENDING_PROPOSAL_PATH"] = os.path.join(workdir, "pending_proposals.sqlite3")
+    # Backend tiruan tidak punya kuota; set SERPAPI_RATE/GEMINI_RATE untuk mengukur efek throttling
+    os.environ.setdefault("SERPAPI_RATE", "0")
+    os.environ.setdefault("GEMINI_RATE", "0")
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import bot
+    logging.getLogger().setLevel(logging.WARNING)
+    return bot
+
+
+def compare(current: dict, baseline_path: str) -> None:
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    print(f"\nPerbandingan dengan {baseline_path}:")
+    print(f"{'skenario':<26}{'p50 lama':>11}{'p50 baru':>11}{'p95 lama':>11}{'p95 baru':>11}{'Δp95':>9}{'thr lama':>10}{'thr baru':>10}")
+    for name, result in current["scenarios"].items():
+        old = baseline.get("scenarios", {}).get(name)
+        if not old:
+            continue
+        delta = (result["p95_ms"] - old["p95_ms"]) / old["p95_ms"] * 100 if old["p95_ms"] else 0.0
+        print(f"{name:<26}{old['p50_ms']:>11.1f}{result['p50_ms']:>11.1f}{old['p95_ms']:>11.1f}{result['p95_ms']:>11.1f}"
+              f"{delta:>8.0f}%{old['throughput_per_s']:>10.1f}{result['throughput_per_s']:>10.1f}")
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _webhook_update(update_id: int, chat_id: int, kind: str, rows: int, sheet_count: int) -> dict:
+    user = {"id": chat_id, "is_bot": False, "first_name": f"User{chat_id}"}
+    chat = {"id": chat_id, "type": "private"}
+    if kind == "handle_ai_query":
+        return {"update_id": update_id, "message": {
+            "message_id": update_id, "date": int(time.time()), "chat": chat, "from": user,
+            "text": f"Apa kontak Villa Sidemen {update_id % rows}?",
+        }}
+    sheet_index = chat_id % sheet_count
+    data = {
+        "view_desas": f"view_desas;{sheet_index}",
+        "view_villas": f"view_villas;{sheet_index};{desa_id(DESAS[chat_id % len(DESAS)])}",
+        "view_details": f"view_details;{sheet_index};{update_id % rows + 1}",
+    }[kind]
+    return {"update_id": update_id, "callback_query": {
+        "id": str(update_id), "from": user, "chat_instance": str(chat_id), "data": data,
+        "message": {"message_id": update_id, "date": int(time.time()), "chat": chat, "text": "menu"},
+    }}
+
+
+async def run_webhook_load(args) -> dict:
+    """Kirim aliran update ke bot mode webhook dan ukur waktu sampai balasan diterima Bot API tiruan."""
+    import httpx
+
+    random.seed(args.seed)
+    loop = asyncio.get_running_loop()
+    pending = {}  # chat_id -> deque[(waktu kirim, jenis)]
+    latencies = {}
+    done = asyncio.Event()
+    expected = args.iterations
+
+    replied = set()  # message_id yang sudah dihitung; edit lanjutan (streaming) diabaikan
+
+    def record(chat_id: int, message_id: int) -> None:
+        if message_id in replied:
+            return
+        replied.add(message_id)
+        queue = pending.get(chat_id)
+        if queue:
+            sent, kind = queue.popleft()
+            latencies.setdefault(kind, []).append(time.perf_counter() - sent)
+            if sum(len(v) for v in latencies.values()) >= expected:
+                done.set()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        bot = load_bot(args, workdir)
+        install_fakes(bot, args)
+        fake = FakeTelegramServer(args.telegram_latency, lambda chat_id, message_id: loop.call_soon_threadsafe(record, chat_id, message_id))
+        fake.start()
+        webhook_port = args.webhook_port or _free_port()
+        bot.TELEGRAM_BASE_URL = f"http://127.0.0.1:{fake.port}/bot"
+        application = bot.build_application(token="123456:BENCHMARK")
+        await application.initialize()
+        await application.start()
+        await application.updater.start_webhook(
+            listen="127.0.0.1", port=webhook_port, url_path="telegram",
+            webhook_url=f"http://127.0.0.1:{webhook_port}/telegram", secret_token="benchmark",
+        )
+        kinds = ["view_desas", "view_villas", "view_details", "handle_ai_query"]
+        weights = [3, 3, 2, 1]
+        chats = [1000 + i for i in range(args.concurrency)]
+        before = Counter(backend_calls)
+        started = time.perf_counter()
+        try:
+            async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{webhook_port}") as client:
+                for update_id in range(1, expected + 1):
+                    chat_id = random.choice(chats)
+                    kind = random.choices(kinds, weights)[0]
+                    pending.setdefault(chat_id, deque()).append((time.perf_counter(), kind))
+                    await client.post(
+                        "/telegram", json=_webhook_update(update_id, chat_id, kind, args.rows, len(bot.SHEET_NAMES)),
+                        headers={"X-Telegram-Bot-Api-Secret-Token": "benchmark"},
+                    )
+                    await asyncio.sleep(random.expovariate(args.rate))
+            await asyncio.wait_for(done.wait(), timeout=args.webhook_timeout)
+        except asyncio.TimeoutError:
+            logging.getLogger("benchmark").warning("Tidak semua update mendapat balasan sebelum batas waktu.")
+        wall = time.perf_counter() - started
+        await application.updater.stop()
+        await application.stop()
+        await application.shutdown()
+        fake.stop()
+
+    calls = Counter(backend_calls) - before
+    answered = sum(len(v) for v in latencies.values())
+    results = {"webhook_all": summarize([x for v in latencies.values() for x in v], expected - answered, wall, calls)}
+    for kind, values in sorted(latencies.items()):
+        results[f"webhook_{kind}"] = summarize(values, 0, wall, Counter())
+    for name, r in results.items():
+        print(f"{name:<26} n={r['count']:<5} err={r['errors']:<3} p50={r['p50_ms']:>9.1f}ms "
+              f"p95={r['p95_ms']:>9.1f}ms p99={r['p99_ms']:>9.1f}ms thr={r['throughput_per_s']:>8.2f}/s")
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark offline bot.py dengan backend tiruan.")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Daftar skenario dipisah koma.")
+    parser.add_argument("--rows", type=int, default=200, help="Jumlah baris per sheet.")
+    parser.add_argument("--concurrency", type=int, default=10, help="Jumlah pengguna simulasi yang aktif bersamaan.")
+    parser.add_argument("--iterations", type=int, default=100, help="Jumlah operasi per skenario.")
+    parser.add_argument("--scan-iterations", type=int, default=3, help="Jumlah operasi untuk skenario scan_it_reviews*.")
+    parser.add_argument("--sheets-latency", type=float, default=0.3, help="Rata-rata latensi Sheets (detik).")
+    parser.add_argument("--serp-latency", type=float, default=0.8, help="Rata-rata latensi SerpApi (detik).")
+    parser.add_argument("--gemini-latency", type=float, default=1.5, help="Rata-rata latensi Gemini (detik).")
+    parser.add_argument("--telegram-latency", type=float, default=0.05, help="Rata-rata latensi Telegram (detik).")
+    parser.add_argument("--tool-rounds", type=int, default=1, help="Jumlah giliran panggilan alat per pertanyaan AI.")
+    parser.add_argument("--no-serp-cache", action="store_true", help="Nonaktifkan cache SerpApi persisten.")
+    parser.add_argument("--cold-cache", action="store_true", help="Buang snapshot sheet sebelum setiap operasi.")
+    parser.add_argument("--webhook", action="store_true", help="Uji mode webhook end-to-end dengan Bot API tiruan.")
+    parser.add_argument("--webhook-port", type=int, default=0, help="Port webhook lokal (0 = pilih otomatis).")
+    parser.add_argument("--webhook-timeout", type=float, default=120, help="Batas waktu menunggu semua balasan (detik).")
+    parser.add_argument("--rate", type=float, default=20, help="Rata-rata update per detik dalam mode webhook.")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Tulis hasil JSON ke file ini.")
+    parser.add_argument("--compare", help="File JSON hasil sebelumnya untuk dibandingkan.")
+    return parser.parse_args(argv)
+
+
+async def run(args) -> dict:
+    meta = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "args": vars(args),
+    }
+    if args.webhook:
+        return {"meta": meta, "scenarios": await run_webhook_load(args)}
+    random.seed(args.seed)
+    with tempfile.TemporaryDirectory() as workdir:
+        bot = load_bot(args, workdir)
+        install_fakes(bot, args)
+        scenarios = Scenarios(bot, args)
+        results = {}
+        for name in [n.strip() for n in args.scenarios.split(",") if n.strip()]:
+            if name not in SCENARIOS:
+                raise SystemExit(f"Skenario tidak dikenal: {name}")
+            results[name] = await run_scenario(bot, scenarios, name, args)
+            r = results[name]
+            print(f"{name:<26} n={r['count']:<5} err={r['errors']:<3} p50={r['p50_ms']:>9.1f}ms "
+                  f"p95={r['p95_ms']:>9.1f}ms p99={r['p99_ms']:>9.1f}ms thr={r['throughput_per_s']:>8.2f}/s")
+    return {"meta": meta, "scenarios": results}
+
+
+def main(argv=None) -> None:
+    args = parse_args(argv)
+    result = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+        print(f"\nHasil ditulis ke {args.output}")
+    if args.compare:
+        compare(result, args.compare)
+
+
+if __name__ == "__main__":
+    main()
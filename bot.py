@@ -1,15 +1,35 @@
-import gspread
+import time
+# Titik awal pengukuran waktu impor dan startup (lihat post_init)
+_PROCESS_STARTED = time.perf_counter()
+import argparse
+import asyncio
+import contextvars
+import functools
+import hashlib
+import heapq
+import inspect
+import itertools
+import json
+import math
 import os
 from dotenv import load_dotenv
 import logging
-import google.generativeai as genai
-from serpapi import GoogleSearch
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
-from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, filters, ContextTypes
+from telegram.ext import Application, BaseUpdateProcessor, CommandHandler, CallbackQueryHandler, MessageHandler, filters, ContextTypes
 import uuid
+import random
 import re
+import sqlite3
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from telegram.request import HTTPXRequest
 from telegram.constants import ParseMode, ChatAction
+from telegram.error import BadRequest, RetryAfter, TelegramError
+# gspread, google.generativeai dan serpapi sengaja tidak diimpor di sini: ketiganya berat
+# (~1 detik) dan baru dimuat saat backend-nya pertama dipakai atau dipanaskan.
 
 load_dotenv()
 # --- KONFIGURASI ---
@@ -20,10 +40,139 @@ GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 SERPAPI_API_KEY = os.getenv("SERPAPI_API_KEY") 
 GEMINI_MODEL_NAME = os.getenv("GEMINI_MODEL_NAME", "gemini-2.5-flash")
 
+# Startup: "background" (bot langsung menerima update, klien backend dan data sheet
+# disiapkan di background), "lazy" (klien dibuat saat pertama dipakai), atau "eager"
+# (sambungkan semua dulu dan berhenti jika gagal). Jeda (detik) sebelum backend yang
+# gagal dicoba lagi.
+BACKEND_WARMUP = os.getenv("BACKEND_WARMUP", "background")
+BACKEND_RETRY_INTERVAL = float(os.getenv("BACKEND_RETRY_INTERVAL", "30"))
+
 # Timeouts untuk koneksi Telegram
 TELEGRAM_CONNECT_TIMEOUT = float(os.getenv("TELEGRAM_CONNECT_TIMEOUT", "20"))
 TELEGRAM_READ_TIMEOUT = float(os.getenv("TELEGRAM_READ_TIMEOUT", "30"))
 
+# Mode server: "polling" (default) atau "webhook"
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "telegram")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")  # URL publik dasar, misal https://bot.example.com
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+# Update diproses paralel antar chat, berurutan di dalam satu chat
+TELEGRAM_CONCURRENT_UPDATES = int(os.getenv("TELEGRAM_CONCURRENT_UPDATES", "32"))
+TELEGRAM_MAX_PENDING_UPDATES = int(os.getenv("TELEGRAM_MAX_PENDING_UPDATES", "1024"))
+# Pool koneksi HTTP untuk panggilan keluar ke Telegram
+TELEGRAM_POOL_SIZE = int(os.getenv("TELEGRAM_POOL_SIZE", "64"))
+TELEGRAM_POOL_TIMEOUT = float(os.getenv("TELEGRAM_POOL_TIMEOUT", "5"))
+# Ganti endpoint Bot API (misalnya server tiruan lokal di benchmark.py)
+TELEGRAM_BASE_URL = os.getenv("TELEGRAM_BASE_URL")
+
+# Metrik: port endpoint teks gaya Prometheus (0 = nonaktif), jeda (detik) dump metrik
+# ke log (0 = nonaktif), dan trace pohon panggilan per update (1 = aktif)
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_LOG_INTERVAL = float(os.getenv("METRICS_LOG_INTERVAL", "300"))
+TRACE_UPDATES = os.getenv("TRACE_UPDATES", "0") == "1"
+
+# Mirror lokal worksheet: batas umur data (detik) sebelum pembacaan memaksa sinkronisasi,
+# jeda sinkronisasi background (0 = nonaktif), dan file SQLite (kosong = memori saja)
+SHEET_CACHE_TTL = float(os.getenv("SHEET_CACHE_TTL", "300"))
+SHEET_SYNC_INTERVAL = float(os.getenv("SHEET_SYNC_INTERVAL", "60"))
+SHEET_MIRROR_PATH = os.getenv("SHEET_MIRROR_PATH", "sheet_mirror.sqlite3")
+
+# Thread pool untuk panggilan blocking (gspread, SerpApi, Gemini) beserta
+# batas concurrency dan timeout (detik) per backend
+IO_MAX_WORKERS = int(os.getenv("IO_MAX_WORKERS", "16"))
+SHEETS_CONCURRENCY = int(os.getenv("SHEETS_CONCURRENCY", "4"))
+SHEETS_TIMEOUT = float(os.getenv("SHEETS_TIMEOUT", "30"))
+SERPAPI_CONCURRENCY = int(os.getenv("SERPAPI_CONCURRENCY", "8"))
+SERPAPI_TIMEOUT = float(os.getenv("SERPAPI_TIMEOUT", "20"))
+GEMINI_CONCURRENCY = int(os.getenv("GEMINI_CONCURRENCY", "4"))
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", "60"))
+
+# Kuota upstream: laju token bucket (permintaan/detik, 0 = tanpa batas) dan burst per
+# backend, serta backoff eksponensial (detik) dan jumlah percobaan ulang saat kuota habis
+SERPAPI_RATE = float(os.getenv("SERPAPI_RATE", "2"))
+SERPAPI_BURST = int(os.getenv("SERPAPI_BURST", "5"))
+GEMINI_RATE = float(os.getenv("GEMINI_RATE", "1"))
+GEMINI_BURST = int(os.getenv("GEMINI_BURST", "5"))
+QUOTA_BACKOFF_BASE = float(os.getenv("QUOTA_BACKOFF_BASE", "1"))
+QUOTA_BACKOFF_MAX = float(os.getenv("QUOTA_BACKOFF_MAX", "60"))
+QUOTA_RETRIES = int(os.getenv("QUOTA_RETRIES", "3"))
+
+# Latensi ekor: anggaran waktu (detik) satu handler untuk semua panggilan backend di
+# dalamnya (0 = hanya timeout per backend); backend yang pembacaannya boleh di-hedge
+# (permintaan duplikat setelah melewati p95; kosong = nonaktif, default karena duplikat
+# SerpApi/Gemini ikut ditagih) beserta jumlah sampel minimum dan jeda minimum (detik);
+# circuit breaker: jumlah kegagalan beruntun sebelum terbuka dan lama (detik) sebelum
+# satu permintaan percobaan diizinkan.
+HANDLER_TIME_BUDGET = float(os.getenv("HANDLER_TIME_BUDGET", "30"))
+HEDGE_BACKENDS = [b.strip() for b in os.getenv("HEDGE_BACKENDS", "").split(",") if b.strip()]
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "0.2"))
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_TIMEOUT = float(os.getenv("BREAKER_RESET_TIMEOUT", "30"))
+
+# Penulisan ke sheet: jumlah percobaan ulang saat kuota habis, dan mode write-behind
+# (simpanan digabung lalu ditulis tiap SHEET_FLUSH_INTERVAL detik)
+SHEET_WRITE_RETRIES = int(os.getenv("SHEET_WRITE_RETRIES", "4"))
+SHEET_WRITE_BEHIND = os.getenv("SHEET_WRITE_BEHIND", "0") == "1"
+SHEET_FLUSH_INTERVAL = float(os.getenv("SHEET_FLUSH_INTERVAL", "5"))
+
+# Pengayaan massal: jumlah properti diproses bersamaan, laju maksimum (properti/detik),
+# file checkpoint untuk melanjutkan, dan file usulan yang bisa ditinjau
+ENRICH_CONCURRENCY = int(os.getenv("ENRICH_CONCURRENCY", "4"))
+ENRICH_RATE = float(os.getenv("ENRICH_RATE", "1"))
+ENRICH_CHECKPOINT_FILE = os.getenv("ENRICH_CHECKPOINT_FILE", "enrich_checkpoint.json")
+ENRICH_PROPOSALS_FILE = os.getenv("ENRICH_PROPOSALS_FILE", "enrich_proposals.jsonl")
+
+# Usulan pengisian yang menunggu konfirmasi Simpan/Abaikan: umur maksimum (detik), batas
+# per pengguna (yang terlama dibuang), dan file SQLite agar bertahan restart (kosong = memori saja)
+PENDING_PROPOSAL_TTL = float(os.getenv("PENDING_PROPOSAL_TTL", str(6 * 3600)))
+PENDING_PROPOSAL_PER_USER = int(os.getenv("PENDING_PROPOSAL_PER_USER", "20"))
+PENDING_PROPOSAL_PATH = os.getenv("PENDING_PROPOSAL_PATH", "pending_proposals.sqlite3")
+
+# Jumlah tombol desa/properti per halaman keyboard navigasi
+NAV_PAGE_SIZE = int(os.getenv("NAV_PAGE_SIZE", "10"))
+
+# Scan review IT di background: jumlah worker, batas hasil, dan jeda (detik) update progres
+IT_SCAN_WORKERS = int(os.getenv("IT_SCAN_WORKERS", "4"))
+IT_SCAN_RESULT_LIMIT = int(os.getenv("IT_SCAN_RESULT_LIMIT", "10"))
+IT_SCAN_PROGRESS_INTERVAL = float(os.getenv("IT_SCAN_PROGRESS_INTERVAL", "2"))
+
+# Konteks spreadsheet untuk AI: jumlah baris paling relevan yang dikirim, dan batas
+# jumlah baris di mana seluruh data dikirim apa adanya (dataset kecil)
+AI_CONTEXT_TOP_K = int(os.getenv("AI_CONTEXT_TOP_K", "15"))
+AI_CONTEXT_FULL_MAX_ROWS = int(os.getenv("AI_CONTEXT_FULL_MAX_ROWS", "50"))
+
+# Batas langkah (giliran alat) dan total waktu (detik) AI Agent per pertanyaan
+AI_MAX_STEPS = int(os.getenv("AI_MAX_STEPS", "4"))
+AI_TIME_BUDGET = float(os.getenv("AI_TIME_BUDGET", "45"))
+
+# Jawaban AI dialirkan ke Telegram: placeholder lalu diedit bertahap. Jeda minimum antar
+# edit (detik, dilipatgandakan untuk grup) dan batas atas saat kena flood limit.
+AI_STREAM_REPLIES = os.getenv("AI_STREAM_REPLIES", "1") == "1"
+AI_STREAM_EDIT_INTERVAL = float(os.getenv("AI_STREAM_EDIT_INTERVAL", "1"))
+AI_STREAM_MAX_EDIT_INTERVAL = float(os.getenv("AI_STREAM_MAX_EDIT_INTERVAL", "10"))
+
+# Cache jawaban AI (per pertanyaan + versi data) dan memo ringkasan review IT
+AI_ANSWER_CACHE_SIZE = int(os.getenv("AI_ANSWER_CACHE_SIZE", "256"))
+AI_ANSWER_CACHE_TTL = float(os.getenv("AI_ANSWER_CACHE_TTL", "3600"))
+AI_REFINE_CACHE_SIZE = int(os.getenv("AI_REFINE_CACHE_SIZE", "2048"))
+AI_REFINE_CACHE_TTL = float(os.getenv("AI_REFINE_CACHE_TTL", str(7 * 24 * 3600)))
+
+# Indeks review IT: lokasi SQLite, umur maksimum review sebelum diperbarui (jam),
+# dan jeda (detik) antar pengindeksan terjadwal (0 = nonaktif)
+IT_REVIEW_INDEX_PATH = os.getenv("IT_REVIEW_INDEX_PATH", "it_review_index.sqlite3")
+IT_REVIEW_MAX_AGE_HOURS = float(os.getenv("IT_REVIEW_MAX_AGE_HOURS", str(7 * 24)))
+IT_REVIEW_INDEX_INTERVAL = float(os.getenv("IT_REVIEW_INDEX_INTERVAL", str(6 * 3600)))
+
+# Cache persisten hasil SerpApi (SQLite). Kosongkan SERP_CACHE_PATH untuk menonaktifkan.
+SERP_CACHE_PATH = os.getenv("SERP_CACHE_PATH", "serpapi_cache.sqlite3")
+SERP_CACHE_TTL_GOOGLE = float(os.getenv("SERP_CACHE_TTL_GOOGLE", str(7 * 24 * 3600)))
+SERP_CACHE_TTL_MAPS = float(os.getenv("SERP_CACHE_TTL_MAPS", str(30 * 24 * 3600)))
+SERP_CACHE_NEGATIVE_TTL = float(os.getenv("SERP_CACHE_NEGATIVE_TTL", str(24 * 3600)))
+SERP_CACHE_MAX_ENTRIES = int(os.getenv("SERP_CACHE_MAX_ENTRIES", "20000"))
+
 # --- KONFIGURASI SHEET ---
 SHEET_NAMES = [
     "Villa, Hotel, Resort Sidemen",
@@ -44,25 +193,1607 @@ COLUMN_HEADERS = [
     "Ulasan Review IT",
 ]
 
-# --- SETUP LOGGING ---
-logging.basicConfig(
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO
+# --- SETUP LOGGING ---
+logging.basicConfig(
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+# --- INISIALISASI KONEKSI ---
+# Klien backend dibuat saat pertama dipakai (atau dipanaskan di background oleh
+# warm_backends), sehingga modul ini bisa diimpor tanpa layanan live dan gangguan
+# sementara pada Sheets tidak mencegah bot menyala.
+class BackendUnavailable(Exception):
+    """Backend belum siap atau sedang gagal tersambung."""
+
+    def __init__(self, backend: str, reason: str = ""):
+        super().__init__(f"Backend {backend} belum siap{': ' + reason if reason else ''}")
+        self.backend = backend
+
+
+class Backend:
+    """Satu klien backend yang dibuat malas, dengan status kesiapan dan jeda coba ulang."""
+
+    def __init__(self, name: str, factory):
+        self.name = name
+        self.factory = factory
+        self.client = None
+        self.state = "cold"  # cold / warming / ready / error
+        self.error = None
+        self.warmup_seconds = None
+        self._retry_at = 0.0
+        self._lock = threading.Lock()
+
+    def ready(self) -> bool:
+        return self.client is not None
+
+    def provide(self, client) -> None:
+        """Pasang klien yang sudah jadi (misalnya tiruan di benchmark.py)."""
+        self.client, self.state, self.error = client, "ready", None
+
+    def get(self):
+        """Klien backend, dibuat saat pertama dipanggil; gagal cepat selama disiapkan thread lain atau jeda coba ulang."""
+        if self.client is not None:
+            return self.client
+        # Thread lain sedang menjalankan factory (bisa beberapa detik): tolak segera agar
+        # handler membalas "sedang disiapkan" alih-alih menunggu sampai timeout backend
+        if not self._lock.acquire(blocking=False):
+            raise BackendUnavailable(self.name, "sedang disiapkan" if self.state == "warming" else "")
+        try:
+            if self.client is not None:
+                return self.client
+            if time.monotonic() < self._retry_at:
+                raise BackendUnavailable(self.name, str(self.error))
+            self.state = "warming"
+            started = time.perf_counter()
+            try:
+                client = self.factory()
+            except Exception as e:
+                self.state, self.error = "error", e
+                self._retry_at = time.monotonic() + BACKEND_RETRY_INTERVAL
+                logger.error(f"Gagal menyiapkan backend {self.name}: {e}")
+                raise BackendUnavailable(self.name, str(e)) from e
+            self.warmup_seconds = time.perf_counter() - started
+            self.client, self.state, self.error = client, "ready", None
+        finally:
+            self._lock.release()
+        metrics.observe("backend_warmup_seconds", self.warmup_seconds, backend=self.name)
+        logger.info(f"Backend {self.name} siap dalam {self.warmup_seconds:.2f} detik.")
+        return client
+
+
+def _open_spreadsheet():
+    import gspread
+    return gspread.service_account(filename=GOOGLE_CREDENTIALS_FILE).open_by_key(SPREADSHEET_ID)
+
+def _configure_gemini():
+    import google.generativeai as genai
+    genai.configure(api_key=GEMINI_API_KEY)
+    return genai
+
+def _load_serpapi():
+    from serpapi import GoogleSearch
+    return GoogleSearch
+
+
+backends = {
+    "sheets": Backend("sheets", _open_spreadsheet),
+    "gemini": Backend("gemini", _configure_gemini),
+    "serpapi": Backend("serpapi", _load_serpapi),
+}
+
+def backend_states() -> list:
+    """[(nama, status, siap)] untuk log dan endpoint metrik."""
+    return [(name, backend.state, backend.ready()) for name, backend in backends.items()]
+
+async def ensure_backend(name: str):
+    """Klien backend dari event loop: jika belum siap, dibuat di thread pool agar loop tidak terblok."""
+    backend = backends[name]
+    if backend.ready():
+        return backend.client
+    return await run_blocking(name, backend.get)
+
+async def warm_backends() -> None:
+    """Panaskan klien backend di background sampai semuanya siap, lalu prefetch data sheet."""
+    while True:
+        pending = [backend for backend in backends.values() if not backend.ready()]
+        for backend in pending:
+            try:
+                await run_blocking(backend.name, backend.get)
+            except Exception:
+                pass  # sudah dicatat di Backend.get; dicoba lagi setelah jeda
+        if backends["sheets"].ready():
+            for sheet_name in SHEET_NAMES:
+                try:
+                    await get_sheet_snapshot_async(sheet_name)
+                except Exception as e:
+                    logger.warning(f"Prefetch '{sheet_name}' gagal: {e}")
+        if all(backend.ready() for backend in backends.values()):
+            logger.info(f"Semua backend siap {time.perf_counter() - _PROCESS_STARTED:.2f} detik sejak proses dimulai.")
+            return
+        await asyncio.sleep(BACKEND_RETRY_INTERVAL)
+
+def connect_backends() -> None:
+    """Siapkan semua backend sekarang juga; keluar jika gagal (mode eager dan perintah CLI)."""
+    try:
+        for backend in backends.values():
+            backend.get()
+        logger.info("Koneksi ke Google Sheets dan Gemini AI berhasil.")
+    except BackendUnavailable as e:
+        logger.error(f"Gagal saat inisialisasi: {e}")
+        exit()
+
+# ======================================================================
+# METRIK DAN TRACE
+# ======================================================================
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+class Metrics:
+    """Histogram latensi dan counter berlabel, bisa dirender sebagai teks Prometheus."""
+
+    def __init__(self):
+        self.histograms = {}  # (nama, label) -> [jumlah per bucket..., count, sum]
+        self.counters = {}  # (nama, label) -> nilai
+        self._lock = threading.Lock()
+
+    def observe(self, name: str, seconds: float, **labels) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            data = self.histograms.get(key)
+            if data is None:
+                data = self.histograms[key] = [0] * len(LATENCY_BUCKETS) + [0, 0.0]
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    data[i] += 1
+            data[-2] += 1
+            data[-1] += seconds
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    @staticmethod
+    def _labels(labels: tuple, extra: str = "") -> str:
+        parts = [f'{k}="{v}"' for k, v in labels] + ([extra] if extra else [])
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+    @staticmethod
+    def quantile(data: list, q: float) -> float:
+        """Perkiraan kuantil dari bucket histogram (batas atas bucket)."""
+        count = data[-2]
+        if not count:
+            return 0.0
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if data[i] >= q * count:
+                return bound
+        return float("inf")
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            histograms = sorted((k, list(v)) for k, v in self.histograms.items())
+            counters = sorted(self.counters.items())
+        for (name, labels), data in histograms:
+            for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), data[:len(LATENCY_BUCKETS)] + [data[-2]]):
+                bucket_label = 'le="%s"' % bound
+                lines.append(f"bot_{name}_bucket{self._labels(labels, bucket_label)} {count}")
+            lines.append(f"bot_{name}_count{self._labels(labels)} {data[-2]}")
+            lines.append(f"bot_{name}_sum{self._labels(labels)} {data[-1]:.6f}")
+        for (name, labels), value in counters:
+            lines.append(f"bot_{name}{self._labels(labels)} {value}")
+        for cache_name, hits, misses in cache_hit_counts():
+            ratio = hits / (hits + misses) if hits + misses else 0.0
+            lines.append(f'bot_cache_hit_ratio{{cache="{cache_name}"}} {ratio:.4f}')
+        for backend_name, _, ready in backend_states():
+            lines.append(f'bot_backend_ready{{backend="{backend_name}"}} {int(ready)}')
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> str:
+        """Ringkasan satu baris per histogram dan counter untuk dump ke log."""
+        with self._lock:
+            histograms = sorted((k, list(v)) for k, v in self.histograms.items())
+            errors = {k: v for k, v in self.counters.items() if k[0].endswith("errors_total")}
+            counters = sorted((k, v) for k, v in self.counters.items() if k not in errors)
+        lines = []
+        for (name, labels), data in histograms:
+            label_text = ",".join(f"{k}={v}" for k, v in labels)
+            error_count = sum(v for (n, l), v in errors.items() if l == labels)
+            lines.append(
+                f"{name}[{label_text}] n={data[-2]} avg={data[-1] / data[-2] * 1000:.0f}ms "
+                f"p50<={self.quantile(data, 0.5) * 1000:.0f}ms p95<={self.quantile(data, 0.95) * 1000:.0f}ms err={error_count}"
+            )
+        for (name, labels), value in counters:
+            lines.append(f"{name}[{','.join(f'{k}={v}' for k, v in labels)}] {value:g}")
+        lines.extend(f"cache {name}: {hits}/{hits + misses} hit" for name, hits, misses in cache_hit_counts())
+        return "\n".join(lines)
+
+
+metrics = Metrics()
+
+def cache_hit_counts() -> list:
+    """[(nama cache, hit, miss)] dari semua cache yang dikenal."""
+    counts = [("sheet_snapshot", sheet_cache_stats["hits"], sheet_cache_stats["misses"])]
+    counts.append(("serpapi", serp_cache.stats["hits"] + serp_cache.stats["negative_hits"] + serp_cache.stats["stale_hits"], serp_cache.stats["misses"]))
+    counts.append(("ai_answer", ai_answer_cache.stats["hits"], ai_answer_cache.stats["misses"]))
+    counts.append(("ai_refine", ai_refine_memo.stats["hits"], ai_refine_memo.stats["misses"]))
+    return counts
+
+
+class Span:
+    """Satu simpul pada pohon trace sebuah update."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.start = time.perf_counter()
+        self.duration = None
+        self.error = False
+        self.children = []
+
+    def render(self, depth: int = 0) -> str:
+        duration = f"{self.duration * 1000:.1f}ms" if self.duration is not None else "berjalan"
+        line = f"{'  ' * depth}{self.name} {duration}{' ERROR' if self.error else ''}"
+        return "\n".join([line] + [child.render(depth + 1) for child in self.children])
+
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+@contextmanager
+def timed(metric: str, **labels):
+    """Ukur durasi blok ke histogram `metric`; jika ada trace aktif, catat sebagai span anak."""
+    span = Span(f"{metric} " + "/".join(str(v) for v in labels.values() if v))
+    parent = _current_span.get()
+    if parent is not None:
+        parent.children.append(span)
+    token = _current_span.set(span)
+    try:
+        yield span
+    except Exception:
+        span.error = True
+        raise
+    finally:
+        _current_span.reset(token)
+        span.duration = time.perf_counter() - span.start
+        metrics.observe(f"{metric}_seconds", span.duration, **labels)
+        if span.error:
+            metrics.inc(f"{metric}_errors_total", **labels)
+
+def instrument_handler(handler):
+    """Bungkus handler Telegram: ukur latensi per handler/aksi dan (opsional) log trace-nya."""
+    @functools.wraps(handler)
+    async def wrapper(update, context):
+        action = ""
+        query = getattr(update, "callback_query", None)
+        if query is not None and query.data:
+            action = query.data.split(';')[0]
+        root = Span(f"update {getattr(update, 'update_id', '-')}") if TRACE_UPDATES else None
+        token = _current_span.set(root) if root else None
+        try:
+            with timed("handler", handler=handler.__name__, action=action), deadline_scope(HANDLER_TIME_BUDGET or None):
+                return await handler(update, context)
+        finally:
+            if root is not None:
+                _current_span.reset(token)
+                root.duration = time.perf_counter() - root.start
+                logger.info("Trace:\n" + root.render())
+    return wrapper
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = metrics.render().encode("utf-8")
+        self.send_response(200 if self.path.startswith("/metrics") else 404)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.end_headers()
+        if self.path.startswith("/metrics"):
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_metrics_server(port: int) -> ThreadingHTTPServer:
+    """Jalankan endpoint /metrics lokal di thread terpisah."""
+    server = ThreadingHTTPServer(("127.0.0.1", port), _MetricsRequestHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    logger.info(f"Endpoint metrik aktif di http://127.0.0.1:{port}/metrics")
+    return server
+
+async def metrics_log_loop() -> None:
+    while True:
+        await asyncio.sleep(METRICS_LOG_INTERVAL)
+        logger.info("Metrik:\n" + metrics.summary())
+
+# ======================================================================
+# CACHE LRU DENGAN TTL
+# ======================================================================
+class TTLCache:
+    """Cache LRU di memori dengan batas ukuran, masa berlaku, dan penghitung hit/miss."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or time.monotonic() > entry[1]:
+                if entry is not None:
+                    del self._data[key]
+                self.stats["misses"] += 1
+                return None
+            self._data.move_to_end(key)
+            self.stats["hits"] += 1
+            return entry[0]
+
+    def put(self, key, value) -> None:
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def hit_rate(self) -> float:
+        total = self.stats["hits"] + self.stats["misses"]
+        return self.stats["hits"] / total if total else 0.0
+
+# ======================================================================
+# MIRROR LOKAL WORKSHEET
+# ======================================================================
+def _row_hash(row: list) -> str:
+    return hashlib.sha1(json.dumps(row, ensure_ascii=False).encode("utf-8")).hexdigest()[:16]
+
+
+class SheetSnapshot:
+    """Salinan data satu worksheet yang sudah di-parse untuk navigasi tombol.
+
+    Setiap baris punya ID stabil (`row_ids`) yang tetap sama walau baris lain disisipkan
+    atau dihapus, dan setiap desa punya ID (`desa_ids`) yang tidak pernah dipakai ulang,
+    sehingga callback tombol tidak bergantung pada posisi baris atau urutan desa.
+    """
+
+    def __init__(self, sheet_name: str, all_values: list, row_ids: list = None, loaded_at: float = None,
+                 desa_ids: dict = None):
+        self.sheet_name = sheet_name
+        self.headers = all_values[0] if all_values else []
+        self.rows = all_values[1:] if all_values else []
+        self.row_ids = row_ids if row_ids is not None else list(range(1, len(self.rows) + 1))
+        self.row_hashes = [_row_hash(row) for row in self.rows]
+        self.loaded_at = loaded_at if loaded_at is not None else time.time()
+        # Sidik jari isi sheet, berubah setiap kali datanya berubah
+        self.version = hashlib.sha1(json.dumps(all_values).encode("utf-8")).hexdigest()[:12]
+        self.positions = {row_id: i for i, row_id in enumerate(self.row_ids)}
+        # Peta desa -> indeks baris, dan daftar desa unik yang sudah terurut
+        self.desa_rows = {}
+        desa_col = self.col('Desa')
+        if desa_col is not None:
+            for i, row in enumerate(self.rows):
+                if len(row) > desa_col and row[desa_col]:
+                    self.desa_rows.setdefault(row[desa_col], []).append(i)
+        self.unique_desas = sorted(self.desa_rows)
+        self.desa_ids = desa_ids if desa_ids is not None else {desa: i for i, desa in enumerate(self.unique_desas, 1)}
+        # (Nama, Desa) -> nomor baris di sheet (1-based, baris 1 = header)
+        self.row_numbers = {}
+        nama_col = self.col('Nama')
+        if nama_col is not None and desa_col is not None:
+            for i, row in enumerate(self.rows):
+                if len(row) > max(nama_col, desa_col):
+                    self.row_numbers.setdefault((row[nama_col], row[desa_col]), i + 2)
+
+    def col(self, name: str):
+        """Indeks kolom berdasarkan nama header, atau None jika tidak ada."""
+        try:
+            return self.headers.index(name)
+        except ValueError:
+            return None
+
+    def row_key(self, i: int):
+        """Identitas alami baris ke-i: (Nama, Desa)."""
+        nama_col, desa_col = self.col('Nama'), self.col('Desa')
+        row = self.rows[i]
+        if nama_col is None or desa_col is None or len(row) <= max(nama_col, desa_col):
+            return None
+        return (row[nama_col], row[desa_col])
+
+    def is_fresh(self) -> bool:
+        return time.time() - self.loaded_at < SHEET_CACHE_TTL
+
+
+def assign_row_ids(previous: SheetSnapshot, all_values: list, next_id: int) -> tuple:
+    """Cocokkan baris baru dengan ID lama: isi identik dulu, lalu (Nama, Desa) yang sama.
+
+    Mengembalikan (row_ids, next_id); baris yang tidak cocok mendapat ID baru.
+    """
+    draft = SheetSnapshot(previous.sheet_name if previous else "", all_values, row_ids=[])
+    ids = [None] * len(draft.rows)
+    if previous is not None:
+        by_hash, by_key = {}, {}
+        for i, row_id in enumerate(previous.row_ids):
+            by_hash.setdefault(previous.row_hashes[i], []).append(row_id)
+            by_key.setdefault(previous.row_key(i), []).append(row_id)
+        used = set()
+
+        def take(candidates: list):
+            while candidates:
+                row_id = candidates.pop(0)
+                if row_id not in used:
+                    used.add(row_id)
+                    return row_id
+            return None
+
+        for i, row_hash in enumerate(draft.row_hashes):
+            ids[i] = take(by_hash.get(row_hash, []))
+        for i in range(len(ids)):
+            key = draft.row_key(i)
+            if ids[i] is None and key is not None:
+                ids[i] = take(by_key.get(key, []))
+    for i in range(len(ids)):
+        if ids[i] is None:
+            ids[i] = next_id
+            next_id += 1
+    return ids, next_id
+
+
+class SheetMirror:
+    """Mirror SQLite worksheet: hanya baris yang berubah (per hash isi) yang ditulis ulang."""
+
+    def __init__(self, path: str):
+        self.stats = {"syncs": 0, "added": 0, "changed": 0, "moved": 0, "removed": 0}
+        self._next_ids = {}
+        self._desa_ids = {}  # sheet_name -> {desa: id}, termasuk desa yang sudah hilang
+        self._conn = None
+        self._lock = threading.Lock()
+        if path:
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS sheet_rows ("
+                "sheet_name TEXT, row_id INTEGER, position INTEGER, row_hash TEXT, data TEXT, "
+                "PRIMARY KEY (sheet_name, row_id))"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS sheet_meta ("
+                "sheet_name TEXT PRIMARY KEY, headers TEXT, synced_at REAL, next_id INTEGER)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS sheet_desas ("
+                "sheet_name TEXT, desa TEXT, desa_id INTEGER, PRIMARY KEY (sheet_name, desa))"
+            )
+            self._conn.commit()
+
+    def load(self, sheet_name: str):
+        """Snapshot dari mirror SQLite (dengan waktu sinkron terakhirnya), atau None."""
+        if self._conn is None:
+            return None
+        with self._lock:
+            meta = self._conn.execute(
+                "SELECT headers, synced_at, next_id FROM sheet_meta WHERE sheet_name = ?", (sheet_name,)
+            ).fetchone()
+            if meta is None:
+                return None
+            rows = self._conn.execute(
+                "SELECT row_id, data FROM sheet_rows WHERE sheet_name = ? ORDER BY position", (sheet_name,)
+            ).fetchall()
+            desa_ids = dict(self._conn.execute(
+                "SELECT desa, desa_id FROM sheet_desas WHERE sheet_name = ?", (sheet_name,)
+            ).fetchall())
+        self._next_ids[sheet_name] = meta[2]
+        self._desa_ids[sheet_name] = desa_ids
+        all_values = [json.loads(meta[0])] + [json.loads(data) for _, data in rows]
+        return SheetSnapshot(
+            sheet_name, all_values, row_ids=[row_id for row_id, _ in rows], loaded_at=meta[1], desa_ids=dict(desa_ids)
+        )
+
+    def apply(self, previous: SheetSnapshot, sheet_name: str, all_values: list) -> SheetSnapshot:
+        """Bangun snapshot baru dengan ID stabil lalu simpan selisihnya ke mirror."""
+        next_id = self._next_ids.get(sheet_name)
+        if next_id is None:
+            next_id = max(previous.row_ids, default=0) + 1 if previous else 1
+        row_ids, next_id = assign_row_ids(previous, all_values, next_id)
+        self._next_ids[sheet_name] = next_id
+        desa_ids = self._desa_ids.setdefault(sheet_name, dict(previous.desa_ids) if previous else {})
+        snapshot = SheetSnapshot(sheet_name, all_values, row_ids=row_ids, desa_ids={})
+        # Desa baru mendapat ID berikutnya; ID desa yang hilang tidak dipakai ulang
+        new_desas = []
+        for desa in snapshot.unique_desas:
+            if desa not in desa_ids:
+                desa_ids[desa] = max(desa_ids.values(), default=0) + 1
+                new_desas.append((sheet_name, desa, desa_ids[desa]))
+        snapshot.desa_ids = dict(desa_ids)
+        old = {}
+        if previous is not None:
+            old = {row_id: (i, previous.row_hashes[i]) for i, row_id in enumerate(previous.row_ids)}
+        upserts, moves = [], []
+        for i, row_id in enumerate(snapshot.row_ids):
+            before = old.pop(row_id, None)
+            if before is None or before[1] != snapshot.row_hashes[i]:
+                upserts.append((sheet_name, row_id, i, snapshot.row_hashes[i], json.dumps(snapshot.rows[i], ensure_ascii=False)))
+                self.stats["added" if before is None else "changed"] += 1
+            elif before[0] != i:
+                moves.append((i, sheet_name, row_id))
+                self.stats["moved"] += 1
+        removed = [(sheet_name, row_id) for row_id in old]
+        self.stats["removed"] += len(removed)
+        self.stats["syncs"] += 1
+        if self._conn is not None:
+            with self._lock:
+                self._conn.executemany("INSERT OR REPLACE INTO sheet_rows VALUES (?, ?, ?, ?, ?)", upserts)
+                self._conn.executemany("UPDATE sheet_rows SET position = ? WHERE sheet_name = ? AND row_id = ?", moves)
+                self._conn.executemany("DELETE FROM sheet_rows WHERE sheet_name = ? AND row_id = ?", removed)
+                self._conn.executemany("INSERT OR REPLACE INTO sheet_desas VALUES (?, ?, ?)", new_desas)
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO sheet_meta VALUES (?, ?, ?, ?)",
+                    (sheet_name, json.dumps(snapshot.headers, ensure_ascii=False), snapshot.loaded_at, next_id),
+                )
+                self._conn.commit()
+        if upserts or removed:
+            logger.info(f"Mirror '{sheet_name}': {len(upserts)} baris baru/berubah, {len(moves)} bergeser, {len(removed)} dihapus.")
+        return snapshot
+
+
+sheet_mirror = SheetMirror(SHEET_MIRROR_PATH)
+_worksheets = {}
+_sheet_snapshots = {}
+_sheet_cache_lock = threading.Lock()
+_sheet_sync_locks = {name: threading.Lock() for name in SHEET_NAMES}
+sheet_cache_stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+def get_worksheet(sheet_name: str):
+    """Ambil objek worksheet, disimpan agar metadata spreadsheet tidak diminta berulang."""
+    worksheet = _worksheets.get(sheet_name)
+    if worksheet is None:
+        with timed("backend", backend="sheets", op="worksheet"):
+            worksheet = guarded_call("sheets", backends["sheets"].get().worksheet, sheet_name)
+        _worksheets[sheet_name] = worksheet
+    return worksheet
+
+def _cached_snapshot(sheet_name: str):
+    """Snapshot di memori; saat pertama kali, dimuat dari mirror SQLite."""
+    with _sheet_cache_lock:
+        snapshot = _sheet_snapshots.get(sheet_name)
+    if snapshot is None:
+        snapshot = sheet_mirror.load(sheet_name)
+        if snapshot is not None:
+            with _sheet_cache_lock:
+                snapshot = _sheet_snapshots.setdefault(sheet_name, snapshot)
+            logger.info(f"Snapshot '{sheet_name}' dimuat dari mirror lokal ({len(snapshot.rows)} baris).")
+    return snapshot
+
+def sync_sheet(sheet_name: str, force: bool = False) -> SheetSnapshot:
+    """Unduh worksheet dan terapkan baris yang berubah ke mirror; satu sinkronisasi per sheet sekaligus."""
+    with _sheet_sync_locks.setdefault(sheet_name, threading.Lock()):
+        previous = _cached_snapshot(sheet_name)
+        # Sinkronisasi lain mungkin baru selesai selama menunggu lock
+        if not force and previous is not None and previous.is_fresh():
+            return previous
+        worksheet = get_worksheet(sheet_name)
+        with timed("backend", backend="sheets", op="get_all_values"):
+            all_values = guarded_call("sheets", worksheet.get_all_values)
+        snapshot = sheet_mirror.apply(previous, sheet_name, all_values)
+        with _sheet_cache_lock:
+            _sheet_snapshots[sheet_name] = snapshot
+        return snapshot
+
+def get_sheet_snapshot(sheet_name: str) -> SheetSnapshot:
+    """Ambil snapshot dari mirror; sinkronkan langsung hanya jika melewati batas umur SHEET_CACHE_TTL."""
+    snapshot = _cached_snapshot(sheet_name)
+    if snapshot is not None and snapshot.is_fresh():
+        with _sheet_cache_lock:
+            sheet_cache_stats["hits"] += 1
+        return snapshot
+    with _sheet_cache_lock:
+        sheet_cache_stats["misses"] += 1
+    try:
+        if backends["sheets"].state == "warming":
+            # Thread yang membuat klien mungkin memegang lock sinkronisasi sheet ini: jangan ikut menunggu
+            raise BackendUnavailable("sheets", "sedang disiapkan")
+        return sync_sheet(sheet_name)
+    except Exception as e:
+        if snapshot is None:
+            raise
+        # Sheets sedang bermasalah: lebih baik data lama daripada tidak ada data. Tunda
+        # percobaan berikutnya agar setiap pembacaan tidak ikut menunggu Sheets yang lambat.
+        logger.warning(f"Sinkronisasi '{sheet_name}' gagal, pakai mirror lama: {e}")
+        metrics.inc("stale_served_total", backend="sheets")
+        snapshot.loaded_at = time.time() - SHEET_CACHE_TTL + min(SHEET_CACHE_TTL, 30)
+        return snapshot
+
+def invalidate_sheet_snapshot(sheet_name: str = None) -> None:
+    """Tandai snapshot satu sheet (atau semua sheet) kadaluarsa agar pembacaan berikutnya menyinkronkan.
+
+    Snapshot lama tetap disimpan supaya ID baris bisa dicocokkan saat sinkronisasi.
+    """
+    with _sheet_cache_lock:
+        for name, snapshot in _sheet_snapshots.items():
+            if sheet_name is None or name == sheet_name:
+                snapshot.loaded_at = 0.0
+        sheet_cache_stats["invalidations"] += 1
+
+def current_data_version() -> str:
+    """Gabungan versi snapshot semua sheet yang sedang ada di cache."""
+    with _sheet_cache_lock:
+        return "|".join(_sheet_snapshots[name].version if name in _sheet_snapshots else "-" for name in SHEET_NAMES)
+
+async def get_sheet_snapshot_async(sheet_name: str) -> SheetSnapshot:
+    """Versi async get_sheet_snapshot: data yang masih segar dilayani langsung tanpa pindah thread."""
+    with _sheet_cache_lock:
+        snapshot = _sheet_snapshots.get(sheet_name)
+        if snapshot is not None and snapshot.is_fresh():
+            sheet_cache_stats["hits"] += 1
+            return snapshot
+    return await run_blocking("sheets", get_sheet_snapshot, sheet_name)
+
+async def sheet_mirror_loop() -> None:
+    """Sinkronkan semua worksheet secara berkala agar pembacaan tidak perlu menunggu Sheets."""
+    while True:
+        for sheet_name in SHEET_NAMES:
+            try:
+                await run_blocking("sheets", sync_sheet, sheet_name, True)
+            except Exception as e:
+                logger.warning(f"Sinkronisasi background '{sheet_name}' gagal: {e}")
+        await asyncio.sleep(SHEET_SYNC_INTERVAL)
+
+# ======================================================================
+# LAPISAN I/O ASINKRON
+# ======================================================================
+# Semua panggilan ke gspread, SerpApi dan Gemini bersifat blocking. Agar event
+# loop tetap melayani chat lain, panggilan tersebut dijalankan di thread pool
+# dengan batas concurrency dan timeout per backend.
+BACKEND_LIMITS = {
+    "sheets": (SHEETS_CONCURRENCY, SHEETS_TIMEOUT),
+    "serpapi": (SERPAPI_CONCURRENCY, SERPAPI_TIMEOUT),
+    "gemini": (GEMINI_CONCURRENCY, GEMINI_TIMEOUT),
+}
+
+# Jalur prioritas: angka kecil dilayani lebih dulu saat antre slot backend atau kuota.
+# Handler interaktif memakai default; scan review IT dan pekerjaan batch menurunkannya.
+PRIORITY_INTERACTIVE = 0
+PRIORITY_SCAN = 1
+PRIORITY_BATCH = 2
+
+request_priority = contextvars.ContextVar("request_priority", default=PRIORITY_INTERACTIVE)
+
+@contextmanager
+def priority_lane(level: int):
+    """Jalankan blok (dan semua panggilan backend di dalamnya) pada jalur prioritas `level`."""
+    token = request_priority.set(level)
+    try:
+        yield
+    finally:
+        request_priority.reset(token)
+
+# Tenggat per permintaan (time.monotonic) yang diwariskan handler ke semua panggilan
+# backend di dalamnya; None = hanya timeout per backend.
+request_deadline = contextvars.ContextVar("request_deadline", default=None)
+
+@contextmanager
+def deadline_scope(seconds):
+    """Jalankan blok dengan tenggat `seconds` dari sekarang (None = tanpa tenggat)."""
+    token = request_deadline.set(None if seconds is None else time.monotonic() + seconds)
+    try:
+        yield
+    finally:
+        request_deadline.reset(token)
+
+def _call_timeout(backend: str, timeout: float = None) -> tuple:
+    """(timeout, dipotong tenggat?): timeout eksplisit pemanggil, atau timeout backend dipotong sisa tenggat."""
+    if timeout is not None:
+        return timeout, False
+    limit_timeout = BACKEND_LIMITS[backend][1]
+    deadline = request_deadline.get()
+    if deadline is None:
+        return limit_timeout, False
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        metrics.inc("deadline_exceeded_total", backend=backend)
+        raise asyncio.TimeoutError(f"Tenggat permintaan habis sebelum memanggil {backend}")
+    return min(limit_timeout, remaining), remaining < limit_timeout
+
+def _record_timeout(backend: str, clipped: bool) -> None:
+    """Timeout karena tenggat handler bukan kesalahan backend; hanya timeout backend yang dihitung breaker."""
+    if clipped:
+        metrics.inc("deadline_exceeded_total", backend=backend)
+    else:
+        metrics.inc("backend_timeouts_total", backend=backend)
+        backend_health[backend].record_failure()
+
+
+class PrioritySemaphore:
+    """Semaphore asyncio yang membangunkan antrean menurut prioritas, lalu urutan datang."""
+
+    def __init__(self, value: int):
+        self._value = value
+        self._waiters = []  # heap (prioritas, urutan, future)
+        self._seq = itertools.count()
+
+    async def __aenter__(self):
+        if self._value > 0 and not self._waiters:
+            self._value -= 1
+            return
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (request_priority.get(), next(self._seq), fut))
+        try:
+            await fut
+        except asyncio.CancelledError:
+            # Slot sudah diberikan tapi pemanggil batal: teruskan ke antrean berikutnya
+            if fut.done() and not fut.cancelled():
+                self._release()
+            raise
+
+    async def __aexit__(self, *exc_info):
+        self._release()
+
+    def _release(self) -> None:
+        while self._waiters:
+            _, _, fut = heapq.heappop(self._waiters)
+            if not fut.done():
+                fut.set_result(None)
+                return
+        self._value += 1
+
+
+_io_executor = ThreadPoolExecutor(max_workers=IO_MAX_WORKERS, thread_name_prefix="bot-io")
+# Penulisan SQLite lokal dari event loop dijalankan berurutan di satu thread: urutan tulis
+# tetap terjaga dan handler tidak menunggu commit ke disk
+_db_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="bot-db")
+
+def _run_db_write(conn: sqlite3.Connection, statements: list, label: str) -> None:
+    """Jalankan [(sql, [parameter...])] lalu satu commit; dipanggil di thread _db_executor."""
+    try:
+        for sql, rows in statements:
+            conn.executemany(sql, rows)
+        conn.commit()
+    except sqlite3.Error as e:
+        logger.warning(f"Gagal menyimpan {label} ke SQLite: {e}")
+
+def submit_db_write(conn: sqlite3.Connection, statements: list, label: str):
+    """Antrekan penulisan SQLite ke _db_executor; kembalikan Future-nya (None jika tidak ada yang ditulis)."""
+    if conn is None or not statements:
+        return None
+    return _db_executor.submit(_run_db_write, conn, statements, label)
+_backend_semaphores = {}
+
+def _backend_semaphore(backend: str) -> PrioritySemaphore:
+    """Semaphore per backend, dibuat ulang jika event loop berganti."""
+    loop = asyncio.get_running_loop()
+    entry = _backend_semaphores.get(backend)
+    if entry is None or entry[0] is not loop:
+        entry = (loop, PrioritySemaphore(BACKEND_LIMITS[backend][0]))
+        _backend_semaphores[backend] = entry
+    return entry[1]
+
+async def run_blocking(backend: str, func, *args, timeout: float = None, **kwargs):
+    """Jalankan fungsi blocking di thread pool dengan batas concurrency dan timeout backend.
+
+    Timeout dipotong oleh tenggat permintaan (deadline_scope) jika pemanggil tidak memberi
+    timeout sendiri; waktu antre slot ikut dihitung.
+    """
+    started = time.monotonic()
+    limit_timeout, clipped = _call_timeout(backend, timeout)
+    waited = time.perf_counter()
+    async with _backend_semaphore(backend):
+        metrics.observe("backend_wait_seconds", time.perf_counter() - waited, backend=backend)
+        loop = asyncio.get_running_loop()
+        # Salin context agar span trace di thread pool tetap menempel ke update asalnya
+        call = functools.partial(contextvars.copy_context().run, func, *args, **kwargs)
+        remaining = limit_timeout - (time.monotonic() - started)
+        try:
+            return await asyncio.wait_for(loop.run_in_executor(_io_executor, call), max(remaining, 0.001))
+        except asyncio.TimeoutError:
+            _record_timeout(backend, clipped)
+            raise
+
+async def run_async(backend: str, func, *args, timeout: float = None, **kwargs):
+    """Jalankan fungsi async klien native dengan batas concurrency, kuota, timeout dan circuit breaker backend."""
+    limit_timeout, clipped = _call_timeout(backend, timeout)
+    health = backend_health[backend]
+    health.check()
+    waited = time.perf_counter()
+    async with _backend_semaphore(backend):
+        metrics.observe("backend_wait_seconds", time.perf_counter() - waited, backend=backend)
+        with timed("backend", backend=backend, op=getattr(func, "__name__", "coroutine")):
+            started = time.perf_counter()
+            try:
+                result = await asyncio.wait_for(call_with_quota_async(backend, func, *args, **kwargs), limit_timeout)
+            except asyncio.TimeoutError:
+                _record_timeout(backend, clipped)
+                raise
+            except Exception as e:
+                if not is_upstream_quota_error(e):
+                    health.record_failure()
+                raise
+            health.record_success(time.perf_counter() - started)
+            return result
+
+# ======================================================================
+# PENJADWAL KUOTA SERPAPI DAN GEMINI
+# ======================================================================
+# Semua permintaan upstream ke SerpApi dan Gemini (dari thread pool maupun event loop)
+# mengambil token dari bucket backend-nya. Antrean dilayani menurut prioritas, dan
+# saat upstream membalas "kuota habis" seluruh antrean backend itu ditahan (backoff).
+class _QuotaTicket:
+    __slots__ = ("granted", "cancelled", "notify")
+
+    def __init__(self):
+        self.granted = False
+        self.cancelled = False
+        self.notify = None
+
+
+class QuotaScheduler:
+    """Token bucket thread-safe per backend dengan antrean prioritas dan backoff eksponensial."""
+
+    def __init__(self, name: str, rate: float, burst: int):
+        self.name = name
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.stats = {"granted": 0, "queued": 0, "backoffs": 0}
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._failures = 0
+        self._waiters = []  # heap (prioritas, urutan, tiket)
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def _dispatch(self) -> float:
+        """Bagikan token ke antrean terdepan; kembalikan jeda sampai token berikutnya.
+
+        Dipanggil dengan lock dipegang.
+        """
+        now = time.monotonic()
+        if self.rate > 0:
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        else:
+            self._tokens = float(self.burst)
+        self._updated = now
+        if now < self._paused_until:
+            return self._paused_until - now
+        while self._waiters and self._tokens >= 1:
+            _, _, ticket = heapq.heappop(self._waiters)
+            if ticket.cancelled:
+                continue
+            self._tokens -= 1
+            ticket.granted = True
+            self.stats["granted"] += 1
+            if ticket.notify is not None:
+                ticket.notify()
+        if not self._waiters:
+            return 0.0
+        return (1 - self._tokens) / self.rate if self.rate > 0 else 0.01
+
+    def _enqueue(self, ticket: _QuotaTicket, priority: int) -> None:
+        heapq.heappush(self._waiters, (priority, next(self._seq), ticket))
+
+    def _record_wait(self, started: float, priority: int, delay_seen: bool) -> None:
+        if delay_seen:
+            self.stats["queued"] += 1
+        metrics.observe("quota_wait_seconds", time.perf_counter() - started, backend=self.name, priority=priority)
+
+    def _time_left(self, deadline) -> float:
+        """Sisa tenggat permintaan (None = tanpa tenggat); TimeoutError jika sudah lewat."""
+        if deadline is None:
+            return None
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            metrics.inc("deadline_exceeded_total", backend=self.name)
+            raise asyncio.TimeoutError(f"Tenggat permintaan habis saat menunggu kuota {self.name}")
+        return remaining
+
+    def _cancel(self, ticket: _QuotaTicket) -> None:
+        """Keluarkan tiket dari antrean; token yang terlanjur diberikan dikembalikan."""
+        with self._lock:
+            ticket.cancelled = True
+            if ticket.granted:
+                self._tokens = min(self.burst, self._tokens + 1)
+
+    def acquire(self) -> None:
+        """Ambil satu token dari thread biasa; blok sampai giliran jalur prioritasnya.
+
+        Menyerah dengan TimeoutError begitu tenggat permintaan (request_deadline) lewat,
+        supaya panggilan berbayar tidak dijalankan untuk handler yang sudah menyerah.
+        """
+        priority = request_priority.get()
+        deadline = request_deadline.get()
+        self._time_left(deadline)
+        started = time.perf_counter()
+        event = threading.Event()
+        ticket = _QuotaTicket()
+        ticket.notify = event.set
+        delay_seen = False
+        with self._lock:
+            self._enqueue(ticket, priority)
+        try:
+            while True:
+                with self._lock:
+                    delay = 0.0 if ticket.granted else self._dispatch()
+                    if ticket.granted:
+                        break
+                remaining = self._time_left(deadline)
+                delay_seen = True
+                event.wait(delay if remaining is None else min(delay, remaining))
+                event.clear()
+        except asyncio.TimeoutError:
+            self._cancel(ticket)
+            raise
+        self._record_wait(started, priority, delay_seen)
+
+    async def acquire_async(self) -> None:
+        """Ambil satu token dari event loop tanpa memblok chat lain."""
+        priority = request_priority.get()
+        deadline = request_deadline.get()
+        self._time_left(deadline)
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        ticket = _QuotaTicket()
+        delay_seen = False
+        with self._lock:
+            self._enqueue(ticket, priority)
+        try:
+            while True:
+                fut = loop.create_future()
+                with self._lock:
+                    ticket.notify = functools.partial(loop.call_soon_threadsafe, _resolve_future, fut)
+                    delay = 0.0 if ticket.granted else self._dispatch()
+                    if ticket.granted:
+                        break
+                remaining = self._time_left(deadline)
+                delay_seen = True
+                try:
+                    await asyncio.wait_for(fut, delay if remaining is None else min(delay, remaining))
+                except asyncio.TimeoutError:
+                    pass
+        except (asyncio.CancelledError, asyncio.TimeoutError):
+            self._cancel(ticket)
+            raise
+        self._record_wait(started, priority, delay_seen)
+
+    def penalize(self) -> float:
+        """Upstream membalas kuota habis: tahan seluruh antrean dengan backoff eksponensial."""
+        with self._lock:
+            self._failures += 1
+            delay = min(QUOTA_BACKOFF_MAX, QUOTA_BACKOFF_BASE * 2 ** (self._failures - 1))
+            delay *= random.uniform(0.8, 1.2)
+            self._paused_until = max(self._paused_until, time.monotonic() + delay)
+            self._tokens = 0.0
+            self.stats["backoffs"] += 1
+        metrics.inc("quota_backoffs_total", backend=self.name)
+        logger.warning(f"Kuota {self.name} habis, antrean ditahan {delay:.1f} detik.")
+        return delay
+
+    def try_acquire(self) -> bool:
+        """Ambil satu token hanya jika tersedia saat ini tanpa mendahului antrean (untuk hedge)."""
+        with self._lock:
+            self._dispatch()
+            if self._waiters or self._tokens < 1 or time.monotonic() < self._paused_until:
+                return False
+            self._tokens -= 1
+            self.stats["granted"] += 1
+            return True
+
+    def succeeded(self) -> None:
+        self._failures = 0
+
+
+def _resolve_future(fut: asyncio.Future) -> None:
+    if not fut.done():
+        fut.set_result(None)
+
+
+class SingleFlight:
+    """Gabungkan panggilan identik yang sedang berjalan menjadi satu permintaan upstream."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls = {}  # kunci -> [event, hasil, error]
+        self._lock = threading.Lock()
+
+    def do(self, key, func, *args):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = [threading.Event(), None, None]
+        if not leader:
+            metrics.inc("singleflight_shared_total", backend=self.name)
+            call[0].wait()
+            if call[2] is not None:
+                raise call[2]
+            return call[1]
+        try:
+            call[1] = func(*args)
+            return call[1]
+        except Exception as e:
+            call[2] = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call[0].set()
+
+
+quota_schedulers = {
+    "serpapi": QuotaScheduler("serpapi", SERPAPI_RATE, SERPAPI_BURST),
+    "gemini": QuotaScheduler("gemini", GEMINI_RATE, GEMINI_BURST),
+}
+
+def is_upstream_quota_error(error: Exception) -> bool:
+    """True untuk error 429/ResourceExhausted dari klien SerpApi atau Gemini."""
+    text = f"{type(error).__name__} {error}"
+    return "ResourceExhausted" in text or "429" in text or re.search(r"quota|rate limit", text, re.I) is not None
+
+def _serpapi_quota_exhausted(results: dict) -> bool:
+    """SerpApi melaporkan batas kuota lewat field `error`, bukan exception."""
+    return bool(re.search(r"run out of searches|throughput|rate limit|429", results.get("error", ""), re.I))
+
+def call_with_quota(backend: str, func, *args, **kwargs):
+    """Panggil upstream dari thread pool lewat token bucket, dengan backoff saat kuota habis.
+
+    Circuit breaker dicek sebelum antre token agar panggilan yang pasti ditolak tidak
+    menghabiskan kuota.
+    """
+    scheduler = quota_schedulers[backend]
+    health = backend_health[backend]
+    for attempt in range(QUOTA_RETRIES + 1):
+        if health.is_open():
+            health.check()
+        scheduler.acquire()
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            if not is_upstream_quota_error(e) or attempt == QUOTA_RETRIES:
+                raise
+            scheduler.penalize()
+            continue
+        if backend == "serpapi" and _serpapi_quota_exhausted(result) and attempt < QUOTA_RETRIES:
+            scheduler.penalize()
+            continue
+        scheduler.succeeded()
+        return result
+
+async def call_with_quota_async(backend: str, func, *args, **kwargs):
+    """Versi async call_with_quota untuk klien async native; backend lain langsung dipanggil."""
+    scheduler = quota_schedulers.get(backend)
+    if scheduler is None:
+        return await func(*args, **kwargs)
+    for attempt in range(QUOTA_RETRIES + 1):
+        await scheduler.acquire_async()
+        try:
+            result = await func(*args, **kwargs)
+        except Exception as e:
+            if not is_upstream_quota_error(e) or attempt == QUOTA_RETRIES:
+                raise
+            scheduler.penalize()
+            continue
+        scheduler.succeeded()
+        return result
+
+# ======================================================================
+# LATENSI EKOR: HEDGING DAN CIRCUIT BREAKER
+# ======================================================================
+# Setiap panggilan upstream mencatat latensinya per backend. Pembacaan yang aman
+# diulang dikirim ulang (hedge) jika belum selesai setelah p95 backend-nya, lalu
+# hasil yang lebih dulu datang dipakai. Setelah BREAKER_FAILURE_THRESHOLD kegagalan
+# beruntun circuit breaker terbuka: panggilan langsung gagal dengan BackendUnavailable
+# agar pemanggil segera memakai cache atau hasil parsial, sampai satu permintaan
+# percobaan berhasil.
+class BackendHealth:
+    """Sampel latensi, delay hedge dan status circuit breaker (closed/open/half_open) satu backend."""
+
+    def __init__(self, name: str, hedge: bool):
+        self.name = name
+        self.hedge = hedge
+        self.state = "closed"
+        self.stats = {"opened": 0, "rejected": 0, "hedged": 0, "hedge_wins": 0}
+        self._latencies = deque(maxlen=200)
+        self._failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def is_open(self) -> bool:
+        """True jika breaker terbuka dan belum waktunya permintaan percobaan."""
+        with self._lock:
+            return self.state != "closed" and time.monotonic() - self._opened_at < BREAKER_RESET_TIMEOUT
+
+    def check(self) -> None:
+        """Gagal cepat dengan BackendUnavailable selama breaker terbuka.
+
+        Setelah BREAKER_RESET_TIMEOUT satu permintaan percobaan dibiarkan lewat (half-open);
+        permintaan lain tetap ditolak sampai hasilnya diketahui atau jeda berikutnya lewat.
+        """
+        with self._lock:
+            if self.state == "closed":
+                return
+            now = time.monotonic()
+            if now - self._opened_at >= BREAKER_RESET_TIMEOUT:
+                self.state, self._opened_at = "half_open", now
+                return
+            self.stats["rejected"] += 1
+        metrics.inc("breaker_rejections_total", backend=self.name)
+        raise BackendUnavailable(self.name, "circuit breaker terbuka")
+
+    def record_success(self, seconds: float = None) -> None:
+        with self._lock:
+            if seconds is not None:
+                self._latencies.append(seconds)
+            recovered = self.state != "closed"
+            self.state, self._failures = "closed", 0
+        if recovered:
+            logger.info(f"Circuit breaker {self.name} tertutup kembali.")
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self.state == "closed" and self._failures < BREAKER_FAILURE_THRESHOLD:
+                return
+            reopened = self.state == "half_open"
+            if self.state == "open":
+                return
+            self.state, self._opened_at = "open", time.monotonic()
+            self.stats["opened"] += 1
+        metrics.inc("breaker_open_total", backend=self.name)
+        logger.warning(
+            f"Circuit breaker {self.name} terbuka{' lagi' if reopened else ''} setelah "
+            f"{self._failures} kegagalan; panggilan ditolak {BREAKER_RESET_TIMEOUT:g} detik."
+        )
+
+    def hedge_delay(self):
+        """Jeda sebelum permintaan duplikat (p95 latensi terakhir), atau None jika hedging tidak dipakai."""
+        with self._lock:
+            if not self.hedge or len(self._latencies) < HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(self._latencies)
+        return max(HEDGE_MIN_DELAY, ordered[int(0.95 * (len(ordered) - 1))])
+
+
+backend_health = {name: BackendHealth(name, name in HEDGE_BACKENDS) for name in BACKEND_LIMITS}
+# Pool terpisah agar hedge dari dalam thread _io_executor tidak menunggu slot pool yang sama
+_hedge_executor = ThreadPoolExecutor(max_workers=IO_MAX_WORKERS, thread_name_prefix="bot-hedge")
+
+def guarded_call(backend: str, func, *args, hedge: bool = True):
+    """Panggil upstream dari thread pool lewat circuit breaker, dengan hedging untuk pembacaan.
+
+    Untuk backend berkuota panggil lewat call_with_quota(backend, guarded_call, ...): token
+    sudah diambil sebelum pengukuran dimulai, sehingga waktu antre kuota tidak ikut latensi
+    dan tidak memicu hedge. Pakai hedge=False untuk panggilan yang tidak aman diulang
+    (misalnya penulisan).
+    """
+    health = backend_health[backend]
+    health.check()
+    delay = health.hedge_delay() if hedge else None
+    started = time.perf_counter()
+    try:
+        result = func(*args) if delay is None else _hedged_call(health, delay, func, *args)
+    except Exception as e:
+        if not isinstance(e, BackendUnavailable) and not is_upstream_quota_error(e):
+            health.record_failure()
+        raise
+    health.record_success(time.perf_counter() - started)
+    return result
+
+def _hedged_call(health: BackendHealth, delay: float, func, *args):
+    primary = _hedge_executor.submit(contextvars.copy_context().run, func, *args)
+    done, _ = wait([primary], timeout=delay)
+    if done:
+        return primary.result()
+    # Duplikat tidak ikut antre kuota: hanya dikirim jika bucket punya token saat ini
+    scheduler = quota_schedulers.get(health.name)
+    if scheduler is not None and not scheduler.try_acquire():
+        metrics.inc("hedges_skipped_total", backend=health.name)
+        return primary.result()
+    health.stats["hedged"] += 1
+    metrics.inc("hedged_requests_total", backend=health.name)
+    hedge = _hedge_executor.submit(contextvars.copy_context().run, func, *args)
+    pending = {primary, hedge}
+    while True:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        winner = next((future for future in done if future.exception() is None), None)
+        if winner is None and pending:
+            continue  # satu gagal, tunggu yang lain
+        if winner is hedge:
+            health.stats["hedge_wins"] += 1
+            metrics.inc("hedge_wins_total", backend=health.name)
+        return (winner or done.pop()).result()
+
+# ======================================================================
+# CACHE PERSISTEN HASIL SERPAPI
+# ======================================================================
+class SerpApiCache:
+    """Cache SQLite untuk hasil SerpApi dengan TTL per engine, eviksi LRU dan cache negatif."""
+
+    # Hanya bagian respons yang dipakai bot yang disimpan
+    KEPT_FIELDS = ("organic_results", "answer_box", "local_results")
+    # last_access dari hit dikumpulkan di memori dan ditulis per batch (atau saat put),
+    # agar cache hit tidak perlu UPDATE + commit di bawah lock global
+    TOUCH_BATCH = 100
+
+    def __init__(self, path: str, max_entries: int):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttls = {"google": SERP_CACHE_TTL_GOOGLE, "google_maps": SERP_CACHE_TTL_MAPS}
+        self.stats = {"hits": 0, "negative_hits": 0, "stale_hits": 0, "misses": 0, "expired": 0, "stores": 0, "evictions": 0}
+        self._lock = threading.Lock()
+        self._conn = None
+        self._count = 0
+        self._touched = {}  # key -> last_access yang belum ditulis
+        if path:
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS serp_cache ("
+                "key TEXT PRIMARY KEY, engine TEXT, query TEXT, results TEXT, "
+                "negative INTEGER, created_at REAL, expires_at REAL, last_access REAL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS serp_cache_lru ON serp_cache (last_access)")
+            self._conn.commit()
+            self._count = self._conn.execute("SELECT COUNT(*) FROM serp_cache").fetchone()[0]
+
+    @staticmethod
+    def make_key(engine: str, query: str, gl: str, hl: str) -> str:
+        normalized = re.sub(r"\s+", " ", query).strip().lower()
+        return hashlib.sha256(f"{engine}|{gl}|{hl}|{normalized}".encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def is_negative(engine: str, results: dict) -> bool:
+        """True jika respons berarti 'tidak ada hasil'."""
+        if engine == "google_maps":
+            return not results.get("local_results")
+        return not any(res.get("snippet") for res in results.get("organic_results", [])) and "answer_box" not in results
+
+    def get(self, engine: str, query: str, gl: str, hl: str, allow_expired: bool = False):
+        """Hasil tersimpan yang masih berlaku, atau None. `allow_expired` juga mengembalikan entri kadaluarsa."""
+        if self._conn is None:
+            return None
+        key = self.make_key(engine, query, gl, hl)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT results, negative, expires_at FROM serp_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.stats["misses"] += 1
+                return None
+            if row[2] < now and allow_expired:
+                self.stats["stale_hits"] += 1
+                metrics.inc("stale_served_total", backend="serpapi")
+            elif row[2] < now:
+                self.stats["expired"] += 1
+                self.stats["misses"] += 1
+                return None
+            self._touched[key] = now
+            if len(self._touched) >= self.TOUCH_BATCH:
+                self._write_touched()
+                self._conn.commit()
+            self.stats["negative_hits" if row[1] else "hits"] += 1
+        return json.loads(row[0])
+
+    def _write_touched(self) -> None:
+        """Tulis last_access yang terkumpul (lock dipegang, commit oleh pemanggil).
+
+        Jika proses mati sebelum ditulis, yang hilang hanya urutan LRU beberapa entri.
+        """
+        if self._touched:
+            self._conn.executemany(
+                "UPDATE serp_cache SET last_access = ? WHERE key = ?",
+                [(last_access, key) for key, last_access in self._touched.items()],
+            )
+            self._touched.clear()
+
+    def put(self, engine: str, query: str, gl: str, hl: str, results: dict) -> None:
+        """Simpan respons SerpApi; error selain 'tidak ada hasil' tidak disimpan."""
+        if self._conn is None:
+            return
+        error = results.get("error")
+        if error and "any results" not in error:
+            return
+        negative = bool(error) or self.is_negative(engine, results)
+        ttl = SERP_CACHE_NEGATIVE_TTL if negative else self.ttls.get(engine, SERP_CACHE_TTL_GOOGLE)
+        kept = {field: results[field] for field in self.KEPT_FIELDS if field in results}
+        key = self.make_key(engine, query, gl, hl)
+        now = time.time()
+        with self._lock:
+            replaced = self._conn.execute("SELECT 1 FROM serp_cache WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO serp_cache VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, engine, query, json.dumps(kept), int(negative), now, now + ttl, now),
+            )
+            if not replaced:
+                self._count += 1
+            self.stats["stores"] += 1
+            self._touched.pop(key, None)
+            if self._count > self.max_entries:
+                # Urutan LRU harus memperhitungkan hit yang belum ditulis
+                self._write_touched()
+                excess = self._count - self.max_entries
+                self._conn.execute(
+                    "DELETE FROM serp_cache WHERE key IN (SELECT key FROM serp_cache ORDER BY last_access LIMIT ?)",
+                    (excess,),
+                )
+                self._count -= excess
+                self.stats["evictions"] += excess
+            self._conn.commit()
+
+
+serp_cache = SerpApiCache(SERP_CACHE_PATH, SERP_CACHE_MAX_ENTRIES)
+serp_flight = SingleFlight("serpapi")
+
+def serpapi_search(engine: str, query: str, gl: str = "id", hl: str = "id") -> dict:
+    """Jalankan pencarian SerpApi lewat cache persisten; query identik yang sedang berjalan digabung.
+
+    Selama circuit breaker SerpApi terbuka, entri cache yang sudah kadaluarsa pun dipakai.
+    """
+    results = serp_cache.get(engine, query, gl, hl, allow_expired=backend_health["serpapi"].is_open())
+    if results is not None:
+        return results
+    key = SerpApiCache.make_key(engine, query, gl, hl)
+    return serp_flight.do(key, _serpapi_fetch, engine, query, gl, hl)
+
+def _serpapi_fetch(engine: str, query: str, gl: str, hl: str) -> dict:
+    params = {"q": query, "api_key": SERPAPI_API_KEY, "engine": engine, "gl": gl, "hl": hl}
+    google_search = backends["serpapi"].get()
+    results = call_with_quota("serpapi", guarded_call, "serpapi", lambda: google_search(params).get_dict())
+    serp_cache.put(engine, query, gl, hl, results)
+    return results
+
+# ======================================================================
+# PENCARIAN LEKSIKAL (BM25)
+# ======================================================================
+class BM25Index:
+    """Inverted index sederhana dengan skor BM25 untuk dokumen teks pendek."""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1, self.b = k1, b
+        self.postings = {}  # term -> {doc_id: frekuensi}
+        self.doc_lengths = {}
+        self.total_length = 0
+
+    def __len__(self) -> int:
+        return len(self.doc_lengths)
+
+    def add(self, doc_id, tokens: list) -> None:
+        self.remove(doc_id)
+        counts = {}
+        for token in tokens:
+            counts[token] = counts.get(token, 0) + 1
+        for token, tf in counts.items():
+            self.postings.setdefault(token, {})[doc_id] = tf
+        self.doc_lengths[doc_id] = len(tokens)
+        self.total_length += len(tokens)
+
+    def remove(self, doc_id) -> None:
+        length = self.doc_lengths.pop(doc_id, None)
+        if length is None:
+            return
+        self.total_length -= length
+        for token in list(self.postings):
+            docs = self.postings[token]
+            if docs.pop(doc_id, None) is not None and not docs:
+                del self.postings[token]
+
+    def search(self, tokens: list, k: int = None) -> list:
+        """[(doc_id, skor, jumlah term kueri yang cocok)], dokumen yang paling banyak cocok di depan."""
+        n = len(self.doc_lengths)
+        if not n:
+            return []
+        avg_length = (self.total_length / n) or 1
+        scores, matched = {}, {}
+        for token in set(tokens):
+            docs = self.postings.get(token)
+            if not docs:
+                continue
+            idf = math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            for doc_id, tf in docs.items():
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / avg_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+                matched[doc_id] = matched.get(doc_id, 0) + 1
+        ranked = sorted(scores, key=lambda d: (matched[d], scores[d]), reverse=True)
+        if k is not None:
+            ranked = ranked[:k]
+        return [(doc_id, scores[doc_id], matched[doc_id]) for doc_id in ranked]
+
+# ======================================================================
+# USULAN PENGISIAN YANG MENUNGGU KONFIRMASI
+# ======================================================================
+class PendingProposalStore:
+    """Usulan view_details per pengguna dengan TTL, batas per pengguna (LRU) dan SQLite opsional.
+
+    Record disimpan ringkas sebagai (sheet_name, nama, desa, updates, expires_at).
+    """
+
+    PURGE_INTERVAL = 60
+
+    def __init__(self, path: str, ttl: float, per_user: int):
+        self.ttl = ttl
+        self.per_user = max(1, per_user)
+        self.stats = {"stored": 0, "confirmed": 0, "expired": 0, "evicted": 0}
+        self._users = {}  # user_id -> OrderedDict(token -> record), terlama di depan
+        self._last_purge = time.time()
+        self._conn = None
+        if path:
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS pending_proposals ("
+                "token TEXT PRIMARY KEY, user_id INTEGER, sheet_name TEXT, nama TEXT, desa TEXT, "
+                "updates TEXT, expires_at REAL)"
+            )
+            self._conn.execute("DELETE FROM pending_proposals WHERE expires_at < ?", (time.time(),))
+            self._conn.commit()
+            for token, user_id, sheet_name, nama, desa, updates, expires_at in self._conn.execute(
+                "SELECT * FROM pending_proposals ORDER BY expires_at"
+            ):
+                record = (sheet_name, nama, desa, json.loads(updates), expires_at)
+                self._users.setdefault(user_id, OrderedDict())[token] = record
+
+    def __len__(self) -> int:
+        return sum(len(entries) for entries in self._users.values())
+
+    @staticmethod
+    def _delete_statement(tokens: list) -> tuple:
+        return ("DELETE FROM pending_proposals WHERE token = ?", [(t,) for t in tokens])
+
+    def _delete(self, tokens: list) -> None:
+        if tokens:
+            submit_db_write(self._conn, [self._delete_statement(tokens)], "usulan tertunda")
+
+    def flush(self) -> None:
+        """Tunggu sampai semua penulisan SQLite yang sudah diantrekan selesai."""
+        if self._conn is not None:
+            _db_executor.submit(lambda: None).result()
+
+    def _purge_expired(self, now: float) -> None:
+        """Buang usulan kadaluarsa milik semua pengguna, termasuk yang tidak kembali lagi."""
+        expired = []
+        for user_id in list(self._users):
+            entries = self._users[user_id]
+            for token in [t for t, record in entries.items() if record[4] < now]:
+                del entries[token]
+                expired.append(token)
+            if not entries:
+                del self._users[user_id]
+        self.stats["expired"] += len(expired)
+        self._delete(expired)
+        self._last_purge = now
+
+    def put(self, user_id: int, sheet_name: str, nama: str, desa: str, updates: dict) -> str:
+        """Simpan usulan baru dan kembalikan token pendek untuk callback_data."""
+        now = time.time()
+        if now - self._last_purge > self.PURGE_INTERVAL:
+            self._purge_expired(now)
+        token = uuid.uuid4().hex[:10]
+        entries = self._users.setdefault(user_id, OrderedDict())
+        entries[token] = (sheet_name, nama, desa, updates, now + self.ttl)
+        evicted = []
+        while len(entries) > self.per_user:
+            evicted.append(entries.popitem(last=False)[0])
+        self.stats["stored"] += 1
+        self.stats["evicted"] += len(evicted)
+        # Memori diperbarui langsung; SQLite ditulis di thread _db_executor (satu commit)
+        statements = [(
+            "INSERT INTO pending_proposals VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(token, user_id, sheet_name, nama, desa, json.dumps(updates, ensure_ascii=False), now + self.ttl)],
+        )]
+        if evicted:
+            statements.append(self._delete_statement(evicted))
+        submit_db_write(self._conn, statements, "usulan tertunda")
+        return token
+
+    def get(self, user_id: int, token: str):
+        """Record usulan yang masih berlaku milik pengguna ini, atau None."""
+        entries = self._users.get(user_id)
+        record = entries.get(token) if entries else None
+        if record is None:
+            return None
+        if record[4] < time.time():
+            self.discard(user_id, token)
+            self.stats["expired"] += 1
+            return None
+        return record
+
+    def discard(self, user_id: int, token: str) -> None:
+        entries = self._users.get(user_id)
+        if entries and entries.pop(token, None) is not None:
+            if not entries:
+                del self._users[user_id]
+            self._delete([token])
+
+
+pending_proposals = PendingProposalStore(PENDING_PROPOSAL_PATH, PENDING_PROPOSAL_TTL, PENDING_PROPOSAL_PER_USER)
+
+# ======================================================================
+# NAVIGASI AREA -> DESA -> PROPERTI
+# ======================================================================
+# Keyboard setiap halaman disusun sekali per versi data sheet. callback_data hanya
+# berisi ID angka pendek (desa_id dan row_id) yang disimpan bersama mirror sheet, sehingga
+# nama desa yang panjang tidak melewati batas 64 byte Telegram dan tombol lama tetap
+# menunjuk desa/baris yang sama (atau kadaluarsa) setelah restart.
+def _page_slices(items: list) -> list:
+    size = max(1, NAV_PAGE_SIZE)
+    return [items[i:i + size] for i in range(0, len(items), size)] or [[]]
+
+def _pager_row(prefix: str, page: int, pages: int) -> list:
+    """Tombol ◀️ / halaman / ▶️; kosong jika hanya ada satu halaman."""
+    if pages <= 1:
+        return []
+    row = []
+    if page > 0:
+        row.append(InlineKeyboardButton("◀️", callback_data=f"{prefix};{page - 1}"))
+    row.append(InlineKeyboardButton(f"{page + 1}/{pages}", callback_data="noop"))
+    if page < pages - 1:
+        row.append(InlineKeyboardButton("▶️", callback_data=f"{prefix};{page + 1}"))
+    return [row]
+
+
+class NavigationTree:
+    """Desa dan properti satu sheet untuk satu versi data, dengan keyboard per halaman yang sudah jadi."""
+
+    def __init__(self, sheet_index: int, snapshot: SheetSnapshot):
+        desa_ids = snapshot.desa_ids
+        self.version = snapshot.version
+        self.desa_names = {desa_ids[desa]: desa for desa in snapshot.unique_desas}
+        self.row_pages = {}  # row_id -> (desa_id, halaman)
+        nama_col = snapshot.col('Nama')
+
+        desa_items = [(desa, desa_ids[desa]) for desa in snapshot.unique_desas]
+        desa_slices = _page_slices(desa_items)
+        self.desa_pages = []
+        for page, items in enumerate(desa_slices):
+            keyboard = [[InlineKeyboardButton(desa, callback_data=f"view_villas;{sheet_index};{desa_id}")] for desa, desa_id in items]
+            keyboard += _pager_row(f"view_desas;{sheet_index}", page, len(desa_slices))
+            keyboard.append([InlineKeyboardButton("⬅️ Kembali", callback_data="view_areas")])
+            self.desa_pages.append(InlineKeyboardMarkup(keyboard))
+
+        self.villa_pages = {}
+        for position, (desa, desa_id) in enumerate(desa_items):
+            villa_items = [
+                (snapshot.rows[i][nama_col] if nama_col is not None else "", snapshot.row_ids[i])
+                for i in snapshot.desa_rows[desa]
+            ]
+            villa_slices = _page_slices(villa_items)
+            desa_page = position // max(1, NAV_PAGE_SIZE)
+            pages = []
+            for page, items in enumerate(villa_slices):
+                keyboard = [[InlineKeyboardButton(nama, callback_data=f"view_details;{sheet_index};{row_id}")] for nama, row_id in items]
+                keyboard += _pager_row(f"view_villas;{sheet_index};{desa_id}", page, len(villa_slices))
+                keyboard.append([InlineKeyboardButton("⬅️ Kembali", callback_data=f"view_desas;{sheet_index};{desa_page}")])
+                pages.append(InlineKeyboardMarkup(keyboard))
+                for _, row_id in items:
+                    self.row_pages[row_id] = (desa_id, page)
+            self.villa_pages[desa_id] = pages
+
+
+class Navigation:
+    """Pohon navigasi per sheet, dibangun ulang hanya saat versi data berubah.
+
+    ID desa berasal dari snapshot (dipersist di SheetMirror), jadi tombol lama tetap
+    menunjuk desa yang sama setelah data berubah maupun setelah restart.
+    """
+
+    def __init__(self):
+        self._trees = {}  # sheet_index -> NavigationTree
+
+    def tree(self, sheet_index: int, snapshot: SheetSnapshot) -> NavigationTree:
+        tree = self._trees.get(sheet_index)
+        if tree is None or tree.version != snapshot.version:
+            tree = self._trees[sheet_index] = NavigationTree(sheet_index, snapshot)
+        return tree
+
+
+navigation = Navigation()
+
+AREA_KEYBOARD = InlineKeyboardMarkup(
+    [[InlineKeyboardButton(f"📍 {name.split(' ').pop()}", callback_data=f"view_desas;{i}")] for i, name in enumerate(SHEET_NAMES)]
+    + [[InlineKeyboardButton("🔍 IT Review", callback_data="view_it_reviews")]]
 )
-logger = logging.getLogger(__name__)
 
-# --- INISIALISASI KONEKSI ---
-try:
-    gc = gspread.service_account(filename=GOOGLE_CREDENTIALS_FILE)
-    spreadsheet = gc.open_by_key(SPREADSHEET_ID)
-    genai.configure(api_key=GEMINI_API_KEY)
-    logger.info("Koneksi ke Google Sheets dan Gemini AI berhasil.")
-except Exception as e:
-    logger.error(f"Gagal saat inisialisasi: {e}")
-    exit()
+def _callback_int(parts: list, i: int, default: int = None):
+    """Bagian ke-i callback_data sebagai angka; None jika tidak ada/bukan angka (tombol versi lama)."""
+    if len(parts) <= i:
+        return default
+    return int(parts[i]) if parts[i].isdigit() else None
 
 # ======================================================================
 # BAGIAN 1: FUNGSI-FUNGSI NAVIGASI TOMBOL (TIDAK BERUBAH)
 # ======================================================================
+@instrument_handler
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     keyboard = [[InlineKeyboardButton(f"📍 {name.split(' ').pop()}", callback_data=f"view_desas;{i}")] for i, name in enumerate(SHEET_NAMES)]
     # keyboard.append([InlineKeyboardButton("🔍 IT Review", callback_data="view_it_reviews")])
@@ -72,6 +1803,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         reply_markup=reply_markup
     )
 
+@instrument_handler
 async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     query = update.callback_query
     await query.answer()
@@ -80,47 +1812,44 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     action = parts[0]
    
     if action == "view_areas":
-        keyboard = [[InlineKeyboardButton(f"📍 {name.split(' ').pop()}", callback_data=f"view_desas;{i}")] for i, name in enumerate(SHEET_NAMES)]
-        keyboard.append([InlineKeyboardButton("🔍 IT Review", callback_data="view_it_reviews")])
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.edit_message_text("Silakan pilih salah satu area atau IT Review:", reply_markup=reply_markup)
+        await query.edit_message_text("Silakan pilih salah satu area atau IT Review:", reply_markup=AREA_KEYBOARD)
     elif action == "view_desas":
-        sheet_index = int(parts[1])
-        sheet = spreadsheet.worksheet(SHEET_NAMES[sheet_index])
-        all_values = sheet.get_all_values()
-        headers, data_rows = all_values[0], all_values[1:]
-        try:
-            desa_col_index = headers.index('Desa')
-            unique_desas = sorted(list(set(row[desa_col_index] for row in data_rows if row[desa_col_index])))
-            keyboard = [[InlineKeyboardButton(desa, callback_data=f"view_villas;{sheet_index};{desa}")] for desa in unique_desas]
-            keyboard.append([InlineKeyboardButton("⬅️ Kembali", callback_data="view_areas")])
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            await query.edit_message_text(f"Silakan pilih desa di area *{SHEET_NAMES[sheet_index].split(' ').pop()}*:", reply_markup=reply_markup, parse_mode=ParseMode.MARKDOWN)
-        except ValueError:
+        sheet_index, page = int(parts[1]), _callback_int(parts, 2, 0)
+        snapshot = await get_sheet_snapshot_async(SHEET_NAMES[sheet_index])
+        if snapshot.col('Desa') is None:
             await query.edit_message_text("Error: Kolom 'Desa' tidak ditemukan.")
+            return
+        tree = navigation.tree(sheet_index, snapshot)
+        page = min(page or 0, len(tree.desa_pages) - 1)
+        await query.edit_message_text(f"Silakan pilih desa di area *{SHEET_NAMES[sheet_index].split(' ').pop()}*:", reply_markup=tree.desa_pages[page], parse_mode=ParseMode.MARKDOWN)
     elif action == "view_villas":
-        sheet_index, desa_name = int(parts[1]), parts[2]
-        sheet = spreadsheet.worksheet(SHEET_NAMES[sheet_index])
-        all_values = sheet.get_all_values()
-        headers, data_rows = all_values[0], all_values[1:]
-        try:
-            nama_col_index, desa_col_index = headers.index('Nama'), headers.index('Desa')
-            keyboard = [[InlineKeyboardButton(row[nama_col_index], callback_data=f"view_details;{sheet_index};{i}")] for i, row in enumerate(data_rows) if len(row) > desa_col_index and row[desa_col_index] == desa_name]
-            keyboard.append([InlineKeyboardButton("⬅️ Kembali", callback_data=f"view_desas;{sheet_index}")])
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            await query.edit_message_text(f"Properti di desa *{desa_name}*:", reply_markup=reply_markup, parse_mode=ParseMode.MARKDOWN)
-        except ValueError:
+        sheet_index, desa_id, page = int(parts[1]), _callback_int(parts, 2), _callback_int(parts, 3, 0)
+        snapshot = await get_sheet_snapshot_async(SHEET_NAMES[sheet_index])
+        if snapshot.col('Nama') is None or snapshot.col('Desa') is None:
             await query.edit_message_text("Error: Kolom 'Nama' atau 'Desa' tidak ditemukan.")
+            return
+        tree = navigation.tree(sheet_index, snapshot)
+        pages = tree.villa_pages.get(desa_id)
+        if not pages:
+            await query.edit_message_text("Menu ini sudah kadaluarsa. Silakan buka ulang dengan /start.")
+            return
+        page = min(page or 0, len(pages) - 1)
+        await query.edit_message_text(f"Properti di desa *{tree.desa_names[desa_id]}*:", reply_markup=pages[page], parse_mode=ParseMode.MARKDOWN)
     elif action == "view_it_reviews":
         await query.edit_message_text("Silakan ketik kata kunci untuk review IT (misal: 'review IT wifi cepat'). Bot akan scan dan tampilkan hotel yang sesuai.")
     elif action == "view_details":
-        sheet_index, row_index = int(parts[1]), int(parts[2])
-        sheet = spreadsheet.worksheet(SHEET_NAMES[sheet_index])
-        all_values = sheet.get_all_values()
-        headers, data_rows = all_values[0], all_values[1:]
+        sheet_index, row_id = int(parts[1]), int(parts[2])
+        snapshot = await get_sheet_snapshot_async(SHEET_NAMES[sheet_index])
+        headers, data_rows = snapshot.headers, snapshot.rows
+        row_index = snapshot.positions.get(row_id)
+        if row_index is None:
+            await query.edit_message_text("Properti tidak ditemukan, mungkin sudah dihapus dari spreadsheet.")
+            return
         try:
             row_data = data_rows[row_index]
-            desa_name = row_data[headers.index('Desa')]
+            location = navigation.tree(sheet_index, snapshot).row_pages.get(row_id)
+            back_data = f"view_villas;{sheet_index};{location[0]};{location[1]}" if location else f"view_desas;{sheet_index}"
+            back_button = [InlineKeyboardButton("⬅️ Kembali", callback_data=back_data)]
             response_text = "✅ *Detail Properti*\n\n"
             for header, value in zip(headers, row_data):
                 if value:
@@ -133,117 +1862,21 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             # Siapkan usulan pengisian untuk kolom yang kosong
             nama = row_data[headers.index('Nama')]
             desa = row_data[headers.index('Desa')]
-            search_query = f"{nama} {desa} Bali"
-
-            # Peta kolom ke strategi pencarian
-            proposed_updates = {}
-
-            def is_empty(col_name: str) -> bool:
-                try:
-                    return not row_data[headers.index(col_name)].strip()
-                except ValueError:
-                    return True
-
-            # Contact Person (prioritas Google Maps)
-            if is_empty('Contact Person'):
-                contact_info = search_google_maps(search_query + " contact person")
-                # Ambil nomor telepon jika ada
-                m = re.search(r"Telepon:\s*([^\n]+)", contact_info or "")
-                if m:
-                    proposed_updates['Contact Person'] = m.group(1).strip()
-                elif contact_info and contact_info != "Tidak ada informasi ditemukan di Google Maps.":
-                    proposed_updates['Contact Person'] = contact_info[:300]
-
-            # Jumlah Kamar
-            if is_empty('Jumlah Kamar'):
-                rooms_info = search_the_web(search_query + " jumlah kamar OR number of rooms OR room count")
-                # ekstrak angka kamar
-                m = re.search(r"(\d{1,3})\s*(kamar|rooms|room)", rooms_info or "", re.I)
-                if m:
-                    proposed_updates['Jumlah Kamar'] = m.group(1)
-                elif rooms_info:
-                    proposed_updates['Jumlah Kamar'] = clean_text_snippet(rooms_info)[:500]
-
-            # Lokasi (alamat singkat)
-            if is_empty('Lokasi'):
-                maps_info = search_google_maps(search_query)
-                m = re.search(r"Alamat:\s*([^\n]+)", maps_info or "")
-                if m:
-                    proposed_updates['Lokasi'] = m.group(1).strip()
-
-            # Tahun Terbangun (cari pola tahun)
-            if is_empty('Tahun Terbangun'):
-                year_info = search_the_web(search_query + " tahun dibangun OR tahun terbangun OR built in year")
-                m = re.search(r"(19\d{2}|20\d{2})", year_info or "")
-                if m:
-                    proposed_updates['Tahun Terbangun'] = m.group(1)
-
-            # Kecamatan (coba dari alamat)
-            if is_empty('Kecamatan'):
-                maps_info2 = search_google_maps(search_query)
-                addr_match = re.search(r"Alamat:\s*([^\n]+)", maps_info2 or "")
-                if addr_match:
-                    addr = addr_match.group(1)
-                    # Heuristik sederhana: cari kata 'Kecamatan' atau 'Kec.'
-                    kec_match = re.search(r"Kecamatan\s+([^,]+)|Kec\.?\s*([^,]+)", addr, re.I)
-                    if kec_match:
-                        proposed_updates['Kecamatan'] = (kec_match.group(1) or kec_match.group(2)).strip()
-
-            # Jenis (coba dari hasil Maps type atau inferensi nama)
-            if is_empty('Jenis'):
-                maps_info3 = search_google_maps(search_query)
-                # Coba deteksi kata kunci umum
-                jenis = None
-                for kw in ["Villa", "Hotel", "Resort", "Guesthouse", "Homestay", "Hostel"]:
-                    if re.search(rf"\b{kw}\b", nama, re.I):
-                        jenis = kw
-                        break
-                if not jenis:
-                    if "villa" in (maps_info3 or "").lower():
-                        jenis = "Villa"
-                    elif "hotel" in (maps_info3 or "").lower():
-                        jenis = "Hotel"
-                    elif "resort" in (maps_info3 or "").lower():
-                        jenis = "Resort"
-                if jenis:
-                    proposed_updates['Jenis'] = jenis
-
-            # Ulasan Review IT (khusus layanan IT, multi-bahasa)
-            if is_empty('Ulasan Review IT'):
-                it_query = (
-                    search_query
-                    + " review reviews internet wifi wi-fi jaringan network connection connectivity bandwidth signal kecepatan speed lambat slow kencang fast koneksi IT remote work digital nomad streaming video call zoom latency ping Mbps mb/s fiber fibre ethernet 4G 5G LTE"
-                )
-                raw_reviews = search_the_web(it_query)
-                filtered = filter_it_reviews(raw_reviews or "")
-                if filtered:
-                    refined = ai_refine_it_reviews(filtered) or filtered
-                    refined = clean_text_snippet(refined)
-                    sentences = re.split(r"(?<=[.!?])\s+", refined)
-                    proposed_updates['Ulasan Review IT'] = " ".join(sentences[:3])
-
+            proposed_updates = await propose_updates(headers, row_data)
             if proposed_updates:
                 response_text += "\n💡 *Usulan pengisian data kosong*:\n"
                 for k, v in proposed_updates.items():
                     response_text += f"- *{k}*: {v}\n"
 
-                # Simpan usulan di user_data dengan token kecil untuk konfirmasi
-                token = f"save_{uuid.uuid4().hex[:10]}"
-                context.user_data[token] = {
-                    'sheet_index': sheet_index,
-                    'row_index': row_index,
-                    'sheet_name': SHEET_NAMES[sheet_index],
-                    'nama': nama,
-                    'desa': desa,
-                    'updates': proposed_updates,
-                }
+                # Simpan usulan di store terbatas dengan token kecil untuk konfirmasi
+                token = pending_proposals.put(update.effective_user.id, SHEET_NAMES[sheet_index], nama, desa, proposed_updates)
                 keyboard = [
                     [InlineKeyboardButton("💾 Simpan usulan", callback_data=f"confirm_save;{token}")],
                     [InlineKeyboardButton("❌ Abaikan", callback_data=f"cancel_save;{token}")],
-                    [InlineKeyboardButton("⬅️ Kembali", callback_data=f"view_villas;{sheet_index};{desa_name}")],
+                    back_button,
                 ]
             else:
-                keyboard = [[InlineKeyboardButton("⬅️ Kembali", callback_data=f"view_villas;{sheet_index};{desa_name}")]]
+                keyboard = [back_button]
 
             reply_markup = InlineKeyboardMarkup(keyboard)
             await query.edit_message_text(response_text, reply_markup=reply_markup, parse_mode=ParseMode.MARKDOWN, disable_web_page_preview=True)
@@ -252,59 +1885,143 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             await query.edit_message_text("Error: Gagal mengambil detail data.")
     elif action == "confirm_save":
         token = parts[1] if len(parts) > 1 else None
-        pending = context.user_data.get(token)
+        pending = pending_proposals.get(update.effective_user.id, token)
         if not pending:
             await query.edit_message_text("Tidak ada data usulan untuk disimpan atau sudah kadaluarsa.")
             return
+        sheet_name, nama, desa, updates, _ = pending
         try:
-            save_additional_data(pending['sheet_name'], pending['nama'], pending['desa'], pending['updates'])
-            del context.user_data[token]
-            await query.edit_message_text("✅ Data berhasil disimpan ke spreadsheet.")
+            await run_blocking("sheets", save_additional_data, sheet_name, nama, desa, updates)
+            pending_proposals.discard(update.effective_user.id, token)
+            pending_proposals.stats["confirmed"] += 1
+            if SHEET_WRITE_BEHIND:
+                await query.edit_message_text("✅ Data diterima dan akan disimpan ke spreadsheet dalam beberapa detik.")
+            else:
+                await query.edit_message_text("✅ Data berhasil disimpan ke spreadsheet.")
         except Exception as e:
             logger.error(f"Gagal menyimpan data: {e}")
             await query.edit_message_text("❌ Gagal menyimpan data.")
     elif action == "cancel_save":
-        token = parts[1] if len(parts) > 1 else None
-        if token in context.user_data:
-            del context.user_data[token]
+        pending_proposals.discard(update.effective_user.id, parts[1] if len(parts) > 1 else None)
         await query.edit_message_text("❎ Penyimpanan dibatalkan oleh pengguna.")
+    elif action == "cancel_scan":
+        job = _scan_jobs.get(parts[1] if len(parts) > 1 else None)
+        if job is None:
+            await query.edit_message_text("Scan review IT sudah selesai atau tidak ditemukan.")
+            return
+        job.cancelled.set()
 
 
 # ======================================================================
 # BAGIAN 2: FUNGSI-FUNGSI AI AGENT DENGAN KEMAMPUAN PENCARIAN
 # ======================================================================
 
-def get_all_data_as_context():
-    """Mengambil semua data dari semua sheet dan memformatnya untuk AI."""
-    context_string = ""
+# Kolom yang lebih menentukan relevansi diberi bobot lebih besar saat pengindeksan
+CONTEXT_FIELD_WEIGHTS = {"Nama": 3, "Desa": 2, "Kecamatan": 2, "Jenis": 1}
+CONTEXT_STOPWORDS = {
+    "dan", "yang", "di", "ke", "dari", "ini", "itu", "untuk", "dengan", "the", "and", "is", "of", "in", "for",
+    "apa", "apakah", "berapa", "bagaimana", "dimana", "mana", "siapa", "cari", "carikan", "info",
+    "informasi", "tolong", "saya", "mau", "ingin", "tentang", "ada", "bali", "what", "where", "how", "which",
+}
+
+def tokenize_context_text(text: str) -> list:
+    return [t for t in re.findall(r"[a-z0-9]+", (text or "").lower()) if (len(t) > 1 or t.isdigit()) and t not in CONTEXT_STOPWORDS]
+
+
+class SheetRetrievalIndex:
+    """Indeks BM25 atas baris properti dari semua snapshot sheet."""
+
+    def __init__(self, snapshots: list):
+        self.versions = tuple(snapshot.version for snapshot in snapshots)
+        self.rows = []  # (snapshot, row)
+        self.lexical = BM25Index()
+        for snapshot in snapshots:
+            for row in snapshot.rows:
+                tokens = []
+                for header, value in zip(snapshot.headers, row):
+                    tokens.extend(tokenize_context_text(value) * CONTEXT_FIELD_WEIGHTS.get(header, 1))
+                self.lexical.add(len(self.rows), tokens)
+                self.rows.append((snapshot, row))
+
+
+_retrieval_index = None
+
+def _format_context_row(snapshot: SheetSnapshot, row: list) -> str:
+    values = "; ".join(f"{header}: {value}" for header, value in zip(snapshot.headers, row) if value)
+    return f"[{snapshot.sheet_name.split(' ').pop()}] {values}"
+
+def get_all_data_as_context(question: str = "") -> str:
+    """Memformat data spreadsheet untuk AI: seluruh baris untuk dataset kecil, selain itu hanya baris paling relevan."""
+    import gspread
+    global _retrieval_index
+    snapshots = []
     for sheet_name in SHEET_NAMES:
         try:
-            sheet = spreadsheet.worksheet(sheet_name)
-            records = sheet.get_all_records()
-            context_string += f"Data dari area {sheet_name.split(' ').pop()}:\n{str(records)}\n\n"
+            snapshots.append(get_sheet_snapshot(sheet_name))
         except gspread.exceptions.WorksheetNotFound:
             logger.warning(f"Sheet '{sheet_name}' tidak ditemukan.")
-    return context_string
+    if not snapshots:
+        return ""
+
+    # Skema ringkas dan ringkasan per area selalu dikirim
+    lines = []
+    for snapshot in snapshots:
+        area = snapshot.sheet_name.split(' ').pop()
+        lines.append(f"Area {area}: {len(snapshot.rows)} properti. Kolom: {' | '.join(snapshot.headers)}. Desa: {', '.join(snapshot.unique_desas)}")
+    total_rows = sum(len(snapshot.rows) for snapshot in snapshots)
+
+    if total_rows <= AI_CONTEXT_FULL_MAX_ROWS:
+        lines.append("\nSeluruh data:")
+        lines.extend(_format_context_row(snapshot, row) for snapshot in snapshots for row in snapshot.rows)
+        return "\n".join(lines)
+
+    index = _retrieval_index
+    if index is None or index.versions != tuple(snapshot.version for snapshot in snapshots):
+        index = _retrieval_index = SheetRetrievalIndex(snapshots)
+    hits = index.lexical.search(tokenize_context_text(question), AI_CONTEXT_TOP_K)
+    if hits:
+        lines.append(f"\nBaris paling relevan dengan pertanyaan ({len(hits)} dari {total_rows}):")
+        lines.extend(_format_context_row(*index.rows[doc_id]) for doc_id, _, _ in hits)
+    else:
+        lines.append(f"\nTidak ada baris yang cocok dengan pertanyaan (total {total_rows} baris).")
+    return "\n".join(lines)
+
+# Jawaban alat pencarian saat gagal; propose_updates memperlakukannya sebagai hasil kosong
+SEARCH_WEB_ERROR = "Kesalahan saat mencari di internet."
+SEARCH_MAPS_ERROR = "Kesalahan saat mencari di Google Maps."
 
 def search_the_web(query: str) -> str:
     """Fungsi yang menjalankan pencarian Google Web menggunakan SerpApi."""
+    with timed("backend", backend="serpapi", op="search_the_web") as span:
+        return _search_the_web(query, span)
+
+def _search_the_web(query: str, span: Span) -> str:
     try:
-        params = {"q": query, "api_key": SERPAPI_API_KEY, "engine": "google", "gl": "id", "hl": "id"}
-        search = GoogleSearch(params)
-        results = search.get_dict()
+        results = serpapi_search("google", query)
         snippets = [res.get("snippet", "") for res in results.get("organic_results", [])[:5] if res.get("snippet")]
         if "answer_box" in results: snippets.append(results["answer_box"].get("snippet", ""))
         return "\n".join(snippets) if snippets else "Tidak ada hasil pencarian web yang relevan."
     except Exception as e:
         logger.error(f"Error saat pencarian web: {e}")
-        return "Kesalahan saat mencari di internet."
+        span.error = True
+        return SEARCH_WEB_ERROR
+
+async def search_the_web_async(query: str) -> str:
+    """Versi async search_the_web yang berjalan di thread pool SerpApi."""
+    try:
+        return await run_blocking("serpapi", search_the_web, query)
+    except (asyncio.TimeoutError, BackendUnavailable) as e:
+        logger.error(f"Pencarian web gagal ({str(e) or 'timeout'}): '{query}'")
+        return SEARCH_WEB_ERROR
 
 def search_google_maps(query: str) -> str:
     """Fungsi yang menjalankan pencarian Google Maps menggunakan SerpApi."""
+    with timed("backend", backend="serpapi", op="search_google_maps") as span:
+        return _search_google_maps(query, span)
+
+def _search_google_maps(query: str, span: Span) -> str:
     try:
-        params = {"q": query, "api_key": SERPAPI_API_KEY, "engine": "google_maps", "gl": "id", "hl": "id"}
-        search = GoogleSearch(params)
-        results = search.get_dict()
+        results = serpapi_search("google_maps", query)
         if "local_results" in results and results["local_results"]:
             place = results["local_results"][0]
             info = [
@@ -318,7 +2035,16 @@ def search_google_maps(query: str) -> str:
         return "Tidak ada informasi ditemukan di Google Maps."
     except Exception as e:
         logger.error(f"Error saat pencarian Google Maps: {e}")
-        return "Kesalahan saat mencari di Google Maps."
+        span.error = True
+        return SEARCH_MAPS_ERROR
+
+async def search_google_maps_async(query: str) -> str:
+    """Versi async search_google_maps yang berjalan di thread pool SerpApi."""
+    try:
+        return await run_blocking("serpapi", search_google_maps, query)
+    except (asyncio.TimeoutError, BackendUnavailable) as e:
+        logger.error(f"Pencarian Google Maps gagal ({str(e) or 'timeout'}): '{query}'")
+        return SEARCH_MAPS_ERROR
 
 def filter_it_reviews(text: str) -> str:
     """Ambil hanya kalimat yang berkaitan dengan layanan IT (internet/wifi/jaringan)."""
@@ -347,6 +2073,17 @@ def clean_text_snippet(text: str) -> str:
     cleaned = re.sub(r"\s+", " ", cleaned).strip()
     return cleaned
 
+@functools.lru_cache(maxsize=None)
+def get_gemini_model(with_tools: bool = False):
+    """Objek GenerativeModel dibuat sekali per konfigurasi lalu dipakai ulang."""
+    genai = backends["gemini"].get()
+    if with_tools:
+        return genai.GenerativeModel(model_name=GEMINI_MODEL_NAME, tools=GEMINI_TOOLS)
+    return genai.GenerativeModel(model_name=GEMINI_MODEL_NAME)
+
+ai_refine_memo = TTLCache(AI_REFINE_CACHE_SIZE, AI_REFINE_CACHE_TTL)
+ai_refine_flight = SingleFlight("gemini")
+
 def ai_refine_it_reviews(text: str) -> str:
     """Gunakan AI untuk mengekstrak dan merangkum poin terkait IT dari teks multi-bahasa."""
     try:
@@ -356,66 +2093,413 @@ def ai_refine_it_reviews(text: str) -> str:
             "Anda adalah asisten yang mengekstrak ulasan terkait layanan IT (WiFi/internet/network/connection/bandwidth/latency/signal) dari teks multi-bahasa. "
             "Ambil hanya kalimat yang relevan IT, lalu rangkum singkat (1-5 kalimat), jelas dan faktual. Jangan sertakan link atau informasi yang tidak relevan. Teks:\n\n" + text
         )
-        model = genai.GenerativeModel(model_name=GEMINI_MODEL_NAME)
-        resp = model.generate_content(prompt)
-        refined = (resp.text or "").strip()
-        return clean_text_snippet(refined)
+        memo_key = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        refined = ai_refine_memo.get(memo_key)
+        if refined is not None:
+            return refined
+        return ai_refine_flight.do(memo_key, _ai_refine_fetch, memo_key, prompt)
     except Exception as e:
         logger.warning(f"AI refine IT reviews gagal, gunakan fallback regex. Error: {e}")
         return clean_text_snippet(text)
 
+def _ai_refine_fetch(memo_key: str, prompt: str) -> str:
+    with timed("backend", backend="gemini", op="generate_content"):
+        resp = call_with_quota("gemini", guarded_call, "gemini", get_gemini_model().generate_content, prompt)
+    refined = clean_text_snippet((resp.text or "").strip())
+    ai_refine_memo.put(memo_key, refined)
+    return refined
+
+async def ai_refine_it_reviews_async(text: str) -> str:
+    """Versi async ai_refine_it_reviews; jika Gemini timeout, pakai teks yang sudah dibersihkan."""
+    try:
+        return await run_blocking("gemini", ai_refine_it_reviews, text)
+    except (asyncio.TimeoutError, BackendUnavailable):
+        logger.warning("AI refine IT reviews timeout, gunakan fallback regex.")
+        return clean_text_snippet(text)
+
+async def summarize_it_review(text: str, keyword: str = "") -> str:
+    """Saring kalimat terkait IT, rangkum dengan AI lalu ambil 2-3 kalimat agar padat.
+
+    String kosong jika tidak ada kalimat IT atau `keyword` tidak muncul di dalamnya.
+    """
+    filtered = filter_it_reviews(text or "")
+    if not filtered or (keyword and keyword.lower() not in filtered.lower()):
+        return ""
+    refined = clean_text_snippet(await ai_refine_it_reviews_async(filtered) or filtered)
+    return " ".join(re.split(r"(?<=[.!?])\s+", refined)[:3])
+
+# ======================================================================
+# PERENCANA PENGAYAAN DATA KOLOM KOSONG
+# ======================================================================
+IT_REVIEW_QUERY_SUFFIX = (
+    " review reviews internet wifi wi-fi jaringan network connection connectivity bandwidth signal kecepatan speed lambat slow kencang fast koneksi IT remote work digital nomad streaming video call zoom latency ping Mbps mb/s fiber fibre ethernet 4G 5G LTE"
+)
+
+def _extract_contact(info: str, nama: str):
+    # Ambil nomor telepon jika ada
+    m = re.search(r"Telepon:\s*([^\n]+)", info or "")
+    if m:
+        return m.group(1).strip()
+    if info and info != "Tidak ada informasi ditemukan di Google Maps.":
+        return info[:300]
+    return None
+
+def _extract_rooms(info: str, nama: str):
+    m = re.search(r"(\d{1,3})\s*(kamar|rooms|room)", info or "", re.I)
+    if m:
+        return m.group(1)
+    if info:
+        return clean_text_snippet(info)[:500]
+    return None
+
+def _extract_lokasi(info: str, nama: str):
+    m = re.search(r"Alamat:\s*([^\n]+)", info or "")
+    return m.group(1).strip() if m else None
+
+def _extract_year(info: str, nama: str):
+    m = re.search(r"(19\d{2}|20\d{2})", info or "")
+    return m.group(1) if m else None
+
+def _extract_kecamatan(info: str, nama: str):
+    addr_match = re.search(r"Alamat:\s*([^\n]+)", info or "")
+    if not addr_match:
+        return None
+    # Heuristik sederhana: cari kata 'Kecamatan' atau 'Kec.'
+    kec_match = re.search(r"Kecamatan\s+([^,]+)|Kec\.?\s*([^,]+)", addr_match.group(1), re.I)
+    if kec_match:
+        return (kec_match.group(1) or kec_match.group(2)).strip()
+    return None
+
+def _extract_jenis(info: str, nama: str):
+    # Coba deteksi kata kunci umum dari nama, lalu dari hasil Maps
+    for kw in ["Villa", "Hotel", "Resort", "Guesthouse", "Homestay", "Hostel"]:
+        if re.search(rf"\b{kw}\b", nama, re.I):
+            return kw
+    lowered = (info or "").lower()
+    for kw in ["Villa", "Hotel", "Resort"]:
+        if kw.lower() in lowered:
+            return kw
+    return None
+
+async def _extract_it_review(info: str, nama: str):
+    # Ulasan Review IT (khusus layanan IT, multi-bahasa)
+    return await summarize_it_review(info) or None
+
+# Kolom -> (mesin pencarian, akhiran kueri, ekstraktor). Urutan menentukan urutan usulan.
+ENRICHMENT_PLAN = {
+    'Contact Person': ("maps", " contact person", _extract_contact),
+    'Jumlah Kamar': ("web", " jumlah kamar OR number of rooms OR room count", _extract_rooms),
+    'Lokasi': ("maps", "", _extract_lokasi),
+    'Tahun Terbangun': ("web", " tahun dibangun OR tahun terbangun OR built in year", _extract_year),
+    'Kecamatan': ("maps", "", _extract_kecamatan),
+    'Jenis': ("maps", "", _extract_jenis),
+    'Ulasan Review IT': ("web", IT_REVIEW_QUERY_SUFFIX, _extract_it_review),
+}
+
+ENRICHMENT_SEARCHES = {
+    "web": search_the_web_async,
+    "maps": search_google_maps_async,
+}
+
+def plan_enrichment(headers: list, row_data: list) -> dict:
+    """Tentukan pencarian untuk setiap kolom kosong: {kolom: (mesin, kueri)}."""
+    nama = row_data[headers.index('Nama')]
+    desa = row_data[headers.index('Desa')]
+    search_query = f"{nama} {desa} Bali"
+    plan = {}
+    for col_name, (engine, suffix, _) in ENRICHMENT_PLAN.items():
+        try:
+            col_index = headers.index(col_name)
+            empty = col_index >= len(row_data) or not row_data[col_index].strip()
+        except ValueError:
+            empty = True
+        if empty:
+            plan[col_name] = (engine, search_query + suffix)
+    return plan
+
+class EnrichmentSearchFailed(Exception):
+    """Sebagian pencarian untuk satu baris gagal, sehingga usulannya belum lengkap."""
+
+    def __init__(self, failed: int, total: int):
+        super().__init__(f"{failed} dari {total} pencarian gagal")
+        self.failed = failed
+        self.total = total
+
+
+async def propose_updates(headers: list, row_data: list, strict: bool = False) -> dict:
+    """Cari usulan isi kolom kosong; setiap kueri unik dijalankan sekali dan semuanya paralel.
+
+    Dengan `strict`, pencarian yang gagal menimbulkan EnrichmentSearchFailed alih-alih
+    dilewati, agar pengayaan massal tidak menandai baris itu selesai.
+    """
+    plan = plan_enrichment(headers, row_data)
+    if not plan:
+        return {}
+    nama = row_data[headers.index('Nama')]
+    searches = list(dict.fromkeys(plan.values()))
+    results = await asyncio.gather(*(ENRICHMENT_SEARCHES[engine](q) for engine, q in searches))
+    failed = sum(result in (SEARCH_WEB_ERROR, SEARCH_MAPS_ERROR) for result in results)
+    if failed and strict:
+        raise EnrichmentSearchFailed(failed, len(searches))
+    # Pencarian yang gagal (timeout, breaker terbuka) dilewati: kolom lain tetap diusulkan
+    shared = {search: "" if result in (SEARCH_WEB_ERROR, SEARCH_MAPS_ERROR) else result
+              for search, result in zip(searches, results)}
+
+    async def extract(col_name: str):
+        value = ENRICHMENT_PLAN[col_name][2](shared[plan[col_name]], nama)
+        if inspect.isawaitable(value):
+            value = await value
+        return col_name, value
+
+    extracted = await asyncio.gather(*(extract(col_name) for col_name in plan))
+    return {col_name: value for col_name, value in extracted if value}
+
+# Alat pencarian yang bisa digunakan oleh AI
+GEMINI_TOOLS = [{"function_declarations": [
+    {
+        "name": "search_google_maps",
+        "description": "Gunakan ini SEBAGAI PRIORITAS untuk mencari info kontak, nomor telepon, alamat, atau website resmi.",
+        "parameters": {"type": "OBJECT", "properties": {"query": {"type": "STRING", "description": "Nama properti dan lokasinya. Contoh: 'Villa Damai Sidemen'"}}, "required": ["query"]}
+    },
+    {
+        "name": "search_the_web",
+        "description": "Gunakan ini untuk mencari informasi subjektif seperti ulasan pelanggan dari Agoda, Booking.com, dll.",
+        "parameters": {"type": "OBJECT", "properties": {"query": {"type": "STRING", "description": "Kueri pencarian spesifik. Contoh: 'ulasan Villa Damai Sidemen booking.com'"}}, "required": ["query"]}
+    },
+    {
+        "name": "search_traveloka",
+        "description": "Gunakan ini untuk mencari informasi dari Traveloka seperti review, contact, jumlah kamar.",
+        "parameters": {"type": "OBJECT", "properties": {"query": {"type": "STRING", "description": "Kueri pencarian spesifik untuk Traveloka."}}, "required": ["query"]}
+    },
+    {
+        "name": "search_agoda",
+        "description": "Gunakan ini untuk mencari informasi dari Agoda seperti review, harga, dan fasilitas.",
+        "parameters": {"type": "OBJECT", "properties": {"query": {"type": "STRING", "description": "Kueri pencarian spesifik untuk Agoda."}}, "required": ["query"]}
+    },
+    {
+        "name": "search_tiketcom",
+        "description": "Gunakan ini untuk mencari informasi dari Tiket.com seperti review dan harga.",
+        "parameters": {"type": "OBJECT", "properties": {"query": {"type": "STRING", "description": "Kueri pencarian spesifik untuk Tiket.com."}}, "required": ["query"]}
+    },
+    {
+        "name": "search_bookingcom",
+        "description": "Gunakan ini untuk mencari informasi dari Booking.com seperti review dan fasilitas.",
+        "parameters": {"type": "OBJECT", "properties": {"query": {"type": "STRING", "description": "Kueri pencarian spesifik untuk Booking.com."}}, "required": ["query"]}
+    }
+]}]
+
+def _site_search(site: str):
+    async def handler(query: str) -> str:
+        return await search_the_web_async(f"site:{site} {query}")
+    return handler
+
+# Nama alat -> (label log, handler async)
+TOOL_HANDLERS = {
+    "search_google_maps": ("Google Maps", search_google_maps_async),
+    "search_the_web": ("Google Web", search_the_web_async),
+    "search_traveloka": ("Traveloka Search", _site_search("traveloka.com")),
+    "search_agoda": ("Agoda Search", _site_search("agoda.com")),
+    "search_tiketcom": ("Tiket.com Search", _site_search("tiket.com")),
+    "search_bookingcom": ("Booking.com Search", _site_search("booking.com")),
+}
+
+AI_BUDGET_EXHAUSTED_RESULT = "Tidak dijalankan: batas langkah atau waktu AI Agent tercapai. Jawab dengan informasi yang sudah ada."
+TOOL_TIMEOUT_RESULT = "Kesalahan: waktu pencarian habis."
+# Hasil alat yang berarti jawaban AI disusun dari data tidak lengkap (tidak boleh di-cache)
+DEGRADED_TOOL_RESULTS = {SEARCH_WEB_ERROR, SEARCH_MAPS_ERROR, TOOL_TIMEOUT_RESULT, AI_BUDGET_EXHAUSTED_RESULT}
+
+# Waktu minimal (detik) untuk satu giliran Gemini yang dimulai saat anggaran hampir/sudah habis
+AI_ANSWER_GRACE = 10.0
+
+def _turn_deadline(deadline: float) -> float:
+    # Jawaban akhir tetap diberi waktu minimal meskipun anggaran sudah habis; tenggat ini
+    # dipakai bersama oleh percobaan streaming dan fallback-nya, bukan diberikan ulang
+    return max(deadline, time.monotonic() + AI_ANSWER_GRACE)
+
+def _remaining_budget(turn_deadline: float) -> float:
+    remaining = turn_deadline - time.monotonic()
+    if remaining <= 0:
+        raise asyncio.TimeoutError("Anggaran waktu AI Agent habis")
+    return min(GEMINI_TIMEOUT, remaining)
+
+async def dispatch_tool_call(function_call, deadline: float) -> str:
+    """Jalankan satu panggilan alat dari Gemini lewat TOOL_HANDLERS."""
+    tool = TOOL_HANDLERS.get(function_call.name)
+    if tool is None:
+        logger.warning(f"AI meminta alat yang tidak dikenal: {function_call.name}")
+        return f"Alat '{function_call.name}' tidak tersedia."
+    label, handler = tool
+    query = function_call.args.get('query', '')
+    logger.info(f"AI -> {label}: '{query}'")
+    try:
+        return await asyncio.wait_for(handler(query), max(deadline - time.monotonic(), 0.1))
+    except asyncio.TimeoutError:
+        logger.warning(f"AI -> {label} melewati batas waktu: '{query}'")
+        return TOOL_TIMEOUT_RESULT
+
+def _function_response_parts(calls: list, results: list) -> list:
+    from google.generativeai import protos
+    return [
+        protos.Part(function_response=protos.FunctionResponse(name=call.name, response={"result": result}))
+        for call, result in zip(calls, results)
+    ]
+
+def normalize_question(question: str) -> str:
+    return re.sub(r"\s+", " ", question).strip().strip("?!. ").lower()
+
+ai_answer_cache = TTLCache(AI_ANSWER_CACHE_SIZE, AI_ANSWER_CACHE_TTL)
+
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+class StreamingReply:
+    """Satu pesan balasan yang diperbarui bertahap dengan jeda edit adaptif.
+
+    Jeda dimulai dari AI_STREAM_EDIT_INTERVAL (3x untuk grup), berlipat saat Telegram
+    membalas RetryAfter dan perlahan turun lagi setelah edit berhasil.
+    """
+
+    PLACEHOLDER = "⏳ Sedang menyiapkan jawaban..."
+    CURSOR = " ▌"
+
+    def __init__(self, source_message):
+        self.source = source_message
+        self.message = None
+        self.shown = ""
+        self.base_interval = AI_STREAM_EDIT_INTERVAL * (3 if getattr(source_message, "chat_id", 0) < 0 else 1)
+        self.interval = self.base_interval
+        self._next_edit = 0.0
+        self.previewing = True
+
+    async def start(self) -> None:
+        self.message = await self.source.reply_text(self.PLACEHOLDER)
+        self.shown = self.PLACEHOLDER
+        self._next_edit = time.monotonic() + self.interval
+
+    async def _edit(self, text: str) -> bool:
+        try:
+            await self.message.edit_text(text)
+        except RetryAfter as e:
+            retry = e.retry_after
+            retry = retry.total_seconds() if hasattr(retry, "total_seconds") else float(retry)
+            self.interval = min(AI_STREAM_MAX_EDIT_INTERVAL, max(self.interval * 2, retry))
+            self._next_edit = time.monotonic() + max(self.interval, retry)
+            metrics.inc("telegram_flood_waits_total")
+            logger.warning(f"Flood limit Telegram saat streaming, jeda edit jadi {self.interval:.1f} detik.")
+            return False
+        except BadRequest as e:
+            if "not modified" not in str(e).lower():
+                raise
+        self.shown = text
+        self.interval = max(self.base_interval, self.interval * 0.8)
+        self._next_edit = time.monotonic() + self.interval
+        return True
+
+    async def update(self, text: str, cursor: bool = True) -> None:
+        """Tampilkan teks parsial jika jeda edit sudah lewat; selain itu dilewati.
+
+        Error Telegram di sini tidak diteruskan: itu bukan kegagalan stream Gemini dan
+        tidak boleh memicu pengulangan. Pratinjau dihentikan dan jawaban dikirim finish().
+        """
+        if self.message is None or not self.previewing or not text or time.monotonic() < self._next_edit:
+            return
+        suffix = self.CURSOR if cursor else ""
+        preview = text[:TELEGRAM_MESSAGE_LIMIT - len(suffix)] + suffix
+        if preview != self.shown:
+            try:
+                await self._edit(preview)
+            except TelegramError as e:
+                self.previewing = False
+                metrics.inc("telegram_stream_edit_errors_total")
+                logger.warning(f"Edit pratinjau streaming gagal, pratinjau dihentikan: {e}")
+
+    async def finish(self, text: str) -> None:
+        """Tulis jawaban final; teks di atas batas Telegram dilanjutkan di pesan berikutnya."""
+        chunks = [text[i:i + TELEGRAM_MESSAGE_LIMIT] for i in range(0, len(text), TELEGRAM_MESSAGE_LIMIT)] or [text]
+        delivered = False
+        if self.message is not None:
+            for _ in range(2):
+                wait = self._next_edit - time.monotonic()
+                if wait > 0 and self.interval > self.base_interval:
+                    # Hanya tunggu jika sedang kena flood limit; jika tidak, edit final langsung
+                    await asyncio.sleep(min(wait, AI_STREAM_MAX_EDIT_INTERVAL))
+                try:
+                    if await self._edit(chunks[0]):
+                        delivered = True
+                        break
+                except Exception as e:
+                    logger.warning(f"Edit jawaban final gagal, kirim sebagai pesan baru: {e}")
+                    break
+        if not delivered:
+            await self.source.reply_text(chunks[0])
+        for chunk in chunks[1:]:
+            await self.source.reply_text(chunk)
+
+
+def _chunk_text(chunk) -> str:
+    # Chunk berisi function_call tidak punya teks; `chunk.text` akan melempar ValueError
+    return "".join(part.text for part in chunk.parts if part.text)
+
+async def _consume_stream(response, reply: StreamingReply) -> None:
+    text = ""
+    async for chunk in response:
+        text += _chunk_text(chunk)
+        await reply.update(text)
+
+async def send_to_gemini(chat, content, deadline: float, reply: StreamingReply = None, **kwargs):
+    """Kirim satu giliran ke Gemini. Dengan `reply`, teks dialirkan ke Telegram selagi diterima;
+    jika streaming gagal, giliran itu diulang sekali tanpa streaming dalam sisa waktu yang sama.
+
+    Timeout (anggaran habis) dan Gemini yang tidak tersedia tidak diulang.
+    """
+    turn_deadline = _turn_deadline(deadline)
+    if reply is not None:
+        started = False
+        try:
+            response = await run_async(
+                "gemini", chat.send_message_async, content, stream=True, timeout=_remaining_budget(turn_deadline), **kwargs
+            )
+            started = True
+            await asyncio.wait_for(_consume_stream(response, reply), _remaining_budget(turn_deadline))
+            return response
+        except (asyncio.TimeoutError, BackendUnavailable):
+            raise
+        except Exception as e:
+            logger.warning(f"Streaming Gemini gagal, ulangi tanpa streaming: {e}")
+            metrics.inc("ai_stream_fallbacks_total")
+            if started:
+                chat.rewind()
+    return await run_async("gemini", chat.send_message_async, content, timeout=_remaining_budget(turn_deadline), **kwargs)
+
+@instrument_handler
 async def handle_ai_query(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user_question = update.message.text.lower()
     if 'review it' in user_question:
         keyword = user_question.replace('review it', '').strip()
-        await scan_it_reviews(update, keyword)
+        await scan_it_reviews(update, context, keyword)
         return
     
     """Menangani pertanyaan pengguna dengan model AI yang bisa menggunakan alat pencarian."""
     user_question = update.message.text
     await context.bot.send_chat_action(chat_id=update.effective_chat.id, action=ChatAction.TYPING)
 
-    spreadsheet_data = get_all_data_as_context()
+    try:
+        spreadsheet_data = await run_blocking("sheets", get_all_data_as_context, user_question)
+    except asyncio.TimeoutError:
+        spreadsheet_data = ""
     if not spreadsheet_data:
         await update.message.reply_text("Maaf, database tidak dapat diakses.")
         return
 
-    # Definisikan DUA alat yang bisa digunakan oleh AI
-    tools = [{"function_declarations": [
-        {
-            "name": "search_google_maps",
-            "description": "Gunakan ini SEBAGAI PRIORITAS untuk mencari info kontak, nomor telepon, alamat, atau website resmi.",
-            "parameters": {"type": "OBJECT", "properties": {"query": {"type": "STRING", "description": "Nama properti dan lokasinya. Contoh: 'Villa Damai Sidemen'"}}, "required": ["query"]}
-        },
-        {
-            "name": "search_the_web",
-            "description": "Gunakan ini untuk mencari informasi subjektif seperti ulasan pelanggan dari Agoda, Booking.com, dll.",
-            "parameters": {"type": "OBJECT", "properties": {"query": {"type": "STRING", "description": "Kueri pencarian spesifik. Contoh: 'ulasan Villa Damai Sidemen booking.com'"}}, "required": ["query"]}
-        },
-        {
-            "name": "search_traveloka",
-            "description": "Gunakan ini untuk mencari informasi dari Traveloka seperti review, contact, jumlah kamar.",
-            "parameters": {"type": "OBJECT", "properties": {"query": {"type": "STRING", "description": "Kueri pencarian spesifik untuk Traveloka."}}, "required": ["query"]}
-        },
-        {
-            "name": "search_agoda",
-            "description": "Gunakan ini untuk mencari informasi dari Agoda seperti review, harga, dan fasilitas.",
-            "parameters": {"type": "OBJECT", "properties": {"query": {"type": "STRING", "description": "Kueri pencarian spesifik untuk Agoda."}}, "required": ["query"]}
-        },
-        {
-            "name": "search_tiketcom",
-            "description": "Gunakan ini untuk mencari informasi dari Tiket.com seperti review dan harga.",
-            "parameters": {"type": "OBJECT", "properties": {"query": {"type": "STRING", "description": "Kueri pencarian spesifik untuk Tiket.com."}}, "required": ["query"]}
-        },
-        {
-            "name": "search_bookingcom",
-            "description": "Gunakan ini untuk mencari informasi dari Booking.com seperti review dan fasilitas.",
-            "parameters": {"type": "OBJECT", "properties": {"query": {"type": "STRING", "description": "Kueri pencarian spesifik untuk Booking.com."}}, "required": ["query"]}
-        }
-    ]}]
-
-    model = genai.GenerativeModel(model_name=GEMINI_MODEL_NAME, tools=tools)
-    chat = model.start_chat()
+    data_version = current_data_version()
+    cache_key = (normalize_question(user_question), data_version)
+    cached_answer = ai_answer_cache.get(cache_key)
+    if cached_answer is not None:
+        logger.info(f"Jawaban AI dari cache (hit rate {ai_answer_cache.hit_rate():.0%}).")
+        await update.message.reply_text(cached_answer)
+        return
+
+    await ensure_backend("gemini")
+    chat = get_gemini_model(with_tools=True).start_chat()
     prompt = f"""Anda adalah AI Agent properti di Bali. Jawab berdasarkan data spreadsheet dulu. Jika data tidak ada atau kosong, gunakan alat yang sesuai.
     - Untuk KONTAK, ALAMAT, TELEPON -> Gunakan `search_google_maps`.
     - Untuk ULASAN PELANGGAN -> Gunakan `search_the_web`.
@@ -431,114 +2515,770 @@ async def handle_ai_query(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     Pertanyaan Pengguna: "{user_question}"
     """
 
+    reply = None
+    if AI_STREAM_REPLIES:
+        reply = StreamingReply(update.message)
+        try:
+            await reply.start()
+        except Exception as e:
+            logger.warning(f"Placeholder jawaban gagal dikirim, pakai balasan tunggal: {e}")
+            reply = None
+
     try:
-        response = await chat.send_message_async(prompt)
-        response_part = response.parts[0]
-
-        while response_part.function_call:
-            function_call = response_part.function_call
-            tool_name = function_call.name
-            query = function_call.args['query']
-            search_result = ""
-
-            if tool_name == "search_google_maps":
-                logger.info(f"AI -> Google Maps: '{query}'")
-                search_result = search_google_maps(query)
-            elif tool_name == "search_the_web":
-                logger.info(f"AI -> Google Web: '{query}'")
-                search_result = search_the_web(query)
-            elif tool_name == "search_traveloka":
-                logger.info(f"AI -> Traveloka Search: '{query}'")
-                search_result = search_the_web(f"site:traveloka.com {query}")
-            elif tool_name == "search_agoda":
-                logger.info(f"AI -> Agoda Search: '{query}'")
-                search_result = search_the_web(f"site:agoda.com {query}")
-            elif tool_name == "search_tiketcom":
-                logger.info(f"AI -> Tiket.com Search: '{query}'")
-                search_result = search_the_web(f"site:tiket.com {query}")
-            elif tool_name == "search_bookingcom":
-                logger.info(f"AI -> Booking.com Search: '{query}'")
-                search_result = search_the_web(f"site:booking.com {query}")
-            
-            if search_result:
-                response = await chat.send_message_async(
-                    {"function_response": {"name": tool_name, "response": {"result": search_result}}}
-                )
-                response_part = response.parts[0]
-            else:
-                break
-        
-        await update.message.reply_text(response.text)
+        # Panggilan alat memakai anggaran AI, bukan anggaran default handler
+        with deadline_scope(AI_TIME_BUDGET):
+            deadline = request_deadline.get()
+            response = await send_to_gemini(chat, prompt, deadline, reply)
+            steps = 0
+            degraded = False
+            while True:
+                calls = [part.function_call for part in response.parts if part.function_call]
+                if not calls:
+                    break
+                if steps >= AI_MAX_STEPS or time.monotonic() >= deadline:
+                    # Anggaran habis: tolak panggilan alat yang tersisa dan minta jawaban akhir tanpa alat
+                    logger.warning(f"AI Agent berhenti setelah {steps} langkah ({len(calls)} panggilan alat ditolak).")
+                    results = [AI_BUDGET_EXHAUSTED_RESULT] * len(calls)
+                    degraded = True
+                    response = await send_to_gemini(
+                        chat, _function_response_parts(calls, results), deadline, reply,
+                        tool_config={"function_calling_config": {"mode": "NONE"}},
+                    )
+                    break
+                if reply is not None:
+                    await reply.update("🔎 Mencari data tambahan...", cursor=False)
+                # Semua panggilan alat dalam satu giliran dijalankan bersamaan, hasilnya dikirim sekaligus
+                results = await asyncio.gather(*(dispatch_tool_call(call, deadline) for call in calls))
+                degraded = degraded or any(result in DEGRADED_TOOL_RESULTS for result in results)
+                response = await send_to_gemini(chat, _function_response_parts(calls, results), deadline, reply)
+                steps += 1
+            # Jawaban dari pencarian yang gagal atau yang selesai di masa tenggang tidak di-cache,
+            # agar jawaban yang lebih lengkap bisa didapat pada pertanyaan berikutnya
+            cacheable = not degraded and time.monotonic() < deadline
+
+        if cacheable:
+            ai_answer_cache.put(cache_key, response.text)
+        if reply is not None:
+            await reply.finish(response.text)
+        else:
+            await update.message.reply_text(response.text)
     except Exception as e:
-        logger.error(f"Error saat interaksi dengan Gemini Agent: {e}")
-        await update.message.reply_text("Maaf, terjadi kesalahan pada AI Agent.")
+        if isinstance(e, BackendUnavailable):
+            logger.warning(f"AI Agent tidak dijalankan: {e}")
+            text = "⏳ Layanan AI sedang terganggu. Coba lagi beberapa saat lagi."
+        else:
+            logger.error(f"Error saat interaksi dengan Gemini Agent: {e}")
+            text = "Maaf, terjadi kesalahan pada AI Agent."
+        if reply is not None:
+            await reply.finish(text)
+        else:
+            await update.message.reply_text(text)
 
-async def scan_it_reviews(update: Update, keyword: str) -> None:
-    await update.message.reply_text("Sedang scanning review IT...")
-    all_hotels = []
-    for sheet_name in SHEET_NAMES:
-        sheet = spreadsheet.worksheet(sheet_name)
-        records = sheet.get_all_records()
-        for rec in records:
-            nama = rec.get('Nama', '')
-            desa = rec.get('Desa', '')
-            if nama and desa:
-                query = f"{nama} {desa} Bali review internet wifi jaringan IT {keyword}"
-                review = search_the_web(query)
-                filtered = filter_it_reviews(review or "")
-                if filtered and (not keyword or keyword.lower() in filtered.lower()):
-                    refined = ai_refine_it_reviews(filtered) or filtered
-                    snippet = clean_text_snippet(refined)
-                    # ambil 2-3 kalimat saja agar padat
-                    sents = re.split(r"(?<=[.!?])\s+", snippet)
-                    display = " ".join(sents[:3])
-                    all_hotels.append(f"• {nama} ({desa}): {display}")
-    if all_hotels:
-        response = "Hotel dengan ulasan IT mengandung '{}':\n".format(keyword) + "\n".join(all_hotels[:10])  # Limit to 10
-        await update.message.reply_text(response, parse_mode=ParseMode.MARKDOWN)
-    else:
-        await update.message.reply_text("Tidak ditemukan hotel dengan review IT yang sesuai.")
+class ITReviewScanJob:
+    """Status satu scan review IT yang berjalan di background."""
+
+    def __init__(self, keyword: str):
+        self.job_id = uuid.uuid4().hex[:10]
+        self.keyword = keyword
+        self.message = None
+        self.matches = []
+        self.scanned = 0
+        self.total = 0
+        self.cancelled = asyncio.Event()
+        self.changed = False
+
+    def cancel_markup(self) -> InlineKeyboardMarkup:
+        return InlineKeyboardMarkup([[InlineKeyboardButton("⛔ Batalkan scan", callback_data=f"cancel_scan;{self.job_id}")]])
+
+    def limit_reached(self) -> bool:
+        return len(self.matches) >= IT_SCAN_RESULT_LIMIT
+
+    def progress_text(self) -> str:
+        text = f"Sedang scanning review IT... {self.scanned}/{self.total} properti diperiksa, {len(self.matches)} cocok."
+        if self.matches:
+            text += "\n\n" + "\n".join(self.matches)
+        return text
+
+    def result_text(self) -> str:
+        if self.cancelled.is_set():
+            header = f"Scan review IT dibatalkan ({self.scanned}/{self.total} properti diperiksa)."
+            return header + ("\n\n" + "\n".join(self.matches) if self.matches else "")
+        if self.matches:
+            return "Hotel dengan ulasan IT mengandung '{}':\n".format(self.keyword) + "\n".join(self.matches)
+        return "Tidak ditemukan hotel dengan review IT yang sesuai."
+
+
+_scan_jobs = {}
+
+async def scan_it_reviews(update: Update, context: ContextTypes.DEFAULT_TYPE, keyword: str) -> None:
+    """Jawab dari indeks review IT jika sudah dibangun; jika belum, scan live di background."""
+    if it_review_index.ready():
+        results = it_review_index.search(keyword, IT_SCAN_RESULT_LIMIT)
+        if results:
+            lines = [f"• {nama} ({desa}): {review}" for (_, nama, desa), review in results]
+            response = "Hotel dengan ulasan IT mengandung '{}':\n".format(keyword) + "\n".join(lines)
+            await update.message.reply_text(response, parse_mode=ParseMode.MARKDOWN)
+        else:
+            await update.message.reply_text("Tidak ditemukan hotel dengan review IT yang sesuai.")
+        return
+
+    # Indeks belum pernah dibangun penuh: scan live, hasil dikirim bertahap ke satu pesan progres
+    job = ITReviewScanJob(keyword)
+    job.message = await update.message.reply_text("Sedang scanning review IT...", reply_markup=job.cancel_markup())
+    _scan_jobs[job.job_id] = job
+    context.application.create_task(_run_it_review_scan(job), update=update)
+
+async def _edit_scan_message(job: ITReviewScanJob, text: str, reply_markup=None, final: bool = False, **kwargs) -> None:
+    """Perbarui pesan scan; edit final yang gagal diulang sebagai teks biasa agar pesan tidak beku."""
+    try:
+        await job.message.edit_text(text, reply_markup=reply_markup, **kwargs)
+        return
+    except Exception as e:
+        if not final or "not modified" in str(e).lower():
+            # Misalnya "message is not modified" atau flood limit; progres berikutnya akan mencoba lagi
+            logger.debug(f"Gagal memperbarui pesan scan {job.job_id}: {e}")
+            return
+        if not kwargs.get("parse_mode"):
+            logger.warning(f"Gagal menulis hasil akhir scan {job.job_id}: {e}")
+            return
+        # Nama properti atau kutipan review bisa berisi karakter Markdown yang tidak valid
+        logger.warning(f"Hasil akhir scan {job.job_id} gagal dikirim dengan Markdown, kirim ulang tanpa format: {e}")
+    kwargs.pop("parse_mode")
+    try:
+        await job.message.edit_text(text, reply_markup=reply_markup, **kwargs)
+    except Exception as e:
+        logger.warning(f"Gagal menulis hasil akhir scan {job.job_id}: {e}")
+
+async def _scan_one_property(job: ITReviewScanJob, nama: str, desa: str) -> None:
+    keyword = job.keyword
+    query = f"{nama} {desa} Bali review internet wifi jaringan IT {keyword}"
+    review = await search_the_web_async(query)
+    if review == SEARCH_WEB_ERROR:
+        return  # pesan error memuat kata "internet" dan akan lolos filter IT
+    display = await summarize_it_review(review, keyword)
+    if display and not job.limit_reached():
+        job.matches.append(f"• {nama} ({desa}): {display}")
+
+async def _run_it_review_scan(job: ITReviewScanJob) -> None:
+    """Jalankan scan dengan worker pool; berhenti saat dibatalkan atau batas hasil tercapai."""
+    # Task ini mewarisi context handler pemicunya; scan tidak terikat tenggat handler itu
+    with timed("job", job="scan_it_reviews"), priority_lane(PRIORITY_SCAN), deadline_scope(None):
+        await _scan_it_review_job(job)
+
+async def _scan_it_review_job(job: ITReviewScanJob) -> None:
+    queue = asyncio.Queue()
+    try:
+        for sheet_name in SHEET_NAMES:
+            snapshot = await get_sheet_snapshot_async(sheet_name)
+            nama_col, desa_col = snapshot.col('Nama'), snapshot.col('Desa')
+            if nama_col is None or desa_col is None:
+                continue
+            for row in snapshot.rows:
+                nama = row[nama_col] if len(row) > nama_col else ""
+                desa = row[desa_col] if len(row) > desa_col else ""
+                if nama and desa:
+                    queue.put_nowait((nama, desa))
+        job.total = queue.qsize()
+
+        async def worker():
+            while not job.cancelled.is_set() and not job.limit_reached():
+                try:
+                    nama, desa = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                found = len(job.matches)
+                try:
+                    await _scan_one_property(job, nama, desa)
+                except Exception as e:
+                    logger.warning(f"Scan review IT gagal untuk {nama}: {e}")
+                job.scanned += 1
+                job.changed = True
+                if len(job.matches) > found:
+                    logger.info(f"Scan {job.job_id}: cocok '{nama}' ({len(job.matches)}/{IT_SCAN_RESULT_LIMIT})")
+
+        async def reporter():
+            while True:
+                await asyncio.sleep(IT_SCAN_PROGRESS_INTERVAL)
+                if job.changed:
+                    job.changed = False
+                    await _edit_scan_message(job, job.progress_text(), job.cancel_markup())
+
+        workers = [asyncio.create_task(worker()) for _ in range(max(1, IT_SCAN_WORKERS))]
+        progress = asyncio.create_task(reporter())
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            progress.cancel()
+            for task in workers:
+                task.cancel()
+        await _edit_scan_message(job, job.result_text(), final=True, parse_mode=ParseMode.MARKDOWN)
+    except Exception as e:
+        logger.error(f"Scan review IT {job.job_id} gagal: {e}")
+        await _edit_scan_message(job, "Maaf, scan review IT gagal. Coba lagi nanti.", final=True)
+    finally:
+        _scan_jobs.pop(job.job_id, None)
+
+# ======================================================================
+# INDEKS REVIEW IT
+# ======================================================================
+# Frasa multi-kata dan negasi dinormalisasi dulu, lalu sinonim Indonesia/Inggris
+# dipetakan ke satu istilah agar "wifi cepat" cocok dengan "fast wi-fi".
+IT_TERM_PHRASES = [
+    (r"wi[-\s]?fi", "wifi"),
+    (r"video\s*call", "videocall"),
+    (r"work from home|remote work|kerja remote", "remotework"),
+    (r"digital nomad", "digitalnomad"),
+    (r"\b(?:tidak|tak|kurang|not|less)\s+(?:stabil|stable)\b", "unstable"),
+    (r"\b(?:tidak|tak|kurang|not)\s+(?:cepat|kencang|fast)\b", "slow"),
+    (r"\b(?:tidak|tak|not)\s+(?:lambat|lemot|slow)\b", "fast"),
+]
+IT_TERM_SYNONYMS = {
+    "cepat": "fast", "kencang": "fast", "ngebut": "fast", "lancar": "fast", "quick": "fast", "speedy": "fast",
+    "lambat": "slow", "lemot": "slow", "lelet": "slow",
+    "stabil": "stable", "putus": "drop", "terputus": "drop", "drops": "drop", "dropped": "drop", "disconnect": "drop",
+    "jaringan": "network", "koneksi": "connection", "connectivity": "connection", "sinyal": "signal",
+    "kecepatan": "speed", "fibre": "fiber", "streaming": "stream", "internetnya": "internet", "wifinya": "wifi",
+    "bagus": "good", "baik": "good", "great": "good", "excellent": "good",
+    "buruk": "bad", "jelek": "bad", "poor": "bad", "terrible": "bad",
+}
+IT_STOPWORDS = {
+    "dan", "yang", "di", "ke", "dari", "ini", "itu", "untuk", "dengan", "sangat", "juga", "ada", "nya",
+    "the", "and", "is", "was", "are", "a", "an", "of", "to", "in", "for", "very", "it", "at", "on",
+}
+
+def tokenize_it_text(text: str) -> list:
+    """Pecah teks review menjadi istilah IT yang sudah dinormalisasi."""
+    lowered = (text or "").lower()
+    for pattern, replacement in IT_TERM_PHRASES:
+        lowered = re.sub(pattern, replacement, lowered)
+    tokens = []
+    for token in re.findall(r"[a-z0-9]+", lowered):
+        if len(token) < 2 or token in IT_STOPWORDS:
+            continue
+        tokens.append(IT_TERM_SYNONYMS.get(token, token))
+    return tokens
+
+
+class ITReviewIndex:
+    """Review IT per properti (SQLite) beserta inverted index untuk pencarian kata kunci.
+
+    Review baru langsung dipakai dari memori; SQLite ditulis per batch di thread _db_executor.
+    """
+
+    FLUSH_BATCH = 50
+
+    def __init__(self, path: str):
+        self.reviews = {}  # (sheet_name, nama, desa) -> (review, indexed_at)
+        self.lexical = BM25Index()
+        self.last_full_run = 0.0
+        self._unsaved = []  # baris it_reviews yang belum diantrekan ke SQLite
+        self._conn = None
+        if path:
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS it_reviews ("
+                "sheet_name TEXT, nama TEXT, desa TEXT, review TEXT, indexed_at REAL, "
+                "PRIMARY KEY (sheet_name, nama, desa))"
+            )
+            self._conn.execute("CREATE TABLE IF NOT EXISTS it_review_meta (name TEXT PRIMARY KEY, value REAL)")
+            self._conn.commit()
+            for sheet_name, nama, desa, review, indexed_at in self._conn.execute("SELECT * FROM it_reviews"):
+                self._remember((sheet_name, nama, desa), review, indexed_at)
+            row = self._conn.execute("SELECT value FROM it_review_meta WHERE name = 'last_full_run'").fetchone()
+            self.last_full_run = row[0] if row else 0.0
+
+    def _remember(self, key: tuple, review: str, indexed_at: float) -> None:
+        self.reviews[key] = (review, indexed_at)
+        if review:
+            self.lexical.add(key, tokenize_it_text(review))
+        else:
+            self.lexical.remove(key)
+
+    def ready(self) -> bool:
+        """True jika indeks sudah pernah dibangun penuh minimal sekali."""
+        return self.last_full_run > 0 and bool(self.reviews)
+
+    def is_stale(self, key: tuple) -> bool:
+        entry = self.reviews.get(key)
+        return entry is None or time.time() - entry[1] > IT_REVIEW_MAX_AGE_HOURS * 3600
+
+    def store(self, key: tuple, review: str) -> None:
+        """Simpan review IT (string kosong = tidak ada ulasan IT) dengan timestamp sekarang."""
+        now = time.time()
+        self._remember(key, review, now)
+        if self._conn is not None:
+            self._unsaved.append((*key, review, now))
+            if len(self._unsaved) >= self.FLUSH_BATCH:
+                self.flush()
+
+    def _review_statements(self) -> list:
+        rows, self._unsaved = self._unsaved, []
+        return [("INSERT OR REPLACE INTO it_reviews VALUES (?, ?, ?, ?, ?)", rows)] if rows else []
+
+    def flush(self):
+        """Antrekan review yang belum tersimpan ke SQLite sebagai satu commit; kembalikan Future-nya."""
+        return submit_db_write(self._conn, self._review_statements(), "indeks review IT")
+
+    def mark_full_run(self):
+        self.last_full_run = time.time()
+        statements = self._review_statements()
+        statements.append(("INSERT OR REPLACE INTO it_review_meta VALUES ('last_full_run', ?)", [(self.last_full_run,)]))
+        return submit_db_write(self._conn, statements, "indeks review IT")
+
+    def search(self, keyword: str, limit: int) -> list:
+        """[(key, review)] terurut dari yang paling relevan; tanpa kata kunci, yang terbaru dulu."""
+        tokens = tokenize_it_text(keyword)
+        if not tokens:
+            keys = sorted((k for k, (review, _) in self.reviews.items() if review), key=lambda k: self.reviews[k][1], reverse=True)
+            return [(key, self.reviews[key][0]) for key in keys[:limit]]
+        return [(key, self.reviews[key][0]) for key, _, _ in self.lexical.search(tokens, limit)]
+
+
+it_review_index = ITReviewIndex(IT_REVIEW_INDEX_PATH)
+_it_index_running = False
+
+async def fetch_it_review(nama: str, desa: str):
+    """Cari dan rangkum review IT satu properti; None jika pencarian gagal."""
+    raw = await search_the_web_async(f"{nama} {desa} Bali review internet wifi jaringan IT")
+    if raw == SEARCH_WEB_ERROR:
+        return None
+    return await summarize_it_review(raw)
+
+async def refresh_it_review_index(force: bool = False) -> int:
+    """Perbarui review IT yang belum ada atau lebih tua dari IT_REVIEW_MAX_AGE_HOURS."""
+    global _it_index_running
+    if _it_index_running:
+        return 0
+    _it_index_running = True
+    try:
+        queue = asyncio.Queue()
+        for sheet_name in SHEET_NAMES:
+            snapshot = await get_sheet_snapshot_async(sheet_name)
+            nama_col, desa_col = snapshot.col('Nama'), snapshot.col('Desa')
+            if nama_col is None or desa_col is None:
+                continue
+            for row in snapshot.rows:
+                if len(row) > max(nama_col, desa_col) and row[nama_col] and row[desa_col]:
+                    key = (sheet_name, row[nama_col], row[desa_col])
+                    if force or it_review_index.is_stale(key):
+                        queue.put_nowait(key)
+        refreshed = 0
+
+        async def worker():
+            nonlocal refreshed
+            while not queue.empty():
+                key = queue.get_nowait()
+                try:
+                    review = await fetch_it_review(key[1], key[2])
+                except Exception as e:
+                    logger.warning(f"Indeks review IT gagal untuk {key[1]}: {e}")
+                    continue
+                if review is not None:
+                    it_review_index.store(key, review)
+                    refreshed += 1
+
+        with priority_lane(PRIORITY_BATCH):
+            await asyncio.gather(*(worker() for _ in range(max(1, IT_SCAN_WORKERS))))
+        it_review_index.mark_full_run()
+        logger.info(f"Indeks review IT diperbarui: {refreshed} properti, total {len(it_review_index.reviews)}.")
+        return refreshed
+    finally:
+        it_review_index.flush()  # review yang sudah didapat tetap disimpan walau run gagal di tengah
+        _it_index_running = False
+
+async def it_review_index_loop() -> None:
+    """Pengindeksan review IT terjadwal; hanya properti yang kadaluarsa yang dicari ulang."""
+    while True:
+        try:
+            await refresh_it_review_index()
+        except Exception as e:
+            # Misalnya Sheets belum siap saat startup: coba lagi segera, bukan setelah jeda terjadwal
+            logger.error(f"Pengindeksan review IT gagal, dicoba lagi dalam {BACKEND_RETRY_INTERVAL:g} detik: {e}")
+            await asyncio.sleep(BACKEND_RETRY_INTERVAL)
+            continue
+        await asyncio.sleep(IT_REVIEW_INDEX_INTERVAL)
 
 async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Tangkap error global agar tidak crash diam-diam dan beri log yang jelas."""
-    logger.error("Unhandled exception", exc_info=context.error)
+    if isinstance(context.error, BackendUnavailable):
+        # Backend masih dipanaskan atau sedang gagal: cukup satu baris log, bukan traceback
+        logger.warning(f"Update ditolak sementara: {context.error}")
+        text = "⏳ Bot sedang menyiapkan koneksi ke database/AI. Coba lagi sebentar lagi."
+    else:
+        logger.error("Unhandled exception", exc_info=context.error)
+        text = "Maaf, koneksi sedang lambat. Coba lagi sebentar."
     # Opsional: beritahu user jika memungkinkan
     try:
         if hasattr(update, 'effective_chat') and update.effective_chat:
-            await context.bot.send_message(chat_id=update.effective_chat.id, text="Maaf, koneksi sedang lambat. Coba lagi sebentar.")
+            await context.bot.send_message(chat_id=update.effective_chat.id, text=text)
     except Exception:
         pass
 
+def _is_quota_error(error: Exception) -> bool:
+    import gspread
+    return isinstance(error, gspread.exceptions.APIError) and error.response.status_code == 429
+
+def _with_quota_retry(func, *args):
+    """Ulangi panggilan Sheets dengan backoff eksponensial saat kena batas kuota (HTTP 429)."""
+    import gspread
+    for attempt in range(SHEET_WRITE_RETRIES + 1):
+        try:
+            return func(*args)
+        except gspread.exceptions.APIError as e:
+            if not _is_quota_error(e) or attempt == SHEET_WRITE_RETRIES:
+                raise
+            delay = 2 ** attempt
+            logger.warning(f"Kuota Sheets habis, coba lagi dalam {delay} detik.")
+            time.sleep(delay)
+
+def _find_row_number(sheet, snapshot: SheetSnapshot, nama: str, desa: str, verify: bool) -> int:
+    """Nomor baris (Nama, Desa) dari indeks snapshot; opsional dicek ulang ke sheet."""
+    row_number = snapshot.row_numbers.get((nama, desa))
+    if row_number and verify:
+        # Satu baca kecil untuk memastikan baris belum bergeser sejak snapshot diambil
+        with timed("backend", backend="sheets", op="row_values"):
+            row = guarded_call("sheets", sheet.row_values, row_number)
+        nama_col, desa_col = snapshot.col('Nama'), snapshot.col('Desa')
+        if len(row) <= max(nama_col, desa_col) or row[nama_col] != nama or row[desa_col] != desa:
+            return None
+    return row_number
+
+def write_sheet_updates(sheet_name: str, updates: dict) -> None:
+    """Tulis {(nama, desa): {kolom: nilai}} ke satu worksheet dalam satu batch_update."""
+    import gspread
+    sheet = get_worksheet(sheet_name)
+    try:
+        # Banyak baris: sinkronkan paksa sekali; satu baris: cukup verifikasi baris itu.
+        # Nomor baris untuk menulis tidak boleh berasal dari mirror lama yang dipakai saat
+        # Sheets gagal (fallback get_sheet_snapshot), jadi error sinkronisasi diteruskan.
+        many = len(updates) > 1
+        snapshot = sync_sheet(sheet_name, force=True) if many else get_sheet_snapshot(sheet_name)
+        headers = list(snapshot.headers)
+        cells = []
+        for (nama, desa), data in updates.items():
+            row_number = _find_row_number(sheet, snapshot, nama, desa, verify=not many)
+            if row_number is None and not many:
+                snapshot = sync_sheet(sheet_name, force=True)
+                headers = list(snapshot.headers)
+                row_number = snapshot.row_numbers.get((nama, desa))
+            if not row_number:
+                logger.warning(f"Baris '{nama}' ({desa}) tidak ditemukan di '{sheet_name}', dilewati.")
+                continue
+            for key, value in data.items():
+                if key not in headers:
+                    headers.append(key)
+                    cells.append({"range": gspread.utils.rowcol_to_a1(1, len(headers)), "values": [[key]]})
+                cells.append({"range": gspread.utils.rowcol_to_a1(row_number, headers.index(key) + 1), "values": [[value]]})
+        if cells:
+            with timed("backend", backend="sheets", op="batch_update"):
+                _with_quota_retry(functools.partial(
+                    guarded_call, "sheets",
+                    functools.partial(sheet.batch_update, cells, value_input_option=gspread.utils.ValueInputOption.user_entered),
+                    hedge=False,
+                ))
+    finally:
+        invalidate_sheet_snapshot(sheet_name)
+
+
+class SheetWriteQueue:
+    """Antrian write-behind: simpanan digabung per baris lalu ditulis berkala, satu batch per worksheet."""
+
+    def __init__(self):
+        self.pending = {}  # sheet_name -> {(nama, desa): {kolom: nilai}}
+        self._lock = threading.Lock()
+
+    def enqueue(self, sheet_name: str, nama: str, desa: str, data: dict) -> None:
+        with self._lock:
+            self.pending.setdefault(sheet_name, {}).setdefault((nama, desa), {}).update(data)
+
+    def _requeue(self, sheet_name: str, updates: dict) -> None:
+        # Nilai yang masuk setelah flush dimulai lebih baru, jadi tidak ditimpa
+        with self._lock:
+            rows = self.pending.setdefault(sheet_name, {})
+            for key, data in updates.items():
+                rows[key] = {**data, **rows.get(key, {})}
+
+    async def flush(self) -> None:
+        with self._lock:
+            batches, self.pending = self.pending, {}
+        for sheet_name, updates in batches.items():
+            try:
+                await run_blocking("sheets", write_sheet_updates, sheet_name, updates)
+                logger.info(f"Write-behind: {len(updates)} baris ditulis ke '{sheet_name}'.")
+            except Exception as e:
+                logger.error(f"Write-behind ke '{sheet_name}' gagal, dicoba lagi nanti: {e}")
+                self._requeue(sheet_name, updates)
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(SHEET_FLUSH_INTERVAL)
+            await self.flush()
+
+
+sheet_write_queue = SheetWriteQueue()
+
 def save_additional_data(sheet_name: str, nama: str, desa: str, data: dict) -> None:
+    """Simpan usulan satu properti dalam satu batch_update (atau antrekan jika write-behind aktif)."""
+    if SHEET_WRITE_BEHIND:
+        sheet_write_queue.enqueue(sheet_name, nama, desa, data)
+        return
     try:
-        sheet = spreadsheet.worksheet(sheet_name)
-        all_values = sheet.get_all_values()
-        headers = all_values[0]
-        row_index = next((i+2 for i, row in enumerate(all_values[1:]) if row[headers.index('Nama')] == nama and row[headers.index('Desa')] == desa), None)
-        if not row_index:
-            return
-        for key, value in data.items():
-            if key not in headers:
-                col = len(headers) + 1
-                sheet.update_cell(1, col, key)
-                headers.append(key)
-            col_index = headers.index(key) + 1
-            sheet.update_cell(row_index, col_index, value)
+        write_sheet_updates(sheet_name, {(nama, desa): data})
     except Exception as e:
         logger.error(f"Error saving data: {e}")
+        raise
+
+# ======================================================================
+# PENGAYAAN DATA MASSAL
+# ======================================================================
+class IntervalLimiter:
+    """Batasi laju mulai pekerjaan menjadi paling banyak `rate` per detik."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self) -> None:
+        async with self._lock:
+            now = time.monotonic()
+            if self._next > now:
+                await asyncio.sleep(self._next - now)
+            self._next = max(now, self._next) + self.interval
+
+
+def _load_enrich_checkpoint() -> set:
+    try:
+        with open(ENRICH_CHECKPOINT_FILE, encoding="utf-8") as f:
+            return {tuple(key) for key in json.load(f).get("done", [])}
+    except FileNotFoundError:
+        return set()
+
+def _save_enrich_checkpoint(done: set) -> None:
+    # Tulis ke file sementara lalu ganti, agar checkpoint tidak rusak saat proses mati
+    tmp_path = ENRICH_CHECKPOINT_FILE + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"done": sorted(done), "updated_at": time.time()}, f)
+    os.replace(tmp_path, ENRICH_CHECKPOINT_FILE)
+
+async def enrich_all_sheets(apply: bool = False, resume: bool = True) -> dict:
+    """Isi kolom kosong di semua sheet memakai heuristik yang sama dengan view_details.
+
+    Tanpa `apply`, usulan ditulis ke ENRICH_PROPOSALS_FILE untuk ditinjau; dengan `apply`,
+    usulan setiap worksheet ditulis dalam satu batch_update. Progres disimpan di
+    ENRICH_CHECKPOINT_FILE sehingga run yang terhenti bisa dilanjutkan; run baru (tanpa
+    checkpoint atau dengan --restart) memulai file usulan dari kosong.
+    """
+    done = _load_enrich_checkpoint() if resume else set()
+    if done:
+        logger.info(f"Melanjutkan pengayaan massal: {len(done)} properti sudah diproses.")
+    limiter = IntervalLimiter(ENRICH_RATE)
+    stats = {"scanned": 0, "proposed": 0, "written": 0, "skipped": len(done), "failed": 0}
+    # Run baru mengosongkan file usulan agar apply-proposals tidak menerapkan usulan run
+    # sebelumnya; hanya run yang melanjutkan checkpoint yang menambah ke file yang ada
+    proposals_file = open(ENRICH_PROPOSALS_FILE, "a" if done else "w", encoding="utf-8")
+    try:
+        for sheet_name in SHEET_NAMES:
+            snapshot = await get_sheet_snapshot_async(sheet_name)
+            if snapshot.col('Nama') is None or snapshot.col('Desa') is None:
+                logger.warning(f"Sheet '{sheet_name}' tidak punya kolom Nama/Desa, dilewati.")
+                continue
+            queue = asyncio.Queue()
+            for row in snapshot.rows:
+                row = row + [""] * (len(snapshot.headers) - len(row))
+                key = (sheet_name, row[snapshot.col('Nama')], row[snapshot.col('Desa')])
+                if key[1] and key not in done and plan_enrichment(snapshot.headers, row):
+                    queue.put_nowait((key, row))
+            sheet_updates = {}
+
+            async def worker():
+                while not queue.empty():
+                    key, row = queue.get_nowait()
+                    await limiter.wait()
+                    try:
+                        updates = await propose_updates(snapshot.headers, row, strict=True)
+                    except Exception as e:
+                        # Baris tidak ditandai selesai: run berikutnya mencobanya lagi
+                        stats["failed"] += 1
+                        logger.warning(f"Pengayaan gagal untuk {key[1]}: {e}")
+                        continue
+                    stats["scanned"] += 1
+                    if updates:
+                        stats["proposed"] += 1
+                        sheet_updates[(key[1], key[2])] = updates
+                        record = {"sheet": sheet_name, "nama": key[1], "desa": key[2], "updates": updates}
+                        proposals_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+                        proposals_file.flush()
+                    # Mode apply: baris dengan usulan baru dianggap selesai setelah batch-nya ditulis
+                    if not apply or not updates:
+                        done.add(key)
+                        _save_enrich_checkpoint(done)
+
+            logger.info(f"Pengayaan '{sheet_name}': {queue.qsize()} properti dengan kolom kosong.")
+            with priority_lane(PRIORITY_BATCH):
+                await asyncio.gather(*(worker() for _ in range(max(1, ENRICH_CONCURRENCY))))
+            if apply and sheet_updates:
+                await run_blocking("sheets", write_sheet_updates, sheet_name, sheet_updates, timeout=SHEETS_TIMEOUT * 4)
+                stats["written"] += len(sheet_updates)
+                logger.info(f"Pengayaan '{sheet_name}': {len(sheet_updates)} baris ditulis dalam satu batch.")
+            if apply:
+                done.update((sheet_name, nama, desa) for nama, desa in sheet_updates)
+                _save_enrich_checkpoint(done)
+    finally:
+        proposals_file.close()
+    if stats["failed"]:
+        # Checkpoint disimpan agar run lanjutan hanya mengulang baris yang gagal
+        logger.warning(f"{stats['failed']} properti gagal diperkaya; jalankan lagi untuk melanjutkan.")
+        _save_enrich_checkpoint(done)
+    elif os.path.exists(ENRICH_CHECKPOINT_FILE):
+        # Run selesai penuh: checkpoint tidak diperlukan lagi
+        os.remove(ENRICH_CHECKPOINT_FILE)
+    logger.info(f"Pengayaan massal selesai: {stats}")
+    return stats
+
+def apply_proposals_file(path: str) -> int:
+    """Tulis file usulan (hasil tinjauan) ke sheet, satu batch_update per worksheet."""
+    per_sheet = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                per_sheet.setdefault(record["sheet"], {}).setdefault((record["nama"], record["desa"]), {}).update(record["updates"])
+    for sheet_name, updates in per_sheet.items():
+        write_sheet_updates(sheet_name, updates)
+        logger.info(f"{len(updates)} baris usulan ditulis ke '{sheet_name}'.")
+    return sum(len(updates) for updates in per_sheet.values())
 
 # ======================================================================
 # BAGIAN 3: FUNGSI UTAMA UNTUK MENJALANKAN BOT
 # ======================================================================
-def main() -> None:
-    request = HTTPXRequest(connect_timeout=TELEGRAM_CONNECT_TIMEOUT, read_timeout=TELEGRAM_READ_TIMEOUT)
-    application = Application.builder().token(TELEGRAM_TOKEN).request(request).build()
+_background_tasks = []
+
+async def post_init(application: Application) -> None:
+    """Mulai tugas background setelah bot terinisialisasi."""
+    ready_seconds = time.perf_counter() - _PROCESS_STARTED
+    metrics.observe("startup_seconds", MODULE_LOAD_SECONDS, phase="module")
+    metrics.observe("startup_seconds", ready_seconds, phase="ready")
+    logger.info(f"Startup: modul dimuat {MODULE_LOAD_SECONDS:.2f} detik, siap menerima update {ready_seconds:.2f} detik.")
+    if BACKEND_WARMUP == "background":
+        _background_tasks.append(asyncio.create_task(warm_backends()))
+    if SHEET_SYNC_INTERVAL > 0:
+        _background_tasks.append(asyncio.create_task(sheet_mirror_loop()))
+    if IT_REVIEW_INDEX_INTERVAL > 0:
+        _background_tasks.append(asyncio.create_task(it_review_index_loop()))
+    if SHEET_WRITE_BEHIND:
+        _background_tasks.append(asyncio.create_task(sheet_write_queue.run()))
+    if METRICS_PORT:
+        start_metrics_server(METRICS_PORT)
+    if METRICS_LOG_INTERVAL > 0:
+        _background_tasks.append(asyncio.create_task(metrics_log_loop()))
+
+async def post_shutdown(application: Application) -> None:
+    for task in _background_tasks:
+        task.cancel()
+    _background_tasks.clear()
+    if SHEET_WRITE_BEHIND:
+        await sheet_write_queue.flush()
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    """Proses update secara paralel antar chat, tetapi berurutan di dalam satu chat.
+
+    Semaphore bawaan membatasi jumlah update yang menunggu; jumlah update yang
+    benar-benar berjalan dibatasi terpisah setelah kunci chat didapat, sehingga
+    update yang mengantre di satu chat tidak memakan slot chat lain.
+    """
+
+    def __init__(self, max_active_updates: int, max_pending_updates: int):
+        super().__init__(max_concurrent_updates=max(max_pending_updates, max_active_updates))
+        self.max_active_updates = max_active_updates
+        self._active = None
+        self._chat_locks = {}  # chat_id -> [lock, jumlah pemakai]
+
+    async def initialize(self) -> None:
+        self._active = asyncio.Semaphore(self.max_active_updates)
+
+    async def shutdown(self) -> None:
+        self._chat_locks.clear()
+
+    async def do_process_update(self, update: object, coroutine) -> None:
+        chat = update.effective_chat if isinstance(update, Update) else None
+        if chat is None:
+            async with self._active:
+                await coroutine
+            return
+        entry = self._chat_locks.setdefault(chat.id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0], self._active:
+                await coroutine
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                self._chat_locks.pop(chat.id, None)
+
+
+def build_application(token: str = None) -> Application:
+    """Rakit Application beserta semua handler; dipakai main() dan benchmark.py."""
+    request = HTTPXRequest(
+        connection_pool_size=TELEGRAM_POOL_SIZE,
+        pool_timeout=TELEGRAM_POOL_TIMEOUT,
+        connect_timeout=TELEGRAM_CONNECT_TIMEOUT,
+        read_timeout=TELEGRAM_READ_TIMEOUT,
+    )
+    builder = (
+        Application.builder()
+        .token(token or TELEGRAM_TOKEN)
+        .request(request)
+        .concurrent_updates(PerChatUpdateProcessor(TELEGRAM_CONCURRENT_UPDATES, TELEGRAM_MAX_PENDING_UPDATES))
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+    )
+    if TELEGRAM_BASE_URL:
+        builder = builder.base_url(TELEGRAM_BASE_URL)
+    application = builder.build()
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CallbackQueryHandler(button_handler))
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_ai_query))
     application.add_error_handler(error_handler)
-    logger.info("Bot dimulai...")
-    application.run_polling()
+    return application
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Bot Telegram properti Bali.")
+    commands = parser.add_subparsers(dest="command")
+    enrich = commands.add_parser("enrich", help="Isi kolom kosong di semua sheet secara massal.")
+    enrich.add_argument("--apply", action="store_true", help="Tulis langsung ke sheet (satu batch per worksheet).")
+    enrich.add_argument("--restart", action="store_true", help="Abaikan checkpoint dan mulai dari awal.")
+    apply = commands.add_parser("apply-proposals", help="Tulis file usulan yang sudah ditinjau ke sheet.")
+    apply.add_argument("file", nargs="?", default=ENRICH_PROPOSALS_FILE)
+    args = parser.parse_args()
+
+    if args.command or BACKEND_WARMUP == "eager":
+        connect_backends()
+    if args.command == "enrich":
+        asyncio.run(enrich_all_sheets(apply=args.apply, resume=not args.restart))
+        return
+    if args.command == "apply-proposals":
+        apply_proposals_file(args.file)
+        return
+
+    application = build_application()
+    if BOT_MODE == "webhook":
+        if not WEBHOOK_URL:
+            logger.error("BOT_MODE=webhook membutuhkan WEBHOOK_URL.")
+            exit()
+        logger.info(f"Bot dimulai (webhook {WEBHOOK_LISTEN}:{WEBHOOK_PORT}/{WEBHOOK_PATH})...")
+        application.run_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH,
+            webhook_url=f"{WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH}",
+            secret_token=WEBHOOK_SECRET,
+        )
+    else:
+        logger.info("Bot dimulai...")
+        application.run_polling()
+
+MODULE_LOAD_SECONDS = time.perf_counter() - _PROCESS_STARTED
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,9 @@
+import os
+import sys
+
+# File SQLite bot dinonaktifkan agar tes tidak menulis ke direktori kerja; tes yang
+# membutuhkan persistensi membuat store sendiri di tmp_path.
+for name in ("SHEET_MIRROR_PATH", "SERP_CACHE_PATH", "PENDING_PROPOSAL_PATH", "IT_REVIEW_INDEX_PATH"):
+    os.environ[name] = ""
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
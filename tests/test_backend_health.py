@@ -0,0 +1,163 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import bot
+
+
+@pytest.fixture
+def breaker(monkeypatch):
+    monkeypatch.setattr(bot, "BREAKER_FAILURE_THRESHOLD", 3)
+    monkeypatch.setattr(bot, "BREAKER_RESET_TIMEOUT", 0.05)
+    return bot.BackendHealth("test", hedge=False)
+
+
+def test_breaker_opens_after_consecutive_failures(breaker):
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success(0.01)  # sukses di tengah mengulang hitungan
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.check()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert breaker.is_open()
+    with pytest.raises(bot.BackendUnavailable):
+        breaker.check()
+    assert breaker.stats == {"opened": 1, "rejected": 1, "hedged": 0, "hedge_wins": 0}
+
+
+def test_breaker_half_open_allows_one_probe_then_closes(breaker):
+    for _ in range(3):
+        breaker.record_failure()
+    time.sleep(0.06)
+    assert not breaker.is_open()
+    breaker.check()  # permintaan percobaan
+    assert breaker.state == "half_open"
+    with pytest.raises(bot.BackendUnavailable):
+        breaker.check()  # yang lain tetap ditolak selama percobaan berjalan
+    breaker.record_success(0.01)
+    assert breaker.state == "closed"
+    breaker.check()
+
+
+def test_breaker_failed_probe_reopens(breaker):
+    for _ in range(3):
+        breaker.record_failure()
+    time.sleep(0.06)
+    breaker.check()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert breaker.stats["opened"] == 2
+    with pytest.raises(bot.BackendUnavailable):
+        breaker.check()
+
+
+@pytest.fixture
+def serpapi(monkeypatch):
+    """Health dan scheduler SerpApi baru dengan hedging aktif dan delay hedge pendek."""
+    monkeypatch.setattr(bot, "HEDGE_MIN_SAMPLES", 5)
+    monkeypatch.setattr(bot, "HEDGE_MIN_DELAY", 0.02)
+    monkeypatch.setattr(bot, "QUOTA_RETRIES", 0)
+    health = bot.BackendHealth("serpapi", hedge=True)
+    for _ in range(5):
+        health.record_success(0.005)
+    monkeypatch.setitem(bot.backend_health, "serpapi", health)
+
+    def use_scheduler(rate, burst):
+        scheduler = bot.QuotaScheduler("serpapi", rate, burst)
+        monkeypatch.setitem(bot.quota_schedulers, "serpapi", scheduler)
+        return scheduler
+
+    return health, use_scheduler
+
+
+class Upstream:
+    def __init__(self, delays):
+        self.delays = list(delays)
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        with self._lock:
+            self.calls += 1
+            delay = self.delays.pop(0) if self.delays else 0.001
+        time.sleep(delay)
+        return {"delay": delay}
+
+
+def fetch(upstream):
+    return bot.call_with_quota("serpapi", bot.guarded_call, "serpapi", upstream)
+
+
+def test_waiting_for_quota_does_not_trigger_hedge(serpapi):
+    health, use_scheduler = serpapi
+    scheduler = use_scheduler(rate=20, burst=1)
+    upstream = Upstream([])
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        list(pool.map(lambda _: fetch(upstream), range(4)))
+    # Antre token ~50 ms per permintaan, jauh di atas delay hedge, tapi tidak ada duplikat
+    assert upstream.calls == 4
+    assert health.stats["hedged"] == 0
+    assert scheduler.stats["granted"] == 4
+
+
+def test_slow_upstream_is_hedged_when_a_token_is_free(serpapi):
+    health, use_scheduler = serpapi
+    scheduler = use_scheduler(rate=0, burst=5)
+    upstream = Upstream([0.5, 0.001])
+    started = time.monotonic()
+    assert fetch(upstream) == {"delay": 0.001}
+    assert time.monotonic() - started < 0.4
+    assert upstream.calls == 2
+    assert health.stats["hedged"] == 1
+    assert health.stats["hedge_wins"] == 1
+    assert scheduler.stats["granted"] == 2
+
+
+def test_hedge_is_skipped_when_bucket_is_empty(serpapi):
+    health, use_scheduler = serpapi
+    scheduler = use_scheduler(rate=0.001, burst=1)
+    upstream = Upstream([0.1, 0.001])
+    assert fetch(upstream) == {"delay": 0.1}
+    assert upstream.calls == 1
+    assert health.stats["hedged"] == 0
+    assert scheduler.stats["granted"] == 1
+
+
+def test_open_breaker_rejects_before_taking_quota(serpapi, monkeypatch):
+    health, use_scheduler = serpapi
+    scheduler = use_scheduler(rate=0, burst=5)
+    monkeypatch.setattr(bot, "BREAKER_FAILURE_THRESHOLD", 1)
+    health.record_failure()
+    upstream = Upstream([])
+    with pytest.raises(bot.BackendUnavailable):
+        fetch(upstream)
+    assert upstream.calls == 0
+    assert scheduler.stats["granted"] == 0
+
+
+def test_quota_wait_gives_up_at_request_deadline(serpapi):
+    health, use_scheduler = serpapi
+    scheduler = use_scheduler(rate=1, burst=1)
+    upstream = Upstream([])
+
+    def search(_):
+        with bot.deadline_scope(0.3):
+            try:
+                return fetch(upstream)
+            except TimeoutError:
+                return None
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=5) as pool:
+        results = list(pool.map(search, range(5)))
+    assert time.monotonic() - started < 0.6
+    # Hanya token burst yang terpakai; sisanya menyerah tanpa memanggil upstream
+    assert upstream.calls == 1
+    assert results.count(None) == 4
+    assert scheduler.stats["granted"] == 1
+    assert not scheduler._waiters or all(ticket.cancelled for _, _, ticket in scheduler._waiters)
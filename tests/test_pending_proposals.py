@@ -0,0 +1,35 @@
+import time
+
+import bot
+
+
+def test_oldest_proposal_is_evicted_per_user():
+    store = bot.PendingProposalStore("", ttl=3600, per_user=2)
+    tokens = [store.put(1, "S", f"Villa {i}", "Sidemen", {"Jenis": "Villa"}) for i in range(3)]
+    other = store.put(2, "S", "Villa X", "Tebola", {})
+    assert store.get(1, tokens[0]) is None
+    assert store.get(1, tokens[2])[1] == "Villa 2"
+    assert store.get(2, other) is not None
+    assert store.get(2, tokens[2]) is None  # token milik pengguna lain
+    assert store.stats["evicted"] == 1
+
+
+def test_expired_proposal_is_dropped():
+    store = bot.PendingProposalStore("", ttl=0.01, per_user=5)
+    token = store.put(1, "S", "Villa", "Sidemen", {})
+    time.sleep(0.02)
+    assert store.get(1, token) is None
+    assert len(store) == 0
+    assert store.stats["expired"] == 1
+
+
+def test_proposals_survive_restart(tmp_path):
+    path = str(tmp_path / "pending.sqlite3")
+    store = bot.PendingProposalStore(path, ttl=3600, per_user=2)
+    tokens = [store.put(1, "S", f"Villa {i}", "Sidemen", {"Jumlah Kamar": str(i)}) for i in range(3)]
+    store.discard(1, tokens[1])
+    store.flush()
+
+    restarted = bot.PendingProposalStore(path, ttl=3600, per_user=2)
+    assert len(restarted) == 1
+    assert restarted.get(1, tokens[2])[3] == {"Jumlah Kamar": "2"}
@@ -0,0 +1,131 @@
+import asyncio
+import time
+
+import bot
+
+
+def test_priority_semaphore_wakes_interactive_before_batch():
+    async def main():
+        sem = bot.PrioritySemaphore(1)
+        order = []
+
+        async def user(name, level):
+            with bot.priority_lane(level):
+                async with sem:
+                    order.append(name)
+
+        await sem.__aenter__()
+        batch = asyncio.create_task(user("batch", bot.PRIORITY_BATCH))
+        await asyncio.sleep(0)
+        interactive = asyncio.create_task(user("interactive", bot.PRIORITY_INTERACTIVE))
+        await asyncio.sleep(0)
+        await sem.__aexit__(None, None, None)
+        await asyncio.gather(batch, interactive)
+        return order
+
+    assert asyncio.run(main()) == ["interactive", "batch"]
+
+
+def test_priority_semaphore_passes_slot_on_when_granted_waiter_is_cancelled():
+    async def main():
+        sem = bot.PrioritySemaphore(1)
+        entered = []
+
+        async def user(name):
+            async with sem:
+                entered.append(name)
+
+        await sem.__aenter__()
+        first = asyncio.create_task(user("first"))
+        second = asyncio.create_task(user("second"))
+        await asyncio.sleep(0)
+        # Slot diberikan ke `first`, lalu task-nya dibatalkan sebelum sempat berjalan
+        await sem.__aexit__(None, None, None)
+        first.cancel()
+        await asyncio.wait_for(second, 1)
+        assert first.cancelled()
+        return entered, sem._value
+
+    entered, value = asyncio.run(main())
+    assert entered == ["second"]
+    assert value == 1
+
+
+def test_priority_semaphore_cancelled_waiter_does_not_leak_slot():
+    async def main():
+        sem = bot.PrioritySemaphore(1)
+        await sem.__aenter__()
+        waiter = asyncio.create_task(sem.__aenter__())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        await sem.__aexit__(None, None, None)
+        return sem._value
+
+    assert asyncio.run(main()) == 1
+
+
+def test_quota_scheduler_serves_higher_priority_first():
+    async def main():
+        scheduler = bot.QuotaScheduler("test", rate=20, burst=1)
+        await scheduler.acquire_async()  # kosongkan bucket
+        order = []
+
+        async def request(name, level):
+            with bot.priority_lane(level):
+                await scheduler.acquire_async()
+            order.append(name)
+
+        tasks = [asyncio.create_task(request(f"batch{i}", bot.PRIORITY_BATCH)) for i in range(3)]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(request("interactive", bot.PRIORITY_INTERACTIVE)))
+        await asyncio.gather(*tasks)
+        return order
+
+    order = asyncio.run(main())
+    assert order[0] == "interactive"
+    assert order[1:] == ["batch0", "batch1", "batch2"]
+
+
+def test_quota_scheduler_cancelled_waiter_releases_its_turn():
+    async def main():
+        scheduler = bot.QuotaScheduler("test", rate=10, burst=1)
+        await scheduler.acquire_async()
+        cancelled = asyncio.create_task(scheduler.acquire_async())
+        await asyncio.sleep(0.01)
+        cancelled.cancel()
+        await asyncio.gather(cancelled, return_exceptions=True)
+        started = time.monotonic()
+        await asyncio.wait_for(scheduler.acquire_async(), 1)
+        return time.monotonic() - started, scheduler.stats["granted"]
+
+    waited, granted = asyncio.run(main())
+    assert waited < 0.5
+    assert granted == 2
+
+
+def test_quota_scheduler_penalize_pauses_queue():
+    scheduler = bot.QuotaScheduler("test", rate=0, burst=5)
+    delay = scheduler.penalize()
+    assert delay > 0
+    assert not scheduler.try_acquire()
+    scheduler._paused_until = 0.0
+    assert scheduler.try_acquire()
+
+
+def test_quota_scheduler_async_waiter_gives_up_at_deadline():
+    async def main():
+        scheduler = bot.QuotaScheduler("test", rate=1, burst=1)
+        await scheduler.acquire_async()
+        with bot.deadline_scope(0.05):
+            try:
+                await scheduler.acquire_async()
+            except asyncio.TimeoutError:
+                pass
+            else:
+                raise AssertionError("token diberikan setelah tenggat")
+        return scheduler.stats["granted"], [ticket.cancelled for _, _, ticket in scheduler._waiters]
+
+    granted, waiters = asyncio.run(main())
+    assert granted == 1
+    assert all(waiters)
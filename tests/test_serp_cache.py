@@ -0,0 +1,37 @@
+import bot
+
+RESULT = {"organic_results": [{"snippet": "Villa 12 kamar"}]}
+
+
+def put(cache, query):
+    cache.put("google", query, "id", "id", RESULT)
+
+
+def get(cache, query):
+    return cache.get("google", query, "id", "id")
+
+
+def test_hits_do_not_write_until_batch_is_full(tmp_path, monkeypatch):
+    monkeypatch.setattr(bot.SerpApiCache, "TOUCH_BATCH", 3)
+    cache = bot.SerpApiCache(str(tmp_path / "serp.sqlite3"), max_entries=10)
+    for query in "abc":
+        put(cache, query)
+    changes = cache._conn.total_changes
+    assert get(cache, "a") == RESULT
+    assert get(cache, "b") == RESULT
+    assert get(cache, "a") == RESULT
+    assert cache._conn.total_changes == changes
+    assert get(cache, "c") == RESULT  # batch penuh: tiga entri ditulis sekaligus
+    assert cache._conn.total_changes == changes + 3
+    assert cache.stats["hits"] == 4
+
+
+def test_eviction_uses_unwritten_hits(tmp_path):
+    cache = bot.SerpApiCache(str(tmp_path / "serp.sqlite3"), max_entries=2)
+    put(cache, "a")
+    put(cache, "b")
+    assert get(cache, "a") == RESULT  # last_access baru hanya ada di memori
+    put(cache, "c")
+    assert get(cache, "a") == RESULT
+    assert get(cache, "b") is None
+    assert cache.stats["evictions"] == 1
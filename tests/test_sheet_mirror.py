@@ -0,0 +1,81 @@
+import bot
+
+HEADERS = ["Nama", "Desa", "Jumlah Kamar"]
+
+
+def snapshot(rows, previous=None):
+    values = [HEADERS] + rows
+    next_id = max(previous.row_ids, default=0) + 1 if previous else 1
+    row_ids, _ = bot.assign_row_ids(previous, values, next_id)
+    return bot.SheetSnapshot("S", values, row_ids=row_ids)
+
+
+def ids_by_name(snap):
+    return {row[0]: row_id for row, row_id in zip(snap.rows, snap.row_ids)}
+
+
+def test_row_ids_survive_insert_above():
+    before = snapshot([["A", "Sidemen", "3"], ["B", "Sidemen", "5"]])
+    after = snapshot([["New", "Tebola", ""], ["A", "Sidemen", "3"], ["B", "Sidemen", "5"]], before)
+    assert ids_by_name(after)["A"] == ids_by_name(before)["A"]
+    assert ids_by_name(after)["B"] == ids_by_name(before)["B"]
+    assert ids_by_name(after)["New"] not in before.row_ids
+
+
+def test_row_ids_survive_delete():
+    before = snapshot([["A", "Sidemen", "3"], ["B", "Sidemen", "5"], ["C", "Tebola", "2"]])
+    after = snapshot([["A", "Sidemen", "3"], ["C", "Tebola", "2"]], before)
+    assert after.row_ids == [ids_by_name(before)["A"], ids_by_name(before)["C"]]
+
+
+def test_changed_row_keeps_id_by_nama_and_desa():
+    before = snapshot([["A", "Sidemen", ""], ["B", "Sidemen", "5"]])
+    after = snapshot([["B", "Sidemen", "5"], ["A", "Sidemen", "12"]], before)
+    assert ids_by_name(after) == ids_by_name(before)
+
+
+def test_renamed_row_gets_new_id_and_old_id_is_not_reused():
+    before = snapshot([["A", "Sidemen", "3"], ["B", "Sidemen", "5"]])
+    after = snapshot([["A2", "Sidemen", "4"], ["B", "Sidemen", "5"]], before)
+    assert ids_by_name(after)["B"] == ids_by_name(before)["B"]
+    assert ids_by_name(after)["A2"] not in before.row_ids
+
+
+def test_duplicate_rows_get_distinct_ids():
+    before = snapshot([["A", "Sidemen", "3"], ["A", "Sidemen", "3"]])
+    after = snapshot([["A", "Sidemen", "3"], ["A", "Sidemen", "3"], ["A", "Sidemen", "3"]], before)
+    assert len(set(after.row_ids)) == 3
+    assert set(before.row_ids) <= set(after.row_ids)
+
+
+def test_mirror_persists_row_and_desa_ids(tmp_path):
+    path = str(tmp_path / "mirror.sqlite3")
+    mirror = bot.SheetMirror(path)
+    first = mirror.apply(None, "S", [HEADERS, ["A", "Bebandem", ""], ["B", "Sidemen", ""], ["C", "Tebola", ""]])
+
+    restarted = bot.SheetMirror(path)
+    loaded = restarted.load("S")
+    assert loaded.row_ids == first.row_ids
+    assert loaded.desa_ids == first.desa_ids
+
+    # Sidemen hilang dan Abang muncul: ID lama tidak dipakai ulang
+    second = restarted.apply(loaded, "S", [HEADERS, ["D", "Abang", ""], ["A", "Bebandem", ""], ["C", "Tebola", ""]])
+    assert ids_by_name(second)["A"] == ids_by_name(first)["A"]
+    assert ids_by_name(second)["C"] == ids_by_name(first)["C"]
+    assert ids_by_name(second)["D"] not in first.row_ids
+    assert second.desa_ids["Tebola"] == first.desa_ids["Tebola"]
+    assert second.desa_ids["Abang"] not in first.desa_ids.values()
+    assert "Sidemen" not in bot.Navigation().tree(0, second).desa_names.values()
+
+    reloaded = bot.SheetMirror(path).load("S")
+    assert reloaded.rows == second.rows
+    assert reloaded.row_ids == second.row_ids
+
+
+def test_mirror_apply_reports_changes():
+    mirror = bot.SheetMirror("")
+    first = mirror.apply(None, "S", [HEADERS, ["A", "Sidemen", ""], ["B", "Sidemen", ""]])
+    mirror.apply(first, "S", [HEADERS, ["B", "Sidemen", ""], ["A", "Sidemen", "7"]])
+    assert mirror.stats["added"] == 2
+    assert mirror.stats["changed"] == 1
+    assert mirror.stats["moved"] == 1
@@ -0,0 +1,59 @@
+import pytest
+
+import bot
+
+HEADERS = ["Nama", "Desa", "Jumlah Kamar"]
+
+
+class FakeWorksheet:
+    def __init__(self, values):
+        self.values = values
+        self.fail_reads = False
+        self.writes = []
+
+    def get_all_values(self):
+        if self.fail_reads:
+            raise ConnectionError("Sheets tidak bisa dihubungi")
+        return [list(row) for row in self.values]
+
+    def row_values(self, row_number):
+        return list(self.values[row_number - 1]) if row_number <= len(self.values) else []
+
+    def batch_update(self, cells, **kwargs):
+        self.writes.extend(cell["range"] for cell in cells)
+
+
+@pytest.fixture
+def worksheet(monkeypatch):
+    """Worksheet palsu yang sudah tersinkron, lalu disisipi baris di atas dan tidak bisa dibaca ulang."""
+    sheet = FakeWorksheet([HEADERS, ["A", "Sidemen", ""], ["B", "Sidemen", ""]])
+    monkeypatch.setattr(bot, "_sheet_snapshots", {})
+    monkeypatch.setattr(bot, "sheet_mirror", bot.SheetMirror(""))
+    monkeypatch.setitem(bot._worksheets, "S", sheet)
+    monkeypatch.setitem(bot.backend_health, "sheets", bot.BackendHealth("sheets", hedge=False))
+    bot.sync_sheet("S", force=True)
+    sheet.values.insert(1, ["New", "Tebola", ""])
+    sheet.fail_reads = True
+    bot.invalidate_sheet_snapshot("S")
+    return sheet
+
+
+def test_batch_write_does_not_use_stale_row_numbers(worksheet):
+    # Pembacaan tetap boleh memakai mirror lama...
+    assert bot.get_sheet_snapshot("S").row_numbers[("A", "Sidemen")] == 2
+    # ...tetapi penulisan harus gagal daripada menimpa baris yang salah
+    with pytest.raises(ConnectionError):
+        bot.write_sheet_updates("S", {("A", "Sidemen"): {"Jumlah Kamar": "3"}, ("B", "Sidemen"): {"Jumlah Kamar": "5"}})
+    assert worksheet.writes == []
+
+
+def test_single_row_write_does_not_fall_back_to_stale_row_number(worksheet):
+    with pytest.raises(ConnectionError):
+        bot.write_sheet_updates("S", {("A", "Sidemen"): {"Jumlah Kamar": "3"}})
+    assert worksheet.writes == []
+
+
+def test_writes_land_on_shifted_rows_after_sync(worksheet):
+    worksheet.fail_reads = False
+    bot.write_sheet_updates("S", {("A", "Sidemen"): {"Jumlah Kamar": "3"}, ("B", "Sidemen"): {"Jumlah Kamar": "5"}})
+    assert worksheet.writes == ["C3", "C4"]
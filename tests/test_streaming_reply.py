@@ -0,0 +1,42 @@
+import asyncio
+
+from telegram.error import BadRequest
+
+import bot
+
+
+class FakeMessage:
+    def __init__(self, fail_edits=0):
+        self.fail_edits = fail_edits
+        self.edits = []
+        self.replies = []
+
+    async def reply_text(self, text, **kwargs):
+        self.replies.append(text)
+        return self
+
+    async def edit_text(self, text, **kwargs):
+        if self.fail_edits:
+            self.fail_edits -= 1
+            raise BadRequest("Message to edit not found")
+        self.edits.append(text)
+        return self
+
+
+def test_preview_edit_error_stops_previews_and_finish_still_delivers():
+    async def main():
+        source = FakeMessage()
+        reply = bot.StreamingReply(source)
+        await reply.start()
+        source.fail_edits = 1
+        reply._next_edit = 0.0
+        await reply.update("Halo")  # tidak boleh melempar ke stream Gemini
+        assert not reply.previewing
+        reply._next_edit = 0.0
+        await reply.update("Halo dunia")
+        assert source.edits == []
+        await reply.finish("Halo dunia.")
+        return source
+
+    source = asyncio.run(main())
+    assert source.edits == ["Halo dunia."]